@@ -0,0 +1,208 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import event
+
+from config import settings
+from models import MethodicEntry
+from qa_index import normalize_question
+
+
+class AnswerCache:
+    """
+    Кэш ответов Gemini: LRU в памяти с TTL и ограничением по объему,
+    плюс необязательный постоянный уровень в отдельном файле SQLite.
+    Ключ — нормализованный вопрос и хэш контекста, отправленного в модель.
+    Ограничения по числу записей и объему действуют на уровень в памяти,
+    постоянный уровень очищается при инвалидации и по TTL — не при каждой записи,
+    а раз в cleanup_interval секунд (по индексу на expires_at).
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float, db_path: Optional[str] = None,
+                 cleanup_interval: float = 300.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._next_cleanup = 0.0
+
+        self._entries = OrderedDict()  # key -> (answer, expires_at, methodic_ids)
+        self._by_methodic = {}  # methodic_id -> set(key)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.counters = {
+            'hits': 0,
+            'persistent_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS llm_cache_methodics (
+                key TEXT NOT NULL,
+                methodic_id INTEGER NOT NULL,
+                PRIMARY KEY (methodic_id, key)
+            );
+            CREATE INDEX IF NOT EXISTS llm_cache_expires ON llm_cache (expires_at);
+            CREATE INDEX IF NOT EXISTS llm_cache_methodics_key ON llm_cache_methodics (key);
+            ''')
+
+    @staticmethod
+    def make_key(question: str, context: str) -> str:
+        # Контекст содержит исходный текст вопроса — заменяем его нормализованным,
+        # чтобы вопросы, различающиеся регистром и пробелами, давали один ключ
+        question_clean = normalize_question(question)
+        context = context.replace(question, question_clean)
+        context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{question_clean}\x00{context_hash}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                answer, expires_at, _ = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.counters['hits'] += 1
+                    return answer
+                self._remove(key)
+                self.counters['expirations'] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT answer, expires_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    methodic_ids = [
+                        r[0] for r in self._db.execute(
+                            "SELECT methodic_id FROM llm_cache_methodics WHERE key = ?", (key,)
+                        )
+                    ]
+                    self._store(key, row[0], row[1], methodic_ids)
+                    self.counters['persistent_hits'] += 1
+                    return row[0]
+
+            self.counters['misses'] += 1
+            return None
+
+    def put(self, key: str, answer: str, methodic_ids: list):
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._store(key, answer, expires_at, methodic_ids)
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, answer, expires_at) VALUES (?, ?, ?)",
+                    (key, answer, expires_at)
+                )
+                # Связи прежнего ответа с тем же ключом заменяются новыми
+                self._db.execute("DELETE FROM llm_cache_methodics WHERE key = ?", (key,))
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO llm_cache_methodics (key, methodic_id) VALUES (?, ?)",
+                    [(key, methodic_id) for methodic_id in methodic_ids]
+                )
+                if now >= self._next_cleanup:
+                    self._delete_expired(now)
+                    self._next_cleanup = now + self.cleanup_interval
+                self._db.commit()
+
+    def invalidate_methodic(self, methodic_id: int):
+        """Удаляет все ответы, в контекст которых входила методичка"""
+        with self._lock:
+            for key in list(self._by_methodic.get(methodic_id, ())):
+                self._remove(key)
+                self.counters['invalidations'] += 1
+
+            if self._db is not None:
+                keys = [
+                    (row[0],) for row in self._db.execute(
+                        "SELECT key FROM llm_cache_methodics WHERE methodic_id = ?", (methodic_id,)
+                    )
+                ]
+                self._db.executemany("DELETE FROM llm_cache WHERE key = ?", keys)
+                self._db.executemany("DELETE FROM llm_cache_methodics WHERE key = ?", keys)
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['persistent_hits'] + self.counters['misses']
+            hits = self.counters['hits'] + self.counters['persistent_hits']
+            return {
+                **self.counters,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'persistent': self._db is not None
+            }
+
+    # ------------------ ВНУТРЕННЕЕ (под self._lock) ------------------
+    def _delete_expired(self, now: float):
+        """Удаляет просроченные ответы постоянного уровня и их связи (по индексам, без полного просмотра)"""
+        self._db.execute(
+            "DELETE FROM llm_cache_methodics WHERE key IN (SELECT key FROM llm_cache WHERE expires_at <= ?)",
+            (now,)
+        )
+        self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+
+    def _store(self, key: str, answer: str, expires_at: float, methodic_ids: list):
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (answer, expires_at, tuple(methodic_ids))
+        self._bytes += len(answer.encode("utf-8"))
+        for methodic_id in methodic_ids:
+            self._by_methodic.setdefault(methodic_id, set()).add(key)
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.counters['evictions'] += 1
+
+    def _remove(self, key: str):
+        answer, _, methodic_ids = self._entries.pop(key)
+        self._bytes -= len(answer.encode("utf-8"))
+        for methodic_id in methodic_ids:
+            keys = self._by_methodic.get(methodic_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_methodic[methodic_id]
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    max_bytes=settings.LLM_CACHE_MAX_BYTES,
+    ttl=settings.LLM_CACHE_TTL,
+    db_path=settings.LLM_CACHE_DB_PATH,
+    cleanup_interval=settings.LLM_CACHE_CLEANUP_INTERVAL
+)
+
+
+# ------------------ ИНВАЛИДАЦИЯ ПРИ ИЗМЕНЕНИИ МЕТОДИЧЕК ------------------
+@event.listens_for(MethodicEntry, "after_update")
+def _on_methodic_update(mapper, connection, target):
+    answer_cache.invalidate_methodic(target.id)
+
+
+@event.listens_for(MethodicEntry, "after_delete")
+def _on_methodic_delete(mapper, connection, target):
+    answer_cache.invalidate_methodic(target.id)
@@ -0,0 +1,447 @@
+# app/benchmark.py
+"""
+Воспроизводимые замеры производительности поиска и /chat.
+
+Для каждого размера корпуса (N методичек и N пар Q&A) генерируется синтетический
+русскоязычный корпус с фиксированным seed, затем в отдельном процессе выполняются:
+- микробенчмарки функций поиска (search_qa_entries, search_methodic_texts,
+  find_relevant_sentences, search_methodics_with_context);
+- нагрузочный тест /chat: приложение и заглушка Gemini запускаются локально.
+
+Результат — JSON с p50/p95/p99, пропускной способностью и пиковым RSS.
+Два файла результатов сравниваются командой compare.
+
+Запуск:
+    python benchmark.py --sizes 1000 10000 100000 --output bench.json
+    python benchmark.py compare old.json new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+APP_DIR = Path(__file__).resolve().parent
+DEFAULT_WORKDIR = Path(tempfile.gettempdir()) / "methodics-bench"
+
+# Словарь синтетического корпуса: тематические слова и служебные
+TOPIC_WORDS = (
+    "студент", "студенты", "студентов", "обучение", "обучения", "обучении", "преподаватель", "преподавателя",
+    "метод", "методы", "методика", "методики", "технология", "технологии", "образование", "образования",
+    "проект", "проектное", "проектной", "оценка", "оценивания", "наставник", "наставничество", "практика",
+    "практики", "занятие", "занятия", "курс", "курса", "компетенции", "компетенций", "деятельность",
+    "деятельности", "самостоятельная", "самостоятельной", "работа", "работы", "группа", "группе", "семинар",
+    "лекция", "лекции", "контроль", "знания", "знаний", "навыки", "навыков", "мотивация", "мотивации",
+    "дисциплина", "дисциплины", "университет", "вуза", "программа", "программы", "результаты", "результатов",
+    "активного", "интерактивные", "цифровые", "дистанционное", "кейс", "кейсов", "рефлексия", "портфолио",
+    "исследование", "исследования", "педагогический", "педагогической", "учебный", "учебного", "урок",
+)
+FILLER_WORDS = (
+    "и", "в", "на", "с", "по", "для", "как", "что", "это", "также", "при", "от", "к", "не", "или",
+    "которые", "позволяет", "является", "следует", "можно", "необходимо", "важно", "основе", "рамках",
+)
+SYLLABLES = ("ра", "но", "ви", "ка", "то", "ле", "ми", "су", "ден", "пре", "ло", "ти", "ско", "вер", "мат")
+QUESTION_TEMPLATES = (
+    "Как организовать {0} {1} в {2}?",
+    "Какие {0} {1} применяются для {2}?",
+    "Что такое {0} {1}?",
+    "Как повысить {0} {1} {2}?",
+    "Каким образом {0} влияет на {1} {2}?",
+)
+
+
+# ------------------ ГЕНЕРАЦИЯ КОРПУСА ------------------
+class CorpusGenerator:
+    """Синтетические методички и вопросы с частотами слов, близкими к закону Ципфа"""
+
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        rare_words = [
+            "".join(self.rng.choice(SYLLABLES) for _ in range(self.rng.randint(2, 4)))
+            for _ in range(2000)
+        ]
+        # Служебные слова самые частые, затем тематические, затем длинный хвост редких
+        self.words = list(FILLER_WORDS) + list(TOPIC_WORDS) + rare_words
+        self.weights = [1 / (rank + 1) for rank in range(len(self.words))]
+
+    def sentence(self) -> str:
+        words = self.rng.choices(self.words, self.weights, k=self.rng.randint(6, 25))
+        return " ".join(words).capitalize() + self.rng.choice((".", ".", ".", "!", "?"))
+
+    def methodic(self, index: int) -> dict:
+        return {
+            'author': f"{self.rng.choice(('Иванов', 'Петрова', 'Сидоров', 'Кузнецова'))} {chr(0x410 + index % 32)}.",
+            'source_title': " ".join(self.rng.choices(TOPIC_WORDS, k=5)).capitalize(),
+            'methodic_text': " ".join(self.sentence() for _ in range(self.rng.randint(20, 60))),
+            'qa': []
+        }
+
+    def question(self) -> str:
+        return self.rng.choice(QUESTION_TEMPLATES).format(*self.rng.choices(TOPIC_WORDS, k=3))
+
+    def qa(self, methodic_count: int) -> dict:
+        return {
+            'question': self.question(),
+            'answer': " ".join(self.sentence() for _ in range(3)),
+            'methodic_id': self.rng.randint(1, methodic_count)
+        }
+
+    def queries(self, qa_questions: list, count: int) -> list:
+        """Смесь запросов: искаженные вопросы из Q&A (путь через готовые ответы) и новые вопросы"""
+        queries = []
+        for _ in range(count):
+            if qa_questions and self.rng.random() < 0.3:
+                queries.append(self.rng.choice(qa_questions).upper().replace("?", " ?"))
+            else:
+                queries.append(self.question())
+        return queries
+
+
+def generate_corpus(size: int, seed: int, batch_size: int = 1000):
+    """Заполняет пустую БД из DATABASE_URL: size методичек и size пар Q&A"""
+    from database import engine, init_db
+    from ingest import write_batch
+
+    init_db()
+    generator = CorpusGenerator(seed)
+    started = time.perf_counter()
+
+    for kind, count in (('methodic', size), ('qa', size)):
+        for start in range(0, count, batch_size):
+            batch = [
+                (kind, generator.methodic(i) if kind == 'methodic' else generator.qa(size))
+                for i in range(start, min(start + batch_size, count))
+            ]
+            with engine.begin() as connection:
+                write_batch(connection, batch)
+
+    print(f"Корпус {size}: сгенерирован за {time.perf_counter() - started:.1f} с")
+
+
+# ------------------ ИЗМЕРЕНИЯ ------------------
+def latency_summary(latencies: list, elapsed: float) -> dict:
+    values = np.asarray(latencies, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(values, (50, 95, 99)) if values.size else (0.0, 0.0, 0.0)
+    return {
+        'calls': int(values.size),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'throughput_per_sec': round(values.size / elapsed, 2) if elapsed else 0.0
+    }
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS текущего процесса (ru_maxrss: КиБ в Linux, байты в macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def process_peak_rss_mb(pid: int):
+    """Пиковый RSS другого процесса по /proc (только Linux)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+def measure(fn, args_list: list) -> dict:
+    latencies = []
+    started = time.perf_counter()
+    for args in args_list:
+        call_started = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - call_started)
+    return latency_summary(latencies, time.perf_counter() - started)
+
+
+def run_micro(seed: int, query_count: int) -> dict:
+    from database import SessionLocal
+    from models import QAEntry
+    from text_storage import load_texts
+    from search import (
+        search_qa_entries,
+        search_methodic_texts,
+        find_relevant_sentences,
+        search_methodics_with_context
+    )
+
+    db = SessionLocal()
+    try:
+        generator = CorpusGenerator(seed + 1)
+        qa_questions = [row[0] for row in db.query(QAEntry.question).order_by(QAEntry.id).limit(1000)]
+        queries = generator.queries(qa_questions, query_count)
+        texts = [
+            text for text in load_texts(
+                db.connection(), [generator.rng.randint(1, 1000) for _ in range(20)]
+            ).values() if text
+        ]
+        text_pairs = [(texts[i % len(texts)], query) for i, query in enumerate(queries)] if texts else []
+
+        # Прогрев: кэш страниц SQLite и ленивые инициализации
+        for query in queries[:5]:
+            search_methodics_with_context(db, query, 5)
+
+        return {
+            'search_qa_entries': measure(lambda q: search_qa_entries(db, q, 0.6, 5), [(q,) for q in queries]),
+            'search_methodic_texts': measure(lambda q: search_methodic_texts(db, q, 5), [(q,) for q in queries]),
+            'find_relevant_sentences': measure(find_relevant_sentences, text_pairs),
+            'search_methodics_with_context': measure(
+                lambda q: search_methodics_with_context(db, q, 5), [(q,) for q in queries]
+            ),
+        }
+    finally:
+        db.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Сервис не запустился: {url}")
+
+
+async def load_test(base_url: str, queries: list, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    queue = iter(queries)
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for question in queue:
+            started = time.perf_counter()
+            try:
+                resp = await client.post("/chat", json={"question": question, "max_results": 5})
+                if resp.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {**latency_summary(latencies, elapsed), 'errors': errors, 'concurrency': concurrency}
+
+
+def run_e2e(seed: int, request_count: int, concurrency: int, stub_delay: float) -> dict:
+    stub_port, app_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        'GEMINI_API_URL': f"http://127.0.0.1:{stub_port}/v1beta/models/stub:generateContent",
+        'GEMINI_API_KEY': "bench",
+        # Кэш ответов отключен, чтобы каждый запрос проходил весь путь
+        'LLM_CACHE_ENABLED': "false",
+    }
+    env.pop('LLM_CACHE_DB_PATH', None)
+
+    stub = subprocess.Popen(
+        [sys.executable, "gemini_stub.py", "--port", str(stub_port), "--delay", str(stub_delay)],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        base_url = f"http://127.0.0.1:{app_port}"
+        wait_for(f"http://127.0.0.1:{stub_port}/stats")
+        wait_for(f"{base_url}/")
+
+        from database import SessionLocal
+        from models import QAEntry
+        db = SessionLocal()
+        try:
+            qa_questions = [row[0] for row in db.query(QAEntry.question).order_by(QAEntry.id).limit(1000)]
+        finally:
+            db.close()
+        queries = CorpusGenerator(seed + 2).queries(qa_questions, request_count)
+
+        asyncio.run(load_test(base_url, queries[:concurrency], concurrency))  # прогрев
+        result = asyncio.run(load_test(base_url, queries, concurrency))
+        result['stub_delay_sec'] = stub_delay
+        result['app_peak_rss_mb'] = process_peak_rss_mb(app.pid)
+        return result
+    finally:
+        for process in (app, stub):
+            process.terminate()
+            process.wait(timeout=10)
+
+
+# ------------------ ОРКЕСТРАЦИЯ ------------------
+def corpus_path(workdir: Path, size: int, seed: int) -> Path:
+    return workdir / f"corpus_{size}_{seed}.db"
+
+
+def child_env(db_path: Path) -> dict:
+    return {
+        **os.environ,
+        'DATABASE_URL': f"sqlite:///{db_path}",
+        'GEMINI_API_URL': os.environ.get('GEMINI_API_URL', "http://127.0.0.1:9/unused"),
+        'GEMINI_API_KEY': os.environ.get('GEMINI_API_KEY', "bench"),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(args, size: int) -> dict:
+    """Генерация (если корпуса еще нет) и замеры — каждый этап в отдельном процессе"""
+    db_path = corpus_path(args.workdir, size, args.seed)
+    env = child_env(db_path)
+    script = str(Path(__file__).resolve())
+
+    if not db_path.exists():
+        tmp_path = db_path.with_suffix(".tmp.db")
+        tmp_path.unlink(missing_ok=True)
+        subprocess.run(
+            [sys.executable, script, "generate", "--size", str(size), "--seed", str(args.seed)],
+            cwd=APP_DIR, env=child_env(tmp_path), check=True
+        )
+        tmp_path.rename(db_path)
+
+    result_path = args.workdir / f"result_{size}.json"
+    subprocess.run(
+        [
+            sys.executable, script, "measure",
+            "--seed", str(args.seed),
+            "--queries", str(args.queries),
+            "--requests", str(args.requests),
+            "--concurrency", str(args.concurrency),
+            "--stub-delay", str(args.stub_delay),
+            "--result", str(result_path),
+        ] + (["--skip-e2e"] if args.skip_e2e else []),
+        cwd=APP_DIR, env=env, check=True
+    )
+    result = json.loads(result_path.read_text(encoding="utf-8"))
+    return {'size': size, **result}
+
+
+def compare(old_path: str, new_path: str):
+    """Печатает изменение p50/p95/p99 и пропускной способности между двумя прогонами"""
+    old = {r['size']: r for r in json.loads(Path(old_path).read_text(encoding="utf-8"))['results']}
+    new = {r['size']: r for r in json.loads(Path(new_path).read_text(encoding="utf-8"))['results']}
+
+    for size in sorted(old.keys() & new.keys()):
+        print(f"\nРазмер корпуса: {size}")
+        benches = {**old[size].get('micro', {}), 'e2e /chat': old[size].get('e2e')}
+        for name, old_stats in benches.items():
+            new_stats = new[size]['micro'].get(name) if name != 'e2e /chat' else new[size].get('e2e')
+            if not old_stats or not new_stats:
+                continue
+            parts = []
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_per_sec'):
+                before, after = old_stats[metric], new_stats[metric]
+                change = (after - before) / before * 100 if before else 0.0
+                parts.append(f"{metric} {before:g} -> {after:g} ({change:+.1f}%)")
+            print(f"  {name}: " + ", ".join(parts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки поиска и /chat на синтетическом корпусе")
+    subparsers = parser.add_subparsers(dest="command")
+
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--queries", type=int, default=200, help="Запросов на микробенчмарк")
+    parser.add_argument("--requests", type=int, default=300, help="Запросов в нагрузочном тесте")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--stub-delay", type=float, default=0.05, help="Задержка заглушки Gemini, с")
+    parser.add_argument("--skip-e2e", action="store_true")
+    parser.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR, help="Каталог для корпусов")
+    parser.add_argument("--output", default="bench.json")
+
+    generate_parser = subparsers.add_parser("generate", help="(внутренняя) сгенерировать корпус в DATABASE_URL")
+    generate_parser.add_argument("--size", type=int, required=True)
+    generate_parser.add_argument("--seed", type=int, required=True)
+
+    measure_parser = subparsers.add_parser("measure", help="(внутренняя) замеры на корпусе из DATABASE_URL")
+    measure_parser.add_argument("--seed", type=int, required=True)
+    measure_parser.add_argument("--queries", type=int, required=True)
+    measure_parser.add_argument("--requests", type=int, required=True)
+    measure_parser.add_argument("--concurrency", type=int, required=True)
+    measure_parser.add_argument("--stub-delay", type=float, required=True)
+    measure_parser.add_argument("--skip-e2e", action="store_true")
+    measure_parser.add_argument("--result", required=True)
+
+    compare_parser = subparsers.add_parser("compare", help="Сравнить два файла результатов")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        generate_corpus(args.size, args.seed)
+        return 0
+
+    if args.command == "measure":
+        result = {'micro': run_micro(args.seed, args.queries)}
+        result['search_peak_rss_mb'] = peak_rss_mb()
+        if not args.skip_e2e:
+            result['e2e'] = run_e2e(args.seed, args.requests, args.concurrency, args.stub_delay)
+        Path(args.result).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        return 0
+
+    if args.command == "compare":
+        compare(args.old, args.new)
+        return 0
+
+    args.workdir.mkdir(parents=True, exist_ok=True)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'queries': args.queries,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+        },
+        'results': []
+    }
+    for size in args.sizes:
+        print(f"\n=== Корпус: {size} методичек и {size} Q&A ===")
+        report['results'].append(run_size(args, size))
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"\nРезультаты сохранены в {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -6,6 +8,109 @@ class Settings(BaseSettings):
     GEMINI_API_KEY: str
 
     DATABASE_URL: str = "sqlite:///./data/methodics.db"
+    # Для асинхронного движка; если не задан, для SQLite выводится из DATABASE_URL (aiosqlite)
+    ASYNC_DATABASE_URL: Optional[str] = None
+
+    # PRAGMA, применяемые к каждому соединению SQLite
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_CACHE_SIZE: int = -64000  # отрицательное значение — в КиБ (~64 МБ)
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+
+    # HTTP-клиент Gemini: общий пул keep-alive соединений
+    GEMINI_MAX_CONNECTIONS: int = 20
+    GEMINI_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    GEMINI_KEEPALIVE_EXPIRY: float = 30.0
+    GEMINI_CONNECT_TIMEOUT: float = 5.0
+    GEMINI_READ_TIMEOUT: float = 30.0
+    GEMINI_POOL_TIMEOUT: float = 5.0
+    GEMINI_HTTP2: bool = False  # требует пакет h2
+
+    # Защита от сбоев Gemini: лимит одновременных вызовов (ожидание слота не дольше GEMINI_QUEUE_TIMEOUT),
+    # автомат, размыкающийся после GEMINI_BREAKER_FAILURES отказов подряд на GEMINI_BREAKER_RESET_SECONDS,
+    # и повторы с паузой backoff * 2^n со случайным разбросом
+    GEMINI_MAX_CONCURRENCY: int = 16
+    GEMINI_QUEUE_TIMEOUT: float = 2.0
+    GEMINI_BREAKER_FAILURES: int = 5
+    GEMINI_BREAKER_RESET_SECONDS: float = 30.0
+    GEMINI_RETRIES: int = 0
+    GEMINI_RETRY_BACKOFF: float = 0.2
+    GEMINI_RETRY_BACKOFF_MAX: float = 2.0
+    # Бюджет времени /chat целиком; вызов Gemini, не уложившийся в него, заменяется ответом из фрагментов
+    CHAT_DEADLINE_SECONDS: float = 15.0
+    # Попытка не начинается, если до дедлайна осталось меньше
+    GEMINI_MIN_ATTEMPT_SECONDS: float = 0.5
+
+    # Кэш ответов Gemini (ключ — вопрос + хэш контекста)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 1000
+    LLM_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    LLM_CACHE_TTL: float = 24 * 60 * 60
+    LLM_CACHE_DB_PATH: Optional[str] = None  # например ./data/llm_cache.db
+    # Удаление просроченных записей постоянного уровня не чаще раза в столько секунд
+    LLM_CACHE_CLEANUP_INTERVAL: float = 300.0
+
+    # Индекс Q&A: на точное сравнение идут вопросы подходящей длины с коэффициентом Дайса
+    # по триграммам >= threshold * QA_NGRAM_DICE_FACTOR. При 0.5 на синтетическом корпусе
+    # из 5000 вопросов кандидатов в 5 раз меньше, чем при отборе только по длине, найдено 99.2%
+    # вопросов выше порога, а лучшие 5 совпали с полным перебором на всех запросах.
+    # 0 — отбор только по длине, без потерь
+    QA_NGRAM_DICE_FACTOR: float = 0.5
+
+    # Режим поиска методичек: keyword (FTS5), semantic (индекс LSA) или hybrid (объединение рангов).
+    # В semantic/hybrid при отсутствии похожих вопросов Q&A ищутся и по семантическому индексу
+    RETRIEVAL_MODE: str = "keyword"
+    SEMANTIC_INDEX_DIR: str = "./data/semantic_index"
+    SEMANTIC_DIMENSIONS: int = 128
+    SEMANTIC_PASSAGE_SENTENCES: int = 5
+    SEMANTIC_MAX_TERMS: int = 50000
+    SEMANTIC_NPROBE: int = 8  # сколько кластеров IVF просматривается при поиске
+    SEMANTIC_QA_THRESHOLD: float = 0.75  # минимальный косинус для готового ответа Q&A
+
+    # Бюджет контекста промпта Gemini в токенах (оценка, см. context_packer)
+    PROMPT_CONTEXT_TOKENS: int = 1500
+
+    # Заголовок Server-Timing с длительностями этапов в каждом ответе
+    SERVER_TIMING_ENABLED: bool = False
+
+    # Профилирование SQL: заголовок X-DB-Profile и статистика запросов в логе
+    SQL_PROFILING_ENABLED: bool = False
+
+    # Сжатое хранение текстов методичек (zlib по частям); существующие строки — python text_storage.py compress
+    TEXT_COMPRESSION_ENABLED: bool = True
+    TEXT_CHUNK_CHARS: int = 16384
+    TEXT_COMPRESSION_LEVEL: int = 6
+
+    # Размер порции при потоковой отдаче полного текста методички
+    METHODIC_TEXT_CHUNK_BYTES: int = 64 * 1024
+
+    # Кэш ответов /search, /qa/search и /methodics/{id} с ETag по поколению корпуса (см. response_cache.py)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 2048
+    RESPONSE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    RESPONSE_CACHE_CONTROL: str = "public, no-cache"  # клиент и CDN хранят ответ, но перепроверяют по ETag
+    CORPUS_GENERATION_CHECK_INTERVAL: float = 1.0
+
+    # Обслуживание чтения из копии базы в памяти (см. corpus_snapshot.py): снимок перестраивается
+    # в фоне после изменений базы на диске (проверка раз в SNAPSHOT_CHECK_INTERVAL секунд),
+    # старый закрывается после закрытия всех открытых на нем сессий (если они держат его дольше
+    # SNAPSHOT_RETIRE_SECONDS, в лог пишется предупреждение)
+    SERVE_FROM_MEMORY: bool = False
+    SNAPSHOT_CHECK_INTERVAL: float = 5.0
+    SNAPSHOT_RETIRE_SECONDS: float = 60.0
+    SNAPSHOT_POOL_SIZE: int = 10
+
+    # Параллельная оценка предложений и кандидатов Q&A (см. parallel_scoring.py):
+    # off, thread, process или auto; SEARCH_WORKERS=0 — по числу ядер
+    SEARCH_WORKERS_MODE: str = "off"
+    SEARCH_WORKERS: int = 0
+    SEARCH_PARALLEL_MIN_SENTENCES: int = 20000
+    SEARCH_PARALLEL_MIN_QA: int = 2000
+
+    # Пакетный /chat/batch
+    BATCH_MAX_QUESTIONS: int = 10000
+    BATCH_LLM_CONCURRENCY: int = 8
 
     class Config:
         env_file = ".env"
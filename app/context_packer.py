@@ -0,0 +1,187 @@
+# app/context_packer.py
+"""
+Сборка контекста для Gemini в пределах бюджета токенов.
+
+Фрагменты (пары Q&A и релевантные предложения методичек) получают оценку,
+почти одинаковые предложения из пересекающихся методичек отбрасываются,
+а в бюджет PROMPT_CONTEXT_TOKENS жадно набираются фрагменты с наибольшей оценкой.
+Выбранные предложения выводятся сгруппированными по методичкам в исходном порядке,
+номера методичек совпадают с порядком источников в ответе.
+
+Токены считаются приближенно (токенизатор Gemini недоступен локально):
+слово — один токен на каждые TOKEN_CHARS символов, знак препинания — один токен.
+"""
+import math
+import re
+from dataclasses import dataclass
+
+from config import settings
+from text_normalization import words, terms, normalize_query
+
+TOKEN_CHARS = 4
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+# Предложения считаются дублями, если совпадает доля шинглов из трех слов не ниже этого порога
+DUPLICATE_SIMILARITY = 0.8
+
+# Длинные предложения обрезаются, чтобы одно не занимало весь бюджет
+MAX_SENTENCE_CHARS = 300
+
+QA_HEADER = "=== НАЙДЕННЫЕ ГОТОВЫЕ ОТВЕТЫ ==="
+METHODICS_HEADER = "=== РЕЛЕВАНТНЫЕ ФРАГМЕНТЫ ИЗ МЕТОДИЧЕК ==="
+
+
+def estimate_tokens(text: str) -> int:
+    return sum(math.ceil(len(piece) / TOKEN_CHARS) for piece in TOKEN_PATTERN.findall(text or ""))
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    fragments: int = 0
+    candidates: int = 0
+    duplicates: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"Контекст: ~{self.tokens} токенов, фрагментов {self.fragments} из {self.candidates}, "
+            f"дублей отброшено {self.duplicates}"
+        )
+
+
+@dataclass
+class Fragment:
+    score: float
+    kind: str  # qa или sentence
+    group: int  # номер Q&A или методички (с 0)
+    order: int  # порядок внутри группы
+    text: str
+    tokens: int = 0
+
+
+# ------------------ ДЕДУПЛИКАЦИЯ ------------------
+def shingles(text: str) -> set:
+    text_words = words(text)
+    if len(text_words) < 3:
+        return {" ".join(text_words)}
+    return {" ".join(text_words[i:i + 3]) for i in range(len(text_words) - 2)}
+
+
+def is_near_duplicate(candidate: set, accepted: list) -> bool:
+    for other in accepted:
+        overlap = len(candidate & other)
+        if overlap and overlap / min(len(candidate), len(other)) >= DUPLICATE_SIMILARITY:
+            return True
+    return False
+
+
+# ------------------ ОЦЕНКА ФРАГМЕНТОВ ------------------
+def clean_sentence(sentence: str) -> str:
+    sentence = re.sub(r'\s+', ' ', sentence).strip()
+    if len(sentence) > MAX_SENTENCE_CHARS:
+        sentence = sentence[:MAX_SENTENCE_CHARS] + "..."
+    return sentence
+
+
+def question_terms(question: str) -> set:
+    return set(normalize_query(question).keywords)
+
+
+def sentence_score(sentence: str, keywords: set, methodic_rank: int, position: int) -> float:
+    """Доля слов вопроса в предложении плюс небольшие бонусы за ранг методички и порядок предложения"""
+    coverage = len(keywords.intersection(terms(sentence))) / len(keywords) if keywords else 0.0
+    return coverage + 0.3 / (1 + methodic_rank) + 0.1 / (1 + position)
+
+
+def collect_fragments(search_results: dict, question: str) -> list:
+    keywords = question_terms(question)
+    fragments = []
+    for i, qa in enumerate(search_results['qa_results']):
+        lines = [f"ВОПРОС {i + 1}: {qa.question}", f"ОТВЕТ {i + 1}: {qa.answer}"]
+        if qa.methodic:
+            lines.append(f"(Из методички: {qa.methodic.source_title})")
+        # Готовые ответы важнее отдельных предложений
+        fragments.append(Fragment(2.0 + 1.0 / (1 + i), 'qa', i, 0, "\n".join(lines)))
+
+    for rank, ctx in enumerate(search_results['methodic_contexts']):
+        for position, sentence in enumerate(ctx['relevant_sentences']):
+            text = clean_sentence(sentence)
+            if text:
+                score = sentence_score(text, keywords, rank, position)
+                fragments.append(Fragment(score, 'sentence', rank, position, text))
+    return fragments
+
+
+# ------------------ СБОРКА ------------------
+def methodic_header(number: int, methodic) -> str:
+    header = f"МЕТОДИЧКА {number}: {methodic.source_title or 'Без названия'}"
+    if methodic.author:
+        header += f" ({methodic.author})"
+    return header
+
+
+def render(search_results: dict, selected: list) -> str:
+    qa_fragments = sorted((f for f in selected if f.kind == 'qa'), key=lambda f: f.group)
+    by_methodic = {}
+    for fragment in selected:
+        if fragment.kind == 'sentence':
+            by_methodic.setdefault(fragment.group, []).append(fragment)
+
+    parts = []
+    if qa_fragments:
+        parts.append(QA_HEADER)
+        parts.extend(fragment.text for fragment in qa_fragments)
+    if by_methodic:
+        parts.append(METHODICS_HEADER)
+        for group in sorted(by_methodic):
+            parts.append(methodic_header(group + 1, search_results['methodic_contexts'][group]['methodic']))
+            sentences = sorted(by_methodic[group], key=lambda f: f.order)
+            parts.extend(f"  {j}. {fragment.text}" for j, fragment in enumerate(sentences, 1))
+    return "\n".join(parts)
+
+
+def pack_context(search_results: dict, question: str, budget: int = None) -> PackedContext:
+    """
+    Контекст для промпта не длиннее budget токенов (по умолчанию PROMPT_CONTEXT_TOKENS).
+    Заголовки методичек учитываются в бюджете при выборе их первого предложения.
+    """
+    budget = budget or settings.PROMPT_CONTEXT_TOKENS
+    fragments = collect_fragments(search_results, question)
+    if not fragments:
+        return PackedContext("По вашему запросу ничего не найдено.", 0)
+
+    fragments.sort(key=lambda f: -f.score)
+    accepted_shingles = []
+    unique = []
+    for fragment in fragments:
+        fragment_shingles = shingles(fragment.text)
+        if fragment.kind == 'sentence' and is_near_duplicate(fragment_shingles, accepted_shingles):
+            continue
+        accepted_shingles.append(fragment_shingles)
+        fragment.tokens = estimate_tokens(fragment.text) + 1
+        unique.append(fragment)
+
+    used = estimate_tokens(QA_HEADER) + estimate_tokens(METHODICS_HEADER)
+    selected = []
+    opened = set()
+    for fragment in unique:
+        cost = fragment.tokens
+        if fragment.kind == 'sentence' and fragment.group not in opened:
+            methodic = search_results['methodic_contexts'][fragment.group]['methodic']
+            cost += estimate_tokens(methodic_header(fragment.group + 1, methodic)) + 1
+        if used + cost > budget:
+            continue
+        used += cost
+        selected.append(fragment)
+        if fragment.kind == 'sentence':
+            opened.add(fragment.group)
+
+    text = render(search_results, selected)
+    return PackedContext(
+        text=text,
+        tokens=estimate_tokens(text),
+        fragments=len(selected),
+        candidates=len(fragments),
+        duplicates=len(fragments) - len(unique)
+    )
@@ -0,0 +1,69 @@
+# app/corpus_generation.py
+"""
+Поколение корпуса — счетчик в таблице corpus_generation, который увеличивается
+в той же транзакции, что и любая запись в methodic_entries или qa_entries: это делают триггеры SQLite,
+поэтому учитываются и запись через ORM, и массовая загрузка, и прямой SQL.
+Дозаполнение индексов при старте (init_db) меняет результаты поиска без записи в эти таблицы
+и увеличивает счетчик явным вызовом bump_generation.
+
+Номер одинаков во всех процессах, поэтому подходит для ETag и ключей кэша результатов.
+Процесс перечитывает его не чаще раза в CORPUS_GENERATION_CHECK_INTERVAL секунд;
+при чтении из снимка в памяти используется поколение, с которого снят снимок.
+"""
+import time
+
+from sqlalchemy import select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import settings
+from database import async_engine
+from models import MethodicEntry, QAEntry, CorpusGeneration
+import corpus_snapshot
+
+GENERATION = CorpusGeneration.__table__
+
+_cached = {'value': None, 'checked_at': 0.0}
+
+WATCHED_TABLES = (MethodicEntry.__tablename__, QAEntry.__tablename__)
+
+
+def generation_triggers() -> list:
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_{operation.lower()}_generation "
+        f"AFTER {operation} ON {table} "
+        f"BEGIN UPDATE corpus_generation SET value = value + 1 WHERE id = 1; END"
+        for table in WATCHED_TABLES
+        for operation in ("INSERT", "UPDATE", "DELETE")
+    ]
+
+
+def bump_generation(connection):
+    connection.execute(update(GENERATION).where(GENERATION.c.id == 1).values(value=GENERATION.c.value + 1))
+
+
+def sync_corpus_generation(db) -> int:
+    """Создает строку счетчика и триггеры, если их нет. Возвращает текущее поколение."""
+    connection = db.connection()
+    connection.execute(sqlite_insert(GENERATION).values(id=1, value=0).on_conflict_do_nothing())
+    for statement in generation_triggers():
+        connection.execute(text(statement))
+    db.commit()
+    return read_generation(db.connection())
+
+
+def read_generation(connection) -> int:
+    return connection.execute(select(GENERATION.c.value).where(GENERATION.c.id == 1)).scalar() or 0
+
+
+async def current_generation() -> int:
+    snapshot = corpus_snapshot.current_snapshot()
+    if snapshot is not None:
+        return snapshot.corpus_generation
+
+    now = time.monotonic()
+    if _cached['value'] is None or now - _cached['checked_at'] >= settings.CORPUS_GENERATION_CHECK_INTERVAL:
+        async with async_engine.connect() as connection:
+            _cached['value'] = await connection.run_sync(read_generation)
+        _cached['checked_at'] = now
+    return _cached['value']
+
@@ -0,0 +1,228 @@
+# app/corpus_snapshot.py
+"""
+Снимок корпуса в памяти для режима только чтения (SERVE_FROM_MEMORY=true).
+
+При старте база на диске целиком копируется (SQLite backup API) в именованную in-memory базу
+с общим кэшем: все соединения пула читают одну копию, запросы не обращаются к диску
+и не ждут блокировок пишущей транзакции. Копия содержит и производные таблицы
+(FTS5, предложения, сжатые тексты), поэтому поиск работает без изменений.
+
+Фоновая задача раз в SNAPSHOT_CHECK_INTERVAL секунд проверяет PRAGMA data_version исходной базы;
+после записи в нее новый снимок строится в отдельном потоке и подменяет текущий одним присваиванием.
+Запросы, начатые на старом снимке, дочитывают его: снимок считает открытые на нем сессии,
+и старый движок закрывается только после закрытия последней (например, медленной отдачи
+/methodics/{id}/text по Range). Если сессии не закрываются дольше SNAPSHOT_RETIRE_SECONDS,
+в лог пишется предупреждение, и закрытие продолжает ждать.
+"""
+import asyncio
+import itertools
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import settings
+from database import engine
+
+_generations = itertools.count(1)
+_current: Optional["CorpusSnapshot"] = None
+_watcher_task: Optional[asyncio.Task] = None
+
+
+class SnapshotSession(AsyncSession):
+    """Сессия к снимку корпуса: держит снимок открытым, пока сама не закрыта"""
+
+    def __init__(self, *args, snapshot: "CorpusSnapshot", **kwargs):
+        super().__init__(*args, **kwargs)
+        self._snapshot = snapshot
+        snapshot.acquire()
+
+    async def close(self):
+        try:
+            await super().close()
+        finally:
+            # close вызывается и из get_db, и из async with — снимок освобождается один раз
+            snapshot, self._snapshot = self._snapshot, None
+            if snapshot is not None:
+                snapshot.release()
+
+
+@dataclass
+class CorpusSnapshot:
+    generation: int
+    uri: str
+    anchor: sqlite3.Connection  # держит in-memory базу, пока снимок используется
+    async_engine: AsyncEngine
+    source_version: int
+    corpus_generation: int
+    size_bytes: int
+    build_seconds: float
+    loaded_at: float
+    sessions: int = 0  # открытые сессии
+    idle: asyncio.Event = field(default_factory=asyncio.Event)  # установлен, когда сессий нет
+    session_factory: async_sessionmaker = field(init=False)
+
+    def __post_init__(self):
+        self.session_factory = async_sessionmaker(
+            self.async_engine, class_=SnapshotSession, autoflush=False, expire_on_commit=False, snapshot=self
+        )
+        self.idle.set()
+
+    def acquire(self):
+        self.sessions += 1
+        self.idle.clear()
+
+    def release(self):
+        self.sessions -= 1
+        if self.sessions == 0:
+            self.idle.set()
+
+    def info(self) -> dict:
+        return {
+            'generation': self.generation,
+            'corpus_generation': self.corpus_generation,
+            'size_bytes': self.size_bytes,
+            'build_seconds': round(self.build_seconds, 3),
+            'age_seconds': round(time.time() - self.loaded_at, 1)
+        }
+
+    async def close(self):
+        await self.async_engine.dispose()
+        self.anchor.close()
+
+
+def source_path() -> Optional[str]:
+    """Файл базы SQLite, из которого строится снимок (None — снимок невозможен)"""
+    if engine.dialect.name != "sqlite":
+        return None
+    database = engine.url.database
+    return database if database and database != ":memory:" else None
+
+
+def data_version(connection: sqlite3.Connection) -> int:
+    """Меняется после каждого коммита в базу из другого соединения"""
+    return connection.execute("PRAGMA data_version").fetchone()[0]
+
+
+def _read_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def build_snapshot(path: str, version: int = 0) -> CorpusSnapshot:
+    """Копирует базу в новую in-memory базу и создает для нее асинхронный движок"""
+    started = time.perf_counter()
+    generation = next(_generations)
+    uri = f"file:corpus_snapshot_{generation}?mode=memory&cache=shared"
+
+    anchor = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        source.backup(anchor)
+    finally:
+        source.close()
+    generation_row = anchor.execute("SELECT value FROM corpus_generation WHERE id = 1").fetchone()
+    page_count = anchor.execute("PRAGMA page_count").fetchone()[0]
+    page_size = anchor.execute("PRAGMA page_size").fetchone()[0]
+
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{uri}&uri=true",
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.SNAPSHOT_POOL_SIZE,
+        max_overflow=settings.SNAPSHOT_POOL_SIZE
+    )
+    event.listen(async_engine.sync_engine, "connect", _read_only)
+
+    return CorpusSnapshot(
+        generation=generation,
+        uri=uri,
+        anchor=anchor,
+        async_engine=async_engine,
+        source_version=version,
+        corpus_generation=generation_row[0] if generation_row else 0,
+        size_bytes=page_count * page_size,
+        build_seconds=time.perf_counter() - started,
+        loaded_at=time.time()
+    )
+
+
+def current_snapshot() -> Optional[CorpusSnapshot]:
+    return _current
+
+
+def snapshot_status() -> dict:
+    if _current is None:
+        return {'enabled': settings.SERVE_FROM_MEMORY, 'active': False}
+    return {'enabled': settings.SERVE_FROM_MEMORY, 'active': True, **_current.info()}
+
+
+def swap(snapshot: CorpusSnapshot) -> Optional[CorpusSnapshot]:
+    """Делает снимок текущим; возвращает предыдущий"""
+    global _current
+    previous, _current = _current, snapshot
+    print(
+        f"Снимок корпуса #{snapshot.generation}: {snapshot.size_bytes / 1024 / 1024:.1f} МБ "
+        f"за {snapshot.build_seconds:.2f} с"
+    )
+    return previous
+
+
+async def retire(snapshot: CorpusSnapshot):
+    """Закрывает старый снимок, когда закрыты все открытые на нем сессии"""
+    while snapshot.sessions:
+        try:
+            await asyncio.wait_for(snapshot.idle.wait(), settings.SNAPSHOT_RETIRE_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"Снимок корпуса #{snapshot.generation}: открыто сессий {snapshot.sessions}, закрытие отложено")
+    await snapshot.close()
+
+
+async def watch_source(path: str, watcher: sqlite3.Connection):
+    """Перестраивает снимок после изменений исходной базы"""
+    try:
+        while True:
+            await asyncio.sleep(settings.SNAPSHOT_CHECK_INTERVAL)
+            try:
+                version = data_version(watcher)
+                if version == _current.source_version:
+                    continue
+                snapshot = await asyncio.to_thread(build_snapshot, path, version)
+            except Exception as e:
+                print(f"Не удалось обновить снимок корпуса, продолжаем со старым: {e}")
+                continue
+            asyncio.ensure_future(retire(swap(snapshot)))
+    finally:
+        watcher.close()
+
+
+async def start() -> bool:
+    """
+    Строит первый снимок в отдельном потоке и запускает фоновое обновление.
+    До подмены запросы читают базу на диске. Возвращает False, если снимок невозможен.
+    """
+    global _watcher_task
+    path = source_path()
+    if path is None:
+        print("⚠️ SERVE_FROM_MEMORY поддерживается только для файловой базы SQLite, снимок не создан")
+        return False
+
+    watcher = sqlite3.connect(path, check_same_thread=False)
+    version = data_version(watcher)
+    swap(await asyncio.to_thread(build_snapshot, path, version))
+    _watcher_task = asyncio.ensure_future(watch_source(path, watcher))
+    return True
+
+
+async def stop():
+    global _current, _watcher_task
+    if _watcher_task is not None:
+        _watcher_task.cancel()
+        _watcher_task = None
+    if _current is not None:
+        await _current.close()
+        _current = None
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, Session
 from config import settings
 
@@ -9,15 +10,105 @@ engine = create_engine(
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db():
-    db = SessionLocal()
+
+def async_database_url() -> str:
+    """URL для асинхронного движка: явно заданный или sqlite:// -> sqlite+aiosqlite://"""
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    if settings.DATABASE_URL.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + settings.DATABASE_URL[len("sqlite:"):]
+    return settings.DATABASE_URL
+
+
+# Асинхронный движок для обработчиков FastAPI: запросы не блокируют event loop
+async_engine = create_async_engine(async_database_url())
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+# ------------------ SQLITE PRAGMAS ------------------
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Настройки SQLite для каждого нового соединения.
+    WAL позволяет читателям не ждать друг друга и пишущую транзакцию.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+if async_engine.dialect.name == "sqlite":
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+
+
+def read_session() -> AsyncSession:
+    """
+    Сессия для обработчиков запросов: к снимку корпуса в памяти, если он загружен
+    (SERVE_FROM_MEMORY, см. corpus_snapshot.py), иначе к базе на диске.
+    """
+    from corpus_snapshot import current_snapshot
+    snapshot = current_snapshot()
+    return snapshot.session_factory() if snapshot else AsyncSessionLocal()
+
+
+async def get_db():
+    db = read_session()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
 
 def init_db():
     """Инициализация базы данных при старте"""
     from models import Base
+    from qa_index import sync_qa_index
+    from fts_index import sync_fts_index
+    from sentence_store import sync_sentence_store, sync_sentence_terms
+    from text_storage import sync_text_storage
+    from corpus_generation import sync_corpus_generation, bump_generation
     Base.metadata.create_all(bind=engine)
-    print("✅ База данных инициализирована")
\ No newline at end of file
+    # create_all создает индексы только вместе с таблицей: добавленные позже создаются здесь
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        # Сначала счетчик поколения и его триггеры: дальнейшие записи в корпус уже учитываются
+        sync_corpus_generation(db)
+        changed = 0
+        indexed = sync_qa_index(db)
+        if indexed:
+            print(f"Триграммный индекс Q&A: проиндексировано {indexed} вопросов")
+        changed += indexed
+        indexed = sync_fts_index(db)
+        if indexed:
+            print(f"Полнотекстовый индекс: проиндексировано {indexed} методичек")
+        changed += indexed
+        updated = sync_sentence_terms(db)
+        if updated:
+            print(f"Термины предложений: нормализовано {updated} предложений")
+        changed += updated
+        indexed = sync_sentence_store(db)
+        if indexed:
+            print(f"Хранилище предложений: сегментировано {indexed} методичек")
+        changed += indexed
+        removed = sync_text_storage(db)
+        if removed:
+            print(f"Сжатые тексты: удалено {removed} частей удаленных методичек")
+        changed += removed
+        if changed:
+            # Дозаполненные индексы меняют результаты поиска: ETag прежнего поколения устаревают
+            bump_generation(db.connection())
+            db.commit()
+        print(f"Поколение корпуса: {sync_corpus_generation(db)}")
+    finally:
+        db.close()
+    print("✅ База данных инициализирована")
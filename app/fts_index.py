@@ -0,0 +1,214 @@
+from sqlalchemy import event, inspect, literal_column, select, table, text
+from sqlalchemy.orm import Session
+
+from models import MethodicEntry
+from text_storage import load_text, load_texts, current_text
+from text_normalization import fold_russian, normalize_query
+
+FTS_TABLE = "methodic_fts"
+
+# Веса колонок для bm25: author, source_title, methodic_text
+BM25_WEIGHTS = (2.0, 5.0, 1.0)
+
+CREATE_FTS_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    author, source_title, methodic_text,
+    content='',
+    prefix='2 3 4',
+    tokenize="unicode61 remove_diacritics 2"
+)
+"""
+
+
+def _fts_values(methodic_id: int, author, source_title, methodic_text) -> dict:
+    return {
+        'rowid': methodic_id,
+        'author': fold_russian(author),
+        'source_title': fold_russian(source_title),
+        'methodic_text': fold_russian(methodic_text)
+    }
+
+
+def ensure_fts_table(connection):
+    connection.execute(text(CREATE_FTS_SQL))
+
+
+def index_methodic(connection, methodic_id: int, author, source_title, methodic_text):
+    index_methodics(connection, [(methodic_id, author, source_title, methodic_text)])
+
+
+def index_methodics(connection, rows: list):
+    """Индексирует пачку методичек одним executemany: rows — кортежи (id, author, source_title, methodic_text)"""
+    if not rows:
+        return
+    connection.execute(
+        text(
+            f"INSERT INTO {FTS_TABLE}(rowid, author, source_title, methodic_text) "
+            f"VALUES (:rowid, :author, :source_title, :methodic_text)"
+        ),
+        [_fts_values(*row) for row in rows]
+    )
+
+
+def unindex_methodic(connection, methodic_id: int):
+    """
+    Таблица contentless: для удаления FTS5 нужны исходные значения колонок,
+    поэтому читаем их из methodic_entries до того, как строка изменится.
+    """
+    row = connection.execute(
+        select(MethodicEntry.author, MethodicEntry.source_title)
+        .where(MethodicEntry.id == methodic_id)
+    ).first()
+    if row is None:
+        return
+    row = (*row, load_text(connection, methodic_id))
+    connection.execute(
+        text(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, author, source_title, methodic_text) "
+            f"VALUES ('delete', :rowid, :author, :source_title, :methodic_text)"
+        ),
+        _fts_values(methodic_id, *row)
+    )
+
+
+def sync_fts_index(db: Session) -> int:
+    """Индексирует методички, добавленные в обход ORM. Возвращает их количество."""
+    connection = db.connection()
+    ensure_fts_table(connection)
+
+    missing = connection.execute(
+        select(MethodicEntry.id, MethodicEntry.author, MethodicEntry.source_title)
+        .where(MethodicEntry.id.not_in(select(literal_column("rowid")).select_from(table(FTS_TABLE))))
+    ).all()
+    texts = load_texts(connection, [row[0] for row in missing])
+    for methodic_id, author, source_title in missing:
+        index_methodic(connection, methodic_id, author, source_title, texts.get(methodic_id))
+
+    db.commit()
+    return len(missing)
+
+
+def build_match_query(query: str) -> str:
+    """
+    Превращает пользовательский запрос в выражение MATCH:
+    основа каждого слова длиннее двух символов ищется как префикс (любая форма слова),
+    основы объединяются через OR.
+    """
+    return " OR ".join(f'"{term}"*' for term in normalize_query(query).match_terms)
+
+
+def fts_search(db: Session, query: str, limit: int = 5) -> list:
+    """Возвращает id методичек, упорядоченные по BM25 (лучшие первыми)"""
+    match_query = build_match_query(query)
+    if not match_query:
+        return []
+
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    rows = db.execute(
+        text(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}), rowid LIMIT :limit"
+        ),
+        {'match': match_query, 'limit': limit}
+    ).all()
+    return [row[0] for row in rows]
+
+
+def fts_search_page(db: Session, query: str, limit: int, after: tuple = None, author: str = None) -> list:
+    """
+    Страница результатов в порядке (BM25, id) после позиции after = (score, id) — keyset-пагинация:
+    следующая страница не пересчитывает и не передает предыдущие, сколько бы их ни было.
+    author — только методички этого автора. Возвращает [(id, score), ...].
+    """
+    match_query = build_match_query(query)
+    if not match_query:
+        return []
+
+    params = {'match': match_query, 'limit': limit}
+    author_filter = ""
+    if author is not None:
+        author_filter = "AND rowid IN (SELECT id FROM methodic_entries WHERE author = :author)"
+        params['author'] = author
+    keyset = ""
+    if after is not None:
+        keyset = "WHERE score > :score OR (score = :score AND id > :id)"
+        params['score'], params['id'] = after
+
+    # LIMIT -1 не дает SQLite перенести условие на score внутрь подзапроса:
+    # bm25() вычисляется только в контексте MATCH
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    rows = db.execute(
+        text(
+            f"SELECT id, score FROM ("
+            f"SELECT rowid AS id, bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH :match {author_filter} LIMIT -1"
+            f") {keyset} ORDER BY score, id LIMIT :limit"
+        ),
+        params
+    ).all()
+    return [(row[0], row[1]) for row in rows]
+
+
+def fts_facets(db: Session, query: str, limit: int = 10, author: str = None) -> dict:
+    """
+    Число найденных методичек и самые частые авторы и названия среди них.
+    Считается агрегатами в SQL по индексу FTS5 и первичному ключу methodic_entries, строки не загружаются.
+    """
+    match_query = build_match_query(query)
+    if not match_query:
+        return {'total': 0, 'authors': [], 'titles': []}
+
+    params = {'match': match_query, 'limit': limit}
+    author_filter = ""
+    if author is not None:
+        author_filter = "AND e.author = :author"
+        params['author'] = author
+
+    matched = (
+        f"FROM {FTS_TABLE} JOIN methodic_entries e ON e.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH :match {author_filter}"
+    )
+    facets = {'total': db.execute(text(f"SELECT COUNT(*) {matched}"), params).scalar()}
+    for name, column in (('authors', 'e.author'), ('titles', 'e.source_title')):
+        rows = db.execute(
+            text(
+                f"SELECT {column}, COUNT(*) AS count {matched} AND {column} IS NOT NULL "
+                f"GROUP BY {column} ORDER BY count DESC, {column} LIMIT :limit"
+            ),
+            params
+        ).all()
+        facets[name] = [{'value': value, 'count': count} for value, count in rows]
+    return facets
+
+
+# ------------------ СИНХРОНИЗАЦИЯ С methodic_entries ------------------
+def _indexed_fields_changed(target) -> bool:
+    attrs = inspect(target).attrs
+    return any(
+        attrs[name].history.has_changes()
+        for name in ('author', 'source_title', 'methodic_text')
+    )
+
+
+@event.listens_for(MethodicEntry, "after_insert")
+def _on_methodic_insert(mapper, connection, target):
+    index_methodic(connection, target.id, target.author, target.source_title, target.methodic_text)
+
+
+@event.listens_for(MethodicEntry, "before_update")
+def _on_methodic_before_update(mapper, connection, target):
+    if _indexed_fields_changed(target):
+        unindex_methodic(connection, target.id)
+
+
+@event.listens_for(MethodicEntry, "after_update")
+def _on_methodic_after_update(mapper, connection, target):
+    if _indexed_fields_changed(target):
+        index_methodic(
+            connection, target.id, target.author, target.source_title, current_text(connection, target)
+        )
+
+
+@event.listens_for(MethodicEntry, "before_delete")
+def _on_methodic_delete(mapper, connection, target):
+    unindex_methodic(connection, target.id)
@@ -0,0 +1,282 @@
+import asyncio
+import json
+from typing import Optional
+
+import httpx
+
+from config import settings
+from metrics import GEMINI_REQUESTS, GEMINI_BREAKER_STATE, GEMINI_IN_FLIGHT
+from resilience import CircuitBreaker, ConcurrencyLimiter, Deadline, Overloaded, backoff_delay
+
+BREAKER_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+gemini_breaker = CircuitBreaker(
+    "gemini",
+    failure_threshold=settings.GEMINI_BREAKER_FAILURES,
+    reset_timeout=settings.GEMINI_BREAKER_RESET_SECONDS,
+    on_change=lambda state: GEMINI_BREAKER_STATE.set(BREAKER_STATE_VALUES[state])
+)
+GEMINI_BREAKER_STATE.set(0)
+gemini_limiter = ConcurrencyLimiter(settings.GEMINI_MAX_CONCURRENCY)
+
+_client = None
+
+
+class GeminiError(Exception):
+    """
+    Неудачное обращение к Gemini; retryable — имеет смысл повторить,
+    failure — сбой самого сервиса, который учитывает автомат (по умолчанию совпадает с retryable).
+    Ошибки запроса (400, 401, 403, 404) автомат не размыкают: повтор и другие вопросы их не исправят,
+    но и о недоступности Gemini они не говорят.
+    """
+
+    def __init__(self, outcome: str, message: str, retryable: bool = False, failure: Optional[bool] = None):
+        super().__init__(message)
+        self.outcome = outcome
+        self.retryable = retryable
+        self.failure = retryable if failure is None else failure
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Общий асинхронный клиент с пулом keep-alive соединений.
+    Создается лениво внутри работающего event loop.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=settings.GEMINI_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.GEMINI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.GEMINI_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                settings.GEMINI_READ_TIMEOUT,
+                connect=settings.GEMINI_CONNECT_TIMEOUT,
+                pool=settings.GEMINI_POOL_TIMEOUT
+            ),
+            headers={"Content-Type": "application/json"}
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def extract_text(data: dict) -> str:
+    """Достает текст ответа из JSON generateContent"""
+    return (
+        data.get("candidates", [{}])[0]
+        .get("content", {})
+        .get("parts", [{}])[0]
+        .get("text", "")
+    )
+
+
+def request_timeout(deadline: Deadline) -> httpx.Timeout:
+    """Таймауты попытки: не дольше настроенных и не дольше остатка дедлайна"""
+    remaining = deadline.remaining()
+    return httpx.Timeout(
+        min(settings.GEMINI_READ_TIMEOUT, remaining),
+        connect=min(settings.GEMINI_CONNECT_TIMEOUT, remaining),
+        pool=min(settings.GEMINI_POOL_TIMEOUT, remaining)
+    )
+
+
+def is_retryable_status(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def gemini_status() -> dict:
+    """Состояние защиты вызовов Gemini (для /stats)"""
+    return {
+        'breaker': gemini_breaker.snapshot(),
+        'in_flight': gemini_limiter.in_flight,
+        'limit': gemini_limiter.limit,
+        'queue_rejected': gemini_limiter.rejected
+    }
+
+
+def breaker_rejects(method: str) -> bool:
+    """Автомат разомкнут: вызов не выполняется, сразу используется запасной ответ"""
+    if gemini_breaker.allow():
+        return False
+    GEMINI_REQUESTS.inc(method=method, outcome="breaker_open")
+    return True
+
+
+async def _post(body: dict, deadline: Deadline) -> str:
+    """Одна попытка generateContent в пределах дедлайна"""
+    try:
+        resp = await asyncio.wait_for(
+            get_client().post(
+                settings.GEMINI_API_URL,
+                params={"key": settings.GEMINI_API_KEY},
+                json=body,
+                timeout=request_timeout(deadline)
+            ),
+            timeout=deadline.remaining()
+        )
+    except (httpx.TimeoutException, asyncio.TimeoutError) as e:
+        raise GeminiError("timeout", f"Таймаут обращения к Gemini: {e!r}", retryable=True)
+    except httpx.TransportError as e:
+        raise GeminiError("error", f"Ошибка обращения к Gemini: {e!r}", retryable=True)
+
+    if resp.status_code != 200:
+        raise GeminiError(
+            "http_error",
+            f"Ошибка Gemini: {resp.status_code} - {resp.text[:200]}",
+            retryable=is_retryable_status(resp.status_code)
+        )
+    # Ответ 200 без текста (поврежденный JSON, заблокированный ответ) — тоже сбой для автомата
+    try:
+        text = extract_text(resp.json()).strip()
+    except (ValueError, LookupError, AttributeError, TypeError) as e:
+        raise GeminiError("bad_response", f"Некорректный ответ Gemini: {e!r} - {resp.text[:200]}", failure=True)
+    if not text:
+        raise GeminiError("bad_response", f"Пустой ответ Gemini: {resp.text[:200]}", failure=True)
+    return text
+
+
+async def generate_content(body: dict, deadline: Optional[Deadline] = None) -> str:
+    """
+    Вызывает generateContent и возвращает текст ответа.
+    При ошибке, разомкнутом автомате, нехватке слотов или истечении дедлайна возвращает пустую строку.
+    Повторяет попытку до GEMINI_RETRIES раз, если ошибка временная и время позволяет.
+    """
+    deadline = deadline or Deadline()
+    for attempt in range(settings.GEMINI_RETRIES + 1):
+        if deadline.remaining() < settings.GEMINI_MIN_ATTEMPT_SECONDS:
+            GEMINI_REQUESTS.inc(method="generate", outcome="deadline")
+            print("Gemini: не осталось времени на попытку")
+            return ""
+        if breaker_rejects("generate"):
+            print("Gemini: автомат разомкнут, вызов пропущен")
+            return ""
+
+        try:
+            async with gemini_limiter.slot(min(settings.GEMINI_QUEUE_TIMEOUT, deadline.remaining())):
+                GEMINI_IN_FLIGHT.set(gemini_limiter.in_flight)
+                try:
+                    text = await _post(body, deadline)
+                finally:
+                    GEMINI_IN_FLIGHT.set(gemini_limiter.in_flight - 1)
+        except Overloaded as e:
+            gemini_breaker.release()
+            GEMINI_REQUESTS.inc(method="generate", outcome="overloaded")
+            print(f"Gemini перегружен: {e}")
+            return ""
+        except GeminiError as e:
+            if e.failure:
+                gemini_breaker.record_failure()
+            else:
+                gemini_breaker.release()
+            GEMINI_REQUESTS.inc(method="generate", outcome=e.outcome)
+            print(e)
+            if not e.retryable or attempt == settings.GEMINI_RETRIES:
+                return ""
+            delay = backoff_delay(attempt, settings.GEMINI_RETRY_BACKOFF, settings.GEMINI_RETRY_BACKOFF_MAX)
+            if deadline.remaining() - delay < settings.GEMINI_MIN_ATTEMPT_SECONDS:
+                return ""
+            GEMINI_REQUESTS.inc(method="generate", outcome="retry")
+            await asyncio.sleep(delay)
+            continue
+        except asyncio.CancelledError:
+            gemini_breaker.release()
+            raise
+        except Exception as e:
+            gemini_breaker.release()
+            GEMINI_REQUESTS.inc(method="generate", outcome="error")
+            print(f"Ошибка обращения к Gemini: {e}")
+            return ""
+
+        gemini_breaker.record_success()
+        GEMINI_REQUESTS.inc(method="generate", outcome="ok")
+        return text
+    return ""
+
+
+def stream_url() -> str:
+    """URL потокового метода streamGenerateContent для той же модели"""
+    return settings.GEMINI_API_URL.replace(":generateContent", ":streamGenerateContent")
+
+
+async def stream_content(body: dict, deadline: Optional[Deadline] = None):
+    """
+    Вызывает streamGenerateContent (alt=sse) и отдает фрагменты текста по мере генерации.
+    При ошибке, разомкнутом автомате, нехватке слотов или истечении дедлайна (он проверяется
+    и между фрагментами) поднимает GeminiError — в том числе после части фрагментов, чтобы
+    вызывающий код не принял оборванный поток за законченный ответ.
+    Повторов нет: часть ответа уже могла уйти клиенту.
+    """
+    deadline = deadline or Deadline()
+    if deadline.remaining() < settings.GEMINI_MIN_ATTEMPT_SECONDS:
+        GEMINI_REQUESTS.inc(method="stream", outcome="deadline")
+        raise GeminiError("deadline", "Gemini: не осталось времени на попытку")
+    if breaker_rejects("stream"):
+        raise GeminiError("breaker_open", "Gemini: автомат разомкнут, вызов пропущен")
+
+    succeeded = False
+    try:
+        async with gemini_limiter.slot(min(settings.GEMINI_QUEUE_TIMEOUT, deadline.remaining())):
+            GEMINI_IN_FLIGHT.set(gemini_limiter.in_flight)
+            try:
+                async with get_client().stream(
+                        "POST",
+                        stream_url(),
+                        params={"key": settings.GEMINI_API_KEY, "alt": "sse"},
+                        json=body,
+                        timeout=request_timeout(deadline)
+                ) as resp:
+                    if resp.status_code != 200:
+                        GEMINI_REQUESTS.inc(method="stream", outcome="http_error")
+                        error_text = (await resp.aread()).decode("utf-8", errors="replace")
+                        if is_retryable_status(resp.status_code):
+                            gemini_breaker.record_failure()
+                        raise GeminiError("http_error", f"Ошибка Gemini: {resp.status_code} - {error_text[:200]}")
+
+                    lines = resp.aiter_lines()
+                    while True:
+                        try:
+                            line = await asyncio.wait_for(lines.__anext__(), timeout=deadline.remaining())
+                        except StopAsyncIteration:
+                            break
+                        if not line.startswith("data:"):
+                            continue
+                        payload = line[len("data:"):].strip()
+                        if not payload:
+                            continue
+                        chunk = extract_text(json.loads(payload))
+                        if chunk:
+                            yield chunk
+                    GEMINI_REQUESTS.inc(method="stream", outcome="ok")
+                    gemini_breaker.record_success()
+                    succeeded = True
+            finally:
+                GEMINI_IN_FLIGHT.set(gemini_limiter.in_flight - 1)
+    except GeminiError:
+        raise
+    except Overloaded as e:
+        GEMINI_REQUESTS.inc(method="stream", outcome="overloaded")
+        raise GeminiError("overloaded", f"Gemini перегружен: {e}")
+    except asyncio.TimeoutError:
+        GEMINI_REQUESTS.inc(method="stream", outcome="deadline")
+        gemini_breaker.record_failure()
+        raise GeminiError("deadline", "Gemini: дедлайн истек во время потока")
+    except httpx.TimeoutException as e:
+        GEMINI_REQUESTS.inc(method="stream", outcome="timeout")
+        gemini_breaker.record_failure()
+        raise GeminiError("timeout", f"Таймаут обращения к Gemini: {e!r}")
+    except Exception as e:
+        GEMINI_REQUESTS.inc(method="stream", outcome="error")
+        gemini_breaker.record_failure()
+        raise GeminiError("error", f"Ошибка обращения к Gemini: {e}")
+    finally:
+        # Поток прерван клиентом или завершился без результата — пробный вызов можно повторить
+        if not succeeded:
+            gemini_breaker.release()
@@ -0,0 +1,177 @@
+# app/gemini_stub.py
+"""
+Локальная заглушка Gemini API для проверки клиента и нагрузочных тестов.
+
+Запуск:
+    python gemini_stub.py --port 8001 --delay 0.5
+    GEMINI_API_URL=http://127.0.0.1:8001/v1beta/models/stub:generateContent python main.py
+
+Сбои для проверки автомата и дедлайнов:
+    python gemini_stub.py --error-rate 0.5 --hang-rate 0.1 --hang-seconds 60
+    curl -X POST http://127.0.0.1:8001/faults -H 'Content-Type: application/json' -d '{"error_rate": 1.0}'
+    curl -X POST http://127.0.0.1:8001/faults -H 'Content-Type: application/json' -d '{"error_status": 400}'
+    curl -X POST http://127.0.0.1:8001/faults -H 'Content-Type: application/json' -d '{"stream_break_after": 2}'
+    curl -X POST http://127.0.0.1:8001/faults -H 'Content-Type: application/json' -d '{"bad_body": "blocked"}'
+
+GET /stats — счетчики вызовов и сбоев, число выполняющихся вызовов и наибольшее из них,
+число разных TCP-соединений клиента (при пуле keep-alive оно меньше числа вызовов);
+DELETE /stats обнуляет счетчики.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from pydantic import BaseModel
+
+app = FastAPI(title="Gemini stub")
+app.state.delay = 0.0
+app.state.calls = 0
+app.state.error_rate = 0.0
+app.state.hang_rate = 0.0
+app.state.hang_seconds = 60.0
+app.state.errors = 0
+app.state.hangs = 0
+app.state.error_status = 503
+app.state.stream_break_after = 0  # > 0 — поток обрывается после стольких фрагментов
+app.state.bad_body = ""  # "blocked" или "malformed" — ответ 200 без текста
+app.state.in_flight = 0
+app.state.max_in_flight = 0
+app.state.peers = set()
+app.state.random = random.Random()
+
+
+class Faults(BaseModel):
+    delay: Optional[float] = None
+    error_rate: Optional[float] = None
+    hang_rate: Optional[float] = None
+    hang_seconds: Optional[float] = None
+    error_status: Optional[int] = None
+    stream_break_after: Optional[int] = None
+    bad_body: Optional[str] = None
+
+
+def stub_answer(prompt: str) -> str:
+    """Собирает ответ из строк контекста, чтобы он проходил проверку качества"""
+    fragments = re.findall(r'^ {2}\d+\. (.+)$', prompt, flags=re.MULTILINE)
+    question = re.findall(r'ВОПРОС:\s*(.+)', prompt)
+    parts = [f"Ответ на вопрос: {question[-1].strip() if question else ''}"]
+    parts.extend(fragments[:3] or ["В предоставленных материалах нет информации по этому вопросу."])
+    return "\n".join(parts)
+
+
+@app.post("/faults")
+async def set_faults(faults: Faults):
+    """Меняет задержку и вероятности сбоев без перезапуска"""
+    for name, value in faults.model_dump(exclude_none=True).items():
+        setattr(app.state, name, value)
+    return fault_settings()
+
+
+def fault_settings() -> dict:
+    return {
+        "delay": app.state.delay,
+        "error_rate": app.state.error_rate,
+        "hang_rate": app.state.hang_rate,
+        "hang_seconds": app.state.hang_seconds,
+        "error_status": app.state.error_status,
+        "stream_break_after": app.state.stream_break_after,
+        "bad_body": app.state.bad_body
+    }
+
+
+@app.post("/{path:path}")
+async def generate(path: str, request: Request):
+    body = await request.json()
+    app.state.calls += 1
+    app.state.peers.add((request.client.host, request.client.port))
+    app.state.in_flight += 1
+    app.state.max_in_flight = max(app.state.max_in_flight, app.state.in_flight)
+    try:
+        roll = app.state.random.random()
+        if roll < app.state.error_rate:
+            app.state.errors += 1
+            status = app.state.error_status
+            return JSONResponse(
+                status_code=status,
+                content={"error": {"code": status, "message": "stub: injected failure"}}
+            )
+        if roll < app.state.error_rate + app.state.hang_rate:
+            app.state.hangs += 1
+            await asyncio.sleep(app.state.hang_seconds)
+
+        await asyncio.sleep(app.state.delay)
+    finally:
+        app.state.in_flight -= 1
+
+    prompt = body["contents"][0]["parts"][0]["text"]
+    answer = stub_answer(prompt)
+
+    if path.endswith(":streamGenerateContent"):
+        return StreamingResponse(stream_chunks(answer), media_type="text/event-stream")
+
+    if app.state.bad_body == "blocked":
+        return {"promptFeedback": {"blockReason": "SAFETY"}}
+    if app.state.bad_body == "malformed":
+        return Response('{"candidates": [', media_type="application/json")
+    return {"candidates": [{"content": {"parts": [{"text": answer}]}}]}
+
+
+async def stream_chunks(answer: str):
+    """Отдает ответ кусками по несколько слов в формате alt=sse"""
+    words = answer.split(" ")
+    for i in range(0, len(words), 5):
+        if app.state.stream_break_after and i // 5 >= app.state.stream_break_after:
+            # Соединение рвется посреди ответа: клиент получает неполное тело
+            raise ConnectionAbortedError("stub: stream interrupted")
+        chunk = " ".join(words[i:i + 5]) + (" " if i + 5 < len(words) else "")
+        data = {"candidates": [{"content": {"parts": [{"text": chunk}]}}]}
+        yield f"data: {json.dumps(data, ensure_ascii=False)}\r\n\r\n"
+        await asyncio.sleep(app.state.delay / 10)
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "calls": app.state.calls,
+        "errors": app.state.errors,
+        "hangs": app.state.hangs,
+        "in_flight": app.state.in_flight,
+        "max_in_flight": app.state.max_in_flight,
+        "connections": len(app.state.peers),
+        **fault_settings()
+    }
+
+
+@app.delete("/stats")
+async def reset_stats():
+    app.state.calls = app.state.errors = app.state.hangs = app.state.max_in_flight = 0
+    app.state.peers = set()
+    return await stats()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Заглушка Gemini API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.0, help="Задержка ответа в секундах")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля запросов с ошибкой")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP-статус ошибки")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Доля запросов, которые зависают")
+    parser.add_argument("--hang-seconds", type=float, default=60.0, help="Длительность зависания")
+    parser.add_argument("--seed", type=int, default=None, help="Зерно генератора сбоев")
+    args = parser.parse_args()
+
+    app.state.delay = args.delay
+    app.state.error_rate = args.error_rate
+    app.state.error_status = args.error_status
+    app.state.hang_rate = args.hang_rate
+    app.state.hang_seconds = args.hang_seconds
+    app.state.random = random.Random(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,285 @@
+# app/ingest.py
+"""
+Потоковая загрузка методичек и пар вопрос-ответ в methodic_entries и qa_entries.
+
+Источники: файлы .jsonl, .csv, .txt или каталоги с ними (обходятся рекурсивно).
+- JSONL/CSV: запись с полем question — пара Q&A (answer, необязательный methodic_id),
+  иначе методичка (author, source_title или title, methodic_text или text/content;
+  в JSONL можно вложить список qa: [{"question": ..., "answer": ...}]).
+- TXT: один файл — одна методичка, заголовок — имя файла.
+
+Файлы читаются построчно, записи вставляются пачками через executemany,
+каждая пачка — отдельная транзакция вместе с предложениями, FTS- и триграммным индексом
+и сжатием текстов (TEXT_COMPRESSION_ENABLED).
+Прогресс по каждому источнику хранится в ingest_progress: повторный запуск продолжает с места остановки.
+
+Запуск:
+    python ingest.py data/import/ --batch-size 500
+    python ingest.py methodics.jsonl qa.csv --restart
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import engine, init_db
+from models import MethodicEntry, QAEntry, IngestProgress
+from fts_index import index_methodics
+from sentence_store import store_new_sentences
+from qa_index import index_new_qa_entries
+from text_storage import store_chunks
+from config import settings
+
+SUPPORTED_SUFFIXES = ('.jsonl', '.csv', '.txt')
+
+
+# ------------------ ЧТЕНИЕ ИСТОЧНИКОВ ------------------
+def parse_record(data: dict) -> tuple:
+    """Приводит запись JSONL/CSV к ('methodic', {...}) или ('qa', {...})"""
+    if data.get('question'):
+        methodic_id = data.get('methodic_id')
+        return 'qa', {
+            'question': data['question'],
+            'answer': data.get('answer') or "",
+            'methodic_id': int(methodic_id) if methodic_id not in (None, "") else None
+        }
+
+    return 'methodic', {
+        'author': data.get('author') or None,
+        'source_title': data.get('source_title') or data.get('title') or None,
+        'methodic_text': data.get('methodic_text') or data.get('text') or data.get('content') or "",
+        'qa': [
+            {'question': qa['question'], 'answer': qa.get('answer') or ""}
+            for qa in data.get('qa') or []
+            if qa.get('question')
+        ]
+    }
+
+
+def read_jsonl(path: Path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield parse_record(json.loads(line))
+
+
+def raise_csv_field_limit():
+    """
+    По умолчанию csv не читает поля длиннее 128 КиБ, а тексты методичек бывают больше.
+    Предел — sys.maxsize, уменьшенный до значения, которое помещается в C long платформы.
+    """
+    limit = sys.maxsize
+    while True:
+        try:
+            csv.field_size_limit(limit)
+            return
+        except OverflowError:
+            limit //= 2
+
+
+def read_csv(path: Path):
+    raise_csv_field_limit()
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            yield parse_record(row)
+
+
+def read_text(path: Path):
+    yield 'methodic', {
+        'author': None,
+        'source_title': path.stem,
+        'methodic_text': path.read_text(encoding='utf-8'),
+        'qa': []
+    }
+
+
+READERS = {'.jsonl': read_jsonl, '.csv': read_csv, '.txt': read_text}
+
+
+def expand_sources(paths: list) -> list:
+    """Файлы для загрузки в стабильном порядке: каталоги раскрываются рекурсивно"""
+    sources = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            sources.extend(sorted(p for p in path.rglob('*') if p.suffix.lower() in SUPPORTED_SUFFIXES))
+        elif path.suffix.lower() in SUPPORTED_SUFFIXES:
+            sources.append(path)
+        else:
+            print(f"Пропущен файл неизвестного формата: {path}")
+    return sources
+
+
+def record_bytes(kind: str, record: dict) -> int:
+    """Объем текста записи в байтах (для подсчета МБ/с)"""
+    if kind == 'qa':
+        fields = [record['question'], record['answer']]
+    else:
+        fields = [record['author'], record['source_title'], record['methodic_text']]
+        fields += [value for qa in record['qa'] for value in (qa['question'], qa['answer'])]
+    return sum(len(value.encode('utf-8')) for value in fields if value)
+
+
+# ------------------ ЗАПИСЬ ПАЧКИ ------------------
+def insert_returning_ids(connection, table, rows: list) -> list:
+    """executemany с RETURNING: id возвращаются в порядке строк"""
+    result = connection.execute(
+        insert(table).returning(table.c.id, sort_by_parameter_order=True),
+        rows
+    )
+    return result.scalars().all()
+
+
+def write_batch(connection, records: list) -> int:
+    """
+    Вставляет пачку записей и строит для нее производные структуры.
+    Возвращает число вставленных документов (методичек и Q&A).
+    """
+    methodics = [record for kind, record in records if kind == 'methodic']
+    qa_rows = [record for kind, record in records if kind == 'qa']
+
+    if methodics:
+        # При сжатии текст сразу пишется только частями (store_chunks), колонка остается NULL
+        compress = settings.TEXT_COMPRESSION_ENABLED
+        methodic_ids = insert_returning_ids(connection, MethodicEntry.__table__, [
+            {
+                'author': record['author'],
+                'source_title': record['source_title'],
+                'methodic_text': None if compress and record['methodic_text'] else record['methodic_text']
+            }
+            for record in methodics
+        ])
+        index_methodics(connection, [
+            (methodic_id, record['author'], record['source_title'], record['methodic_text'])
+            for methodic_id, record in zip(methodic_ids, methodics)
+        ])
+        store_new_sentences(connection, [
+            (methodic_id, record['methodic_text'])
+            for methodic_id, record in zip(methodic_ids, methodics)
+        ])
+        if compress:
+            store_chunks(connection, [
+                (methodic_id, record['methodic_text'])
+                for methodic_id, record in zip(methodic_ids, methodics)
+            ])
+        qa_rows += [
+            {**qa, 'methodic_id': methodic_id}
+            for methodic_id, record in zip(methodic_ids, methodics)
+            for qa in record['qa']
+        ]
+
+    if qa_rows:
+        qa_ids = insert_returning_ids(connection, QAEntry.__table__, qa_rows)
+        index_new_qa_entries(connection, [(qa_id, row['question']) for qa_id, row in zip(qa_ids, qa_rows)])
+
+    return len(methodics) + len(qa_rows)
+
+
+def save_progress(connection, source: str, records: int):
+    statement = sqlite_insert(IngestProgress.__table__).values(source=source, records=records)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=['source'],
+        set_={'records': statement.excluded.records, 'updated_at': statement.excluded.updated_at}
+    ))
+
+
+def load_progress(source: str) -> int:
+    with engine.connect() as connection:
+        records = connection.execute(
+            select(IngestProgress.records).where(IngestProgress.source == source)
+        ).scalar()
+    return records or 0
+
+
+# ------------------ ЗАГРУЗКА ------------------
+class Throughput:
+    """Счетчики скорости загрузки"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.docs = 0
+        self.bytes = 0
+
+    def report(self, prefix: str) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (
+            f"{prefix}: {self.docs} документов, {self.bytes / 1e6:.1f} МБ за {elapsed:.1f} с "
+            f"({self.docs / elapsed:.0f} док/с, {self.bytes / 1e6 / elapsed:.2f} МБ/с)"
+        )
+
+
+def ingest_source(path: Path, batch_size: int, total: Throughput):
+    source = str(path.resolve())
+    done = load_progress(source)
+
+    stats = Throughput()
+    batch = []
+    position = 0
+
+    def flush():
+        with engine.begin() as connection:
+            inserted = write_batch(connection, batch)
+            save_progress(connection, source, position)
+        stats.docs += inserted
+        total.docs += inserted
+        batch.clear()
+        print(stats.report(f"  {path.name}"))
+
+    for kind, record in READERS[path.suffix.lower()](path):
+        position += 1
+        if position <= done:
+            continue
+        if position == done + 1 and done:
+            print(f"{path}: продолжаем после {done} записей")
+
+        batch.append((kind, record))
+        size = record_bytes(kind, record)
+        stats.bytes += size
+        total.bytes += size
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    elif position <= done:
+        print(f"{path}: уже загружен ({done} записей)")
+
+
+def reset_progress(sources: list):
+    with engine.begin() as connection:
+        connection.execute(
+            IngestProgress.__table__.delete().where(
+                IngestProgress.source.in_([str(path.resolve()) for path in sources])
+            )
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Потоковая загрузка методичек и Q&A")
+    parser.add_argument("paths", nargs="+", help="Файлы .jsonl/.csv/.txt или каталоги с ними")
+    parser.add_argument("--batch-size", type=int, default=500, help="Записей в одной транзакции")
+    parser.add_argument("--restart", action="store_true", help="Забыть прогресс и загрузить источники заново")
+    args = parser.parse_args(argv)
+
+    sources = expand_sources(args.paths)
+    if not sources:
+        print("Нет файлов для загрузки")
+        return 1
+
+    init_db()
+    if args.restart:
+        reset_progress(sources)
+
+    total = Throughput()
+    for path in sources:
+        ingest_source(path, args.batch_size, total)
+    print(total.report("Итого"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,50 @@
 # app/main.py
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, HTTPException, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-import requests
+import asyncio
+import json
 import re
+import time
+from urllib.parse import urlencode
 
-from database import get_db, init_db
-from models import MethodicEntry, QAEntry
+from database import get_db, init_db, read_session, engine, async_engine
 from search import (
-    search_methodics_with_context,
-    format_context_for_prompt,
-    search_qa_entries,
-    search_methodic_texts
+    search_methodics_with_context_async,
+    search_qa_entries_async,
+    search_methodic_preview_page_async,
+    search_facets_async,
+    decode_cursor,
+    InvalidCursor,
+    search_qa_entries_batch_async,
+    search_methodics_with_context_batch_async
 )
+from gemini_client import GeminiError, generate_content, stream_content, close_client, gemini_breaker, gemini_status
+from resilience import Deadline
+from answer_cache import answer_cache
 from config import settings
+from qa_index import normalize_question
+from text_normalization import normalize_query, terms
+from single_flight import SingleFlight
+from semantic_index import load_index, is_stale
+from readiness import Readiness
+from parallel_scoring import warm_up as warm_up_workers, shutdown_executor
+from response_cache import cached_json_response, result_cache
+import corpus_snapshot
+from query_profiler import PROFILE_HEADER, ENDPOINT_QUERY_BUDGETS, profile_queries, install as install_query_profiler
+from context_packer import pack_context, estimate_tokens
+from methodic_text import text_preview, text_size, read_text_bytes, parse_range, RangeNotSatisfiable
+from metrics import (
+    stage,
+    request_timings,
+    server_timing_header,
+    render_metrics,
+    HTTP_REQUEST_SECONDS,
+    CHAT_ANSWERS,
+    PROMPT_TOKENS
+)
 from pydantic import BaseModel
 
 app = FastAPI(title="Methodics Chat Bot (Dual Database)", version="3.1.0")
@@ -29,10 +59,116 @@ app.add_middleware(
 )
 
 
+# ------------------ METRICS ------------------
+@app.middleware("http")
+async def timing_middleware(request, call_next):
+    """Длительность запросов по маршрутам и, по желанию, заголовок Server-Timing с этапами"""
+    timings = []
+    token = request_timings.set(timings)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        elapsed,
+        method=request.method,
+        route=route.path if route else "unmatched",
+        status=str(response.status_code)
+    )
+    if settings.SERVER_TIMING_ENABLED:
+        timings.append(("total", elapsed))
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
+if settings.SQL_PROFILING_ENABLED:
+    install_query_profiler()
+
+
+@app.middleware("http")
+async def sql_profiling_middleware(request, call_next):
+    """Статистика SQL по запросу: заголовок X-DB-Profile и строка в логе"""
+    if not settings.SQL_PROFILING_ENABLED:
+        return await call_next(request)
+
+    with profile_queries() as stats:
+        response = await call_next(request)
+
+    route = request.scope.get("route")
+    endpoint = f"{request.method} {route.path if route else request.url.path}"
+    response.headers[PROFILE_HEADER] = stats.header_value()
+    print(f"SQL {endpoint}: {stats.header_value()}")
+
+    budget = ENDPOINT_QUERY_BUDGETS.get(endpoint)
+    problems = budget.violations(stats.__dict__) if budget else []
+    if problems:
+        print(f"⚠️ Превышен бюджет SQL для {endpoint}: {', '.join(problems)}")
+        for statement in stats.sql:
+            print(f"    {statement}")
+    return response
+
+
 # ------------------ DB INIT ------------------
+readiness = Readiness()
+
+
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_db()
+    # Тяжелые шаги — в фоне: процесс сразу отвечает на /health/live, а /health/ready — после прогрева
+    app.state.warm_up = asyncio.ensure_future(warm_up())
+
+
+def semantic_index_stale(index) -> bool:
+    with engine.connect() as connection:
+        return is_stale(index, connection)
+
+
+async def warm_up():
+    """Снимок корпуса в памяти, семантический индекс (с чтением страниц в кэш ОС) и пул воркеров"""
+    use_semantic = settings.RETRIEVAL_MODE in ("semantic", "hybrid")
+    readiness.expect(
+        *(["corpus_snapshot"] if settings.SERVE_FROM_MEMORY else []),
+        *(["semantic_index"] if use_semantic else []),
+        "workers"
+    )
+
+    if settings.SERVE_FROM_MEMORY:
+        async with readiness.step("corpus_snapshot") as component:
+            if await corpus_snapshot.start():
+                component.update(corpus_snapshot.snapshot_status())
+            else:
+                component['detail'] = "снимок невозможен, чтение с диска"
+
+    if use_semantic:
+        async with readiness.step("semantic_index") as component:
+            index = await asyncio.to_thread(load_index)
+            if index is None:
+                component['detail'] = "индекс не построен, используется поиск по ключевым словам"
+            else:
+                component['bytes'] = await asyncio.to_thread(index.prefetch)
+                component['stale'] = await asyncio.to_thread(semantic_index_stale, index)
+                if component['stale']:
+                    print("⚠️ Семантический индекс построен по другому содержимому базы: python semantic_index.py build")
+
+    async with readiness.step("workers"):
+        await asyncio.to_thread(warm_up_workers)
+
+    readiness.finished = True
+    print(f"Прогрев завершен: {readiness.snapshot()['status']}")
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    app.state.warm_up.cancel()
+    shutdown_executor()
+    await corpus_snapshot.stop()
+    await close_client()
+    await async_engine.dispose()
 
 
 # ------------------ MODELS ------------------
@@ -49,10 +185,27 @@ class MethodicSnippet(BaseModel):
     content_snippet: str
 
 
+class FacetValue(BaseModel):
+    value: str
+    count: int
+
+
+class SearchFacets(BaseModel):
+    total: int
+    authors: List[FacetValue]
+    titles: List[FacetValue]
+
+
+class MethodicDetail(MethodicSnippet):
+    text_length: int
+    text_url: str
+
+
 class ChatResponse(BaseModel):
     answer: str
     sources: List[MethodicSnippet]
     found_methodics: int
+    prompt_tokens: Optional[int] = None  # оценка токенов промпта, если он отправлялся в Gemini
 
 
 # ------------------ HELPERS ------------------
@@ -66,12 +219,11 @@ def is_quality_answer(answer: str, question: str) -> bool:
     if answer.count('•') > 10 or answer.count('\n-') > 10:
         return False
 
-    keywords = re.findall(r'\w+', question.lower())
-    keywords = [k for k in keywords if len(k) > 3]
+    keywords = normalize_query(question).keywords
 
     if keywords:
-        answer_lower = answer.lower()
-        matches = sum(1 for kw in keywords if kw in answer_lower)
+        answer_terms = set(terms(answer))
+        matches = sum(1 for kw in keywords if kw in answer_terms)
         if matches < max(1, len(keywords) * 0.3):
             return False
 
@@ -82,7 +234,7 @@ def is_quality_answer(answer: str, question: str) -> bool:
     return True
 
 
-def call_gemini_api(question: str, context: str) -> str:
+def build_gemini_body(question: str, context: str) -> dict:
     """
     Gemini используется только как инструмент для обобщения контекста.
     """
@@ -98,16 +250,14 @@ def call_gemini_api(question: str, context: str) -> str:
 7. Отвечай только на заданный вопрос: "{question}"
 
 КОНТЕКСТ:
-{context[:5000]}
+{context}
 
 ВОПРОС:
 {question}
 
 ОТВЕТ (только на основе контекста):"""
 
-    url = f"{settings.GEMINI_API_URL}?key={settings.GEMINI_API_KEY}"
-    headers = {"Content-Type": "application/json"}
-    body = {
+    return {
         "contents": [{"parts": [{"text": instruction}]}],
         "generationConfig": {
             "temperature": 0.2,
@@ -116,23 +266,35 @@ def call_gemini_api(question: str, context: str) -> str:
         }
     }
 
-    try:
-        resp = requests.post(url, headers=headers, json=body, timeout=30)
-        if resp.status_code != 200:
-            print(f"Ошибка Gemini: {resp.status_code} - {resp.text[:200]}")
-            return ""
-        data = resp.json()
-        answer = (
-            data.get("candidates", [{}])[0]
-            .get("content", {})
-            .get("parts", [{}])[0]
-            .get("text", "")
-            .strip()
-        )
-        return answer
-    except Exception as e:
-        print(f"Ошибка обращения к Gemini: {e}")
-        return ""
+
+async def call_gemini_api(question: str, context: str, deadline: Optional[Deadline] = None) -> str:
+    return await generate_content(build_gemini_body(question, context), deadline)
+
+
+def record_prompt_tokens(body: dict) -> int:
+    """Оценка токенов отправляемого промпта: метрика и строка в логе"""
+    tokens = estimate_tokens(body["contents"][0]["parts"][0]["text"])
+    PROMPT_TOKENS.observe(tokens)
+    print(f"В Gemini отправлено ~{tokens} токенов")
+    return tokens
+
+
+def context_methodic_ids(search_results: dict) -> list:
+    """Методички, из которых собран контекст (для инвалидации кэша ответов)"""
+    ids = {ctx['methodic'].id for ctx in search_results['methodic_contexts']}
+    ids.update(qa.methodic_id for qa in search_results['qa_results'] if qa.methodic_id)
+    return sorted(ids)
+
+
+def get_cached_answer(question: str, context: str) -> Optional[str]:
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    return answer_cache.get(answer_cache.make_key(question, context))
+
+
+def cache_answer(question: str, context: str, answer: str, search_results: dict):
+    if settings.LLM_CACHE_ENABLED and answer:
+        answer_cache.put(answer_cache.make_key(question, context), answer, context_methodic_ids(search_results))
 
 
 def format_manual_answer(search_results: dict, question: str) -> str:
@@ -142,16 +304,15 @@ def format_manual_answer(search_results: dict, question: str) -> str:
     if not search_results['methodic_contexts']:
         return "К сожалению, в методических материалах не найдено информации по вашему вопросу."
 
-    keywords = re.findall(r'\w+', question.lower())
-    keywords = [k for k in keywords if len(k) > 3]
+    keywords = normalize_query(question).keywords
 
     best_sentences = []
 
     for ctx in search_results['methodic_contexts'][:2]:
         if ctx['relevant_sentences']:
             for sentence in ctx['relevant_sentences'][:2]:
-                sentence_lower = sentence.lower()
-                relevance = sum(1 for kw in keywords if kw in sentence_lower) if keywords else 1
+                sentence_terms = set(terms(sentence))
+                relevance = sum(1 for kw in keywords if kw in sentence_terms) if keywords else 1
 
                 if relevance > 0 or not keywords:
                     clean_sentence = re.sub(r'\s+', ' ', sentence).strip()
@@ -176,118 +337,378 @@ def format_manual_answer(search_results: dict, question: str) -> str:
     return "\n".join(answer_parts)
 
 
+NOT_FOUND_ANSWER = (
+    "По вашему запросу не найдено информации в методических материалах. "
+    "Попробуйте переформулировать вопрос или обратитесь к администратору."
+)
+
+
+def build_qa_response(qa_results: list) -> ChatResponse:
+    """Формирует ответ из найденных готовых Q&A"""
+    if len(qa_results) == 1:
+        answer = qa_results[0].answer
+    else:
+        # Объединяем несколько ответов
+        answer_parts = ["Найдено несколько похожих вопросов:"]
+        for i, qa in enumerate(qa_results[:3], 1):  # Берем до 3 ответов
+            answer_parts.append(f"\n{i}. {qa.answer}")
+        answer = "\n".join(answer_parts)
+
+    sources = []
+    for qa in qa_results[:3]:
+        if qa.methodic:
+            sources.append(
+                MethodicSnippet(
+                    id=qa.methodic.id,
+                    title=qa.methodic.source_title or "Без названия",
+                    author=qa.methodic.author,
+                    content_snippet=f"Связанный вопрос: {qa.question[:150]}..."
+                )
+            )
+
+    return ChatResponse(
+        answer=answer,
+        sources=sources,
+        found_methodics=len(qa_results)
+    )
+
+
+def build_context_sources(search_results: dict) -> List[MethodicSnippet]:
+    """Источники ответа: самое релевантное предложение каждой найденной методички"""
+    sources = []
+    for ctx in search_results['methodic_contexts'][:5]:
+        methodic = ctx['methodic']
+
+        # Формируем осмысленный сниппет
+        if ctx['relevant_sentences']:
+            # Берем самое релевантное предложение
+            best_sentence = ctx['relevant_sentences'][0]
+            clean_sentence = re.sub(r'\s+', ' ', best_sentence).strip()
+            if len(clean_sentence) > 300:
+                clean_sentence = clean_sentence[:300] + "..."
+            snippet = clean_sentence
+        else:
+            # Полный текст не загружается (deferred), а без предложений методичка в контекст не попадает
+            snippet = ""
+
+        sources.append(
+            MethodicSnippet(
+                id=methodic.id,
+                title=methodic.source_title or "Без названия",
+                author=methodic.author,
+                content_snippet=snippet
+            )
+        )
+    return sources
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Одно событие Server-Sent Events с JSON-данными"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 # ------------------ MAIN LOGIC ------------------
+# Одновременные одинаковые вопросы к /chat выполняются один раз
+chat_flights = SingleFlight()
+
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat_with_methodics(
-        request: ChatRequest,
-        db: Session = Depends(get_db)
-):
+async def chat_with_methodics(request: ChatRequest):
     """
     Улучшенный алгоритм:
     1. Сначала ищем похожие вопросы в qa_entries
     2. Если найдены - возвращаем готовые ответы
     3. Если нет - ищем в methodic_entries и обрабатываем через Gemini
     4. Проверяем качество ответа от Gemini
+
+    Одновременные запросы с тем же вопросом (после нормализации) и max_results
+    ждут результат первого, а не запускают поиск и Gemini повторно.
+    """
+    flight_key = (normalize_question(request.question), request.max_results)
+    return await chat_flights.do(flight_key, lambda: run_chat_pipeline(request))
+
+
+async def run_chat_pipeline(request: ChatRequest) -> ChatResponse:
+    """
+    Полный цикл ответа на вопрос. Открывает собственную сессию БД:
+    результат может ждать несколько запросов, и он не должен зависеть от сессии одного из них.
     """
+    db = read_session()
+    try:
+        return await answer_question(db, request)
+    finally:
+        await db.close()
+
+
+async def answer_question(db: AsyncSession, request: ChatRequest) -> ChatResponse:
+    # Бюджет времени всего запроса: если Gemini не успевает, отвечаем по найденным фрагментам
+    deadline = Deadline(settings.CHAT_DEADLINE_SECONDS)
     print(f"\n{'=' * 50}")
     print(f"Вопрос: {request.question}")
 
     # --- Шаг 1: Ищем в базе готовых Q&A ---
-    qa_results = search_qa_entries(db, request.question, threshold=0.6, limit=request.max_results)
+    qa_results = await search_qa_entries_async(db, request.question, threshold=0.6, limit=request.max_results)
 
     if qa_results:
         print(f"Найдено {len(qa_results)} готовых ответов в Q&A")
+        CHAT_ANSWERS.inc(path="qa")
 
-        # Формируем ответ из Q&A
-        if len(qa_results) == 1:
-            answer = qa_results[0].answer
-        else:
-            # Объединяем несколько ответов
-            answer_parts = ["Найдено несколько похожих вопросов:"]
-            for i, qa in enumerate(qa_results[:3], 1):  # Берем до 3 ответов
-                answer_parts.append(f"\n{i}. {qa.answer}")
-            answer = "\n".join(answer_parts)
-
-
-        sources = []
-        for qa in qa_results[:3]:
-            if qa.methodic:
-                sources.append(
-                    MethodicSnippet(
-                        id=qa.methodic.id,
-                        title=qa.methodic.source_title or "Без названия",
-                        author=qa.methodic.author,
-                        content_snippet=f"Связанный вопрос: {qa.question[:150]}..."
-                    )
-                )
-
-        return ChatResponse(
-            answer=answer,
-            sources=sources,
-            found_methodics=len(qa_results)
-        )
+        return build_qa_response(qa_results)
 
     # --- Шаг 2: Ищем в полных текстах методичек ---
     print("Q&A не найдены, ищем в полных текстах...")
-    search_results = search_methodics_with_context(db, request.question, request.max_results)
+    search_results = await search_methodics_with_context_async(
+        db, request.question, request.max_results, qa_results=qa_results
+    )
 
     # Если ничего не найдено
     if not search_results['methodic_contexts']:
         print("Ничего не найдено в текстах методичек.")
-        answer = (
-            "По вашему запросу не найдено информации в методических материалах. "
-            "Попробуйте переформулировать вопрос или обратитесь к администратору."
-        )
-        return ChatResponse(answer=answer, sources=[], found_methodics=0)
+        CHAT_ANSWERS.inc(path="not_found")
+        return ChatResponse(answer=NOT_FOUND_ANSWER, sources=[], found_methodics=0)
 
     print(f"Найдено {len(search_results['methodic_contexts'])} релевантных методичек")
 
     # --- Шаг 3: Формируем контекст и отправляем в Gemini ---
-    context = format_context_for_prompt(search_results, request.question)  # Передаем вопрос
-    print(f"Длина контекста: {len(context)} символов")
+    with stage("prompt_format"):
+        packed = pack_context(search_results, request.question)
+    print(packed.summary())
+    context = packed.text
 
-    gemini_answer = call_gemini_api(request.question, context)
+    # Возвращаем соединение в пул на время ожидания Gemini:
+    # нужные поля методичек уже загружены, а удерживать соединение весь вызов незачем
+    await db.close()
 
-    # --- Шаг 4: Проверяем качество ответа Gemini ---
-    if gemini_answer and is_quality_answer(gemini_answer, request.question):
-        print("Gemini дал качественный ответ")
-        answer = gemini_answer
+    return await answer_from_context(request.question, search_results, context, deadline)
+
+
+async def answer_from_context(
+        question: str,
+        search_results: dict,
+        context: str,
+        deadline: Optional[Deadline] = None
+) -> ChatResponse:
+    """
+    Шаги 3-5: ответ Gemini (или из кэша), проверка качества и источники.
+    Пока автомат Gemini разомкнут, сразу формируется ответ вручную.
+    """
+    gemini_answer = get_cached_answer(question, context)
+    from_cache = gemini_answer is not None
+    prompt_tokens = None
+    if from_cache:
+        print("Ответ Gemini взят из кэша")
+    elif gemini_breaker.is_open():
+        print("Gemini недоступен (автомат разомкнут), формируем ответ вручную")
     else:
-        print("Gemini не дал качественного ответа, формируем вручную")
-        answer = format_manual_answer(search_results, request.question)
+        prompt_tokens = record_prompt_tokens(build_gemini_body(question, context))
+        with stage("gemini"):
+            gemini_answer = await call_gemini_api(question, context, deadline)
+        cache_answer(question, context, gemini_answer, search_results)
 
-    # --- Шаг 5: Формируем источники для ответа ---
-    sources = []
-    if search_results['methodic_contexts']:
-        for ctx in search_results['methodic_contexts'][:5]:
-            methodic = ctx['methodic']
-
-            # Формируем осмысленный сниппет
-            if ctx['relevant_sentences']:
-                # Берем самое релевантное предложение
-                best_sentence = ctx['relevant_sentences'][0]
-                clean_sentence = re.sub(r'\s+', ' ', best_sentence).strip()
-                if len(clean_sentence) > 300:
-                    clean_sentence = clean_sentence[:300] + "..."
-                snippet = clean_sentence
-            else:
-                snippet = methodic.methodic_text[:200] + "..." if methodic.methodic_text else ""
+    # --- Шаг 4: Проверяем качество ответа Gemini ---
+    with stage("answer_check"):
+        if gemini_answer and is_quality_answer(gemini_answer, question):
+            print("Gemini дал качественный ответ")
+            CHAT_ANSWERS.inc(path="llm_cache" if from_cache else "llm")
+            answer = gemini_answer
+        else:
+            print("Gemini не дал качественного ответа, формируем вручную")
+            CHAT_ANSWERS.inc(path="manual")
+            answer = format_manual_answer(search_results, question)
 
-            sources.append(
-                MethodicSnippet(
-                    id=methodic.id,
-                    title=methodic.source_title or "Без названия",
-                    author=methodic.author,
-                    content_snippet=snippet
-                )
-            )
+    # --- Шаг 5: Формируем источники для ответа ---
+    sources = build_context_sources(search_results)
 
     print(f"Ответ сформирован, источников: {len(sources)}")
 
     return ChatResponse(
         answer=answer,
         sources=sources,
-        found_methodics=len(search_results['methodic_contexts'])
+        found_methodics=len(search_results['methodic_contexts']),
+        prompt_tokens=prompt_tokens
+    )
+
+
+@app.post("/chat/batch")
+async def chat_with_methodics_batch(requests: List[ChatRequest]):
+    """
+    Пакетный вариант /chat для массовых прогонов.
+    Одинаковые вопросы (после нормализации) с тем же max_results обрабатываются один раз,
+    поиск по Q&A и методичкам выполняется для всего пакета сразу,
+    вызовы Gemini идут параллельно, но не более BATCH_LLM_CONCURRENCY одновременно.
+    Дедлайн CHAT_DEADLINE_SECONDS отсчитывается для каждого вопроса с момента его обращения к Gemini.
+    Ответ — NDJSON: по строке на каждый вопрос в порядке запроса.
+    """
+    if len(requests) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много вопросов в пакете (максимум {settings.BATCH_MAX_QUESTIONS})"
+        )
+
+    keys = [(normalize_question(request.question), request.max_results) for request in requests]
+    unique = {}
+    for key, request in zip(keys, requests):
+        unique.setdefault(key, request)
+    print(f"\n{'=' * 50}")
+    print(f"Пакет: {len(requests)} вопросов, уникальных: {len(unique)}")
+
+    db = read_session()
+    try:
+        unique_requests = list(unique.values())
+        questions = [request.question for request in unique_requests]
+        limits = [request.max_results for request in unique_requests]
+
+        # --- Шаг 1: Q&A для всего пакета ---
+        qa_batch = await search_qa_entries_batch_async(db, questions, limits)
+        responses = {}
+        pending = []
+        for key, request, qa_results in zip(unique, unique_requests, qa_batch):
+            if qa_results:
+                CHAT_ANSWERS.inc(path="qa")
+                responses[key] = build_qa_response(qa_results)
+            else:
+                pending.append((key, request))
+
+        # --- Шаг 2: полнотекстовый поиск для оставшихся вопросов ---
+        contexts = {}
+        if pending:
+            search_batch = await search_methodics_with_context_batch_async(
+                db,
+                [request.question for _, request in pending],
+                [request.max_results for _, request in pending],
+                qa_results=[[] for _ in pending]
+            )
+            for (key, request), search_results in zip(pending, search_batch):
+                if not search_results['methodic_contexts']:
+                    CHAT_ANSWERS.inc(path="not_found")
+                    responses[key] = ChatResponse(answer=NOT_FOUND_ANSWER, sources=[], found_methodics=0)
+                else:
+                    contexts[key] = (
+                        request.question,
+                        search_results,
+                        pack_context(search_results, request.question).text
+                    )
+    finally:
+        await db.close()
+
+    print(f"Готовых ответов: {len(responses)}, запросов к Gemini: {len(contexts)}")
+
+    # --- Шаг 3: Gemini с ограничением параллельности ---
+    semaphore = asyncio.Semaphore(settings.BATCH_LLM_CONCURRENCY)
+
+    async def limited_answer(question: str, search_results: dict, context: str) -> ChatResponse:
+        async with semaphore:
+            deadline = Deadline(settings.CHAT_DEADLINE_SECONDS)
+            return await answer_from_context(question, search_results, context, deadline)
+
+    tasks = {key: asyncio.ensure_future(limited_answer(*args)) for key, args in contexts.items()}
+
+    async def ndjson_lines():
+        try:
+            for index, (key, request) in enumerate(zip(keys, requests)):
+                response = responses[key] if key in responses else await tasks[key]
+                line = {"index": index, "question": request.question, **response.model_dump()}
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            # Клиент отключился — незачем ждать оставшиеся ответы Gemini
+            for task in tasks.values():
+                task.cancel()
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
+@app.post("/chat/stream")
+async def chat_with_methodics_stream(
+        request: ChatRequest,
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Потоковый вариант /chat (Server-Sent Events).
+    События: sources — сразу после поиска, token — фрагменты ответа Gemini,
+    answer — итоговый ответ (fallback=true, если он заменяет сгенерированный текст), done — конец потока.
+    """
+    deadline = Deadline(settings.CHAT_DEADLINE_SECONDS)
+    print(f"\n{'=' * 50}")
+    print(f"Вопрос (stream): {request.question}")
+
+    qa_results = await search_qa_entries_async(db, request.question, threshold=0.6, limit=request.max_results)
+    if qa_results:
+        CHAT_ANSWERS.inc(path="qa")
+        response = build_qa_response(qa_results)
+        events = [
+            sse_event("sources", {
+                "sources": [source.model_dump() for source in response.sources],
+                "found_methodics": response.found_methodics
+            }),
+            sse_event("answer", {"answer": response.answer, "fallback": False}),
+            sse_event("done", {})
+        ]
+        return StreamingResponse(iter(events), media_type="text/event-stream")
+
+    search_results = await search_methodics_with_context_async(
+        db, request.question, request.max_results, qa_results=qa_results
+    )
+    if not search_results['methodic_contexts']:
+        CHAT_ANSWERS.inc(path="not_found")
+        events = [
+            sse_event("sources", {"sources": [], "found_methodics": 0}),
+            sse_event("answer", {"answer": NOT_FOUND_ANSWER, "fallback": False}),
+            sse_event("done", {})
+        ]
+        return StreamingResponse(iter(events), media_type="text/event-stream")
+
+    with stage("prompt_format"):
+        packed = pack_context(search_results, request.question)
+    print(packed.summary())
+    context = packed.text
+    sources = build_context_sources(search_results)
+    await db.close()
+
+    async def event_stream():
+        yield sse_event("sources", {
+            "sources": [source.model_dump() for source in sources],
+            "found_methodics": len(search_results['methodic_contexts'])
+        })
+
+        gemini_answer = get_cached_answer(request.question, context)
+        from_cache = gemini_answer is not None
+        prompt_tokens = None
+        if from_cache:
+            yield sse_event("token", {"text": gemini_answer})
+        elif gemini_breaker.is_open():
+            print("Gemini недоступен (автомат разомкнут), формируем ответ вручную")
+        else:
+            parts = []
+            body = build_gemini_body(request.question, context)
+            prompt_tokens = record_prompt_tokens(body)
+            try:
+                with stage("gemini_stream"):
+                    async for chunk in stream_content(body, deadline):
+                        parts.append(chunk)
+                        yield sse_event("token", {"text": chunk})
+            except GeminiError as e:
+                # Поток не состоялся или оборван: уже отданные фрагменты заменяет ответ вручную
+                print(e)
+                gemini_answer = ""
+            else:
+                # В кэш (и в постоянный уровень) попадает только поток, завершившийся успешно;
+                # пустой ответ cache_answer пропускает
+                gemini_answer = "".join(parts).strip()
+                cache_answer(request.question, context, gemini_answer, search_results)
+        if gemini_answer and is_quality_answer(gemini_answer, request.question):
+            CHAT_ANSWERS.inc(path="llm_cache" if from_cache else "llm")
+            yield sse_event("answer", {"answer": gemini_answer, "fallback": False, "prompt_tokens": prompt_tokens})
+        else:
+            print("Gemini не дал качественного ответа, формируем вручную")
+            CHAT_ANSWERS.inc(path="manual")
+            manual_answer = format_manual_answer(search_results, request.question)
+            yield sse_event("answer", {"answer": manual_answer, "fallback": True, "prompt_tokens": prompt_tokens})
+        yield sse_event("done", {})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
@@ -295,15 +716,41 @@ async def chat_with_methodics(
 @app.get("/search", response_model=List[MethodicSnippet])
 async def search_methodics_endpoint(
         query: str = Query(..., description="Поисковый запрос"),
-        limit: int = Query(10, description="Максимальное количество результатов"),
-        db: Session = Depends(get_db)
+        limit: int = Query(10, ge=1, description="Максимальное количество результатов"),
+        cursor: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+        author: Optional[str] = Query(None, description="Только методички этого автора"),
+        if_none_match: Optional[str] = Header(None),
+        db: AsyncSession = Depends(get_db)
 ):
-    methodic_results = search_methodic_texts(db, query, limit)
+    """
+    Поиск по методичкам в порядке BM25. Если результатов больше limit, курсор следующей страницы
+    возвращается в заголовках X-Next-Cursor и Link (rel="next"); страницы по курсору
+    не пересчитывают предыдущие результаты.
+    """
+    if cursor:
+        try:
+            decode_cursor(cursor, query, author)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return await cached_json_response(
+        ("search", query, limit, cursor, author),
+        if_none_match,
+        lambda: search_methodic_snippets(db, query, limit, cursor, author),
+        with_headers=True
+    )
+
+
+async def search_methodic_snippets(db: AsyncSession, query: str, limit: int, cursor: Optional[str] = None,
+                                   author: Optional[str] = None) -> tuple:
+    methodic_results, next_cursor = await search_methodic_preview_page_async(
+        db, query, limit, cursor, author, preview_chars=200
+    )
 
     sources = []
-    for methodic in methodic_results:
-        preview = methodic.methodic_text[:200] + "..." if methodic.methodic_text and len(
-            methodic.methodic_text) > 200 else methodic.methodic_text
+    for methodic, preview, text_length in methodic_results:
+        if preview and text_length > 200:
+            preview += "..."
 
         sources.append(
             MethodicSnippet(
@@ -314,21 +761,103 @@ async def search_methodics_endpoint(
             )
         )
 
-    return sources
+    headers = {}
+    if next_cursor:
+        params = {'query': query, 'limit': limit, 'cursor': next_cursor}
+        if author is not None:
+            params['author'] = author
+        headers = {"X-Next-Cursor": next_cursor, "Link": f'</search?{urlencode(params)}>; rel="next"'}
+    return sources, headers
+
+
+@app.get("/search/facets", response_model=SearchFacets)
+async def search_facets_endpoint(
+        query: str = Query(..., description="Поисковый запрос"),
+        author: Optional[str] = Query(None, description="Только методички этого автора"),
+        limit: int = Query(10, ge=1, le=100, description="Количество значений каждого фасета"),
+        if_none_match: Optional[str] = Header(None),
+        db: AsyncSession = Depends(get_db)
+):
+    """Число найденных методичек и самые частые авторы и названия (агрегаты по индексу FTS5)"""
+    return await cached_json_response(
+        ("search_facets", query, author, limit),
+        if_none_match,
+        lambda: search_facets_async(db, query, limit, author)
+    )
 
 
 # ------------------ GET METHODIC BY ID ------------------
-@app.get("/methodics/{methodic_id}", response_model=MethodicSnippet)
-async def get_methodic(methodic_id: int, db: Session = Depends(get_db)):
-    methodic = db.query(MethodicEntry).filter(MethodicEntry.id == methodic_id).first()
-    if not methodic:
+@app.get("/methodics/{methodic_id}", response_model=MethodicDetail)
+async def get_methodic(
+        methodic_id: int,
+        snippet_chars: int = Query(1000, ge=0, le=20000, description="Длина фрагмента текста в символах"),
+        if_none_match: Optional[str] = Header(None),
+        db: AsyncSession = Depends(get_db)
+):
+    return await cached_json_response(
+        ("methodic", methodic_id, snippet_chars),
+        if_none_match,
+        lambda: methodic_detail(db, methodic_id, snippet_chars)
+    )
+
+
+async def methodic_detail(db: AsyncSession, methodic_id: int, snippet_chars: int) -> MethodicDetail:
+    found = await text_preview(db, methodic_id, snippet_chars)
+    if not found:
         raise HTTPException(status_code=404, detail="Методичка не найдена")
 
-    return MethodicSnippet(
+    methodic, preview, text_length = found
+    return MethodicDetail(
         id=methodic.id,
         title=methodic.source_title or "Без названия",
         author=methodic.author,
-        content_snippet=methodic.methodic_text or ""
+        content_snippet=preview + "..." if text_length > len(preview) else preview,
+        text_length=text_length,
+        text_url=f"/methodics/{methodic.id}/text"
+    )
+
+
+@app.get("/methodics/{methodic_id}/text")
+async def get_methodic_text(
+        methodic_id: int,
+        range_header: Optional[str] = Header(None, alias="Range"),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Полный текст методички (UTF-8) потоком по частям.
+    Поддерживает заголовок Range с одним диапазоном байт (bytes=0-999, bytes=1000-, bytes=-500).
+    """
+    size = await text_size(db, methodic_id)
+    if size is None:
+        raise HTTPException(status_code=404, detail="Методичка не найдена")
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        raise HTTPException(
+            status_code=416,
+            detail="Недопустимый диапазон",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    start, end = byte_range or (0, size - 1)
+
+    async def text_chunks():
+        # Собственная сессия: сессия запроса закрывается до отправки тела ответа
+        async with read_session() as session:
+            position = start
+            while position <= end:
+                length = min(settings.METHODIC_TEXT_CHUNK_BYTES, end - position + 1)
+                yield await read_text_bytes(session, methodic_id, position, length)
+                position += length
+
+    headers = {"Accept-Ranges": "bytes", "Content-Length": str(max(end - start + 1, 0))}
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        text_chunks(),
+        status_code=206 if byte_range else 200,
+        media_type="text/plain; charset=utf-8",
+        headers=headers
     )
 
 
@@ -338,9 +867,17 @@ async def search_qa(
         query: str = Query(..., description="Поисковый запрос"),
         threshold: float = Query(0.5, description="Порог схожести (0-1)"),
         limit: int = Query(5, description="Максимальное количество результатов"),
-        db: Session = Depends(get_db)
+        if_none_match: Optional[str] = Header(None),
+        db: AsyncSession = Depends(get_db)
 ):
-    qa_results = search_qa_entries(db, query, threshold, limit)
+    return await cached_json_response(
+        ("qa_search", query, threshold, limit), if_none_match, lambda: qa_search_results(db, query, threshold, limit)
+    )
+
+
+async def qa_search_results(db: AsyncSession, query: str, threshold: float, limit: int) -> dict:
+    # Поиск по смыслу не учитывает threshold и вернул бы вопросы ниже заданного порога
+    qa_results = await search_qa_entries_async(db, query, threshold, limit, semantic_fallback=False)
 
     results = []
     for qa in qa_results:
@@ -355,6 +892,47 @@ async def search_qa(
     return {"results": results, "count": len(results)}
 
 
+# ------------------ CACHE STATS ENDPOINT ------------------
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        **answer_cache.stats(),
+        'single_flight': dict(chat_flights.counters),
+        'responses': result_cache.stats()
+    }
+
+
+# ------------------ GEMINI STATUS ENDPOINT ------------------
+@app.get("/gemini/status")
+async def gemini_status_endpoint():
+    return gemini_status()
+
+
+# ------------------ HEALTH ENDPOINTS ------------------
+@app.get("/health/live")
+async def health_live():
+    """Процесс жив и обслуживает event loop"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    """Прогрев завершен: 200, иначе 503 с состоянием компонентов"""
+    return JSONResponse(readiness.snapshot(), status_code=200 if readiness.is_ready() else 503)
+
+
+# ------------------ SNAPSHOT STATUS ENDPOINT ------------------
+@app.get("/snapshot/status")
+async def snapshot_status_endpoint():
+    return corpus_snapshot.snapshot_status()
+
+
+# ------------------ METRICS ENDPOINT ------------------
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # ------------------ ROOT ENDPOINT ------------------
 @app.get("/")
 async def root():
@@ -363,9 +941,18 @@ async def root():
         "version": "3.1.0",
         "endpoints": [
             "POST /chat - Чат с поиском по Q&A и методичкам",
+            "POST /chat/stream - То же, с потоковым ответом (SSE)",
+            "POST /chat/batch - Пакет вопросов, ответы построчно в NDJSON",
             "GET /search - Поиск по методичкам",
             "GET /qa/search - Поиск по Q&A",
-            "GET /methodics/{id} - Получить методичку по ID"
+            "GET /methodics/{id} - Получить методичку по ID",
+            "GET /methodics/{id}/text - Полный текст методички (поддерживает Range)",
+            "GET /cache/stats - Статистика кэша ответов Gemini",
+            "GET /gemini/status - Состояние автомата и лимита вызовов Gemini",
+            "GET /health/live - Процесс жив",
+            "GET /health/ready - Прогрев завершен, можно принимать трафик",
+            "GET /snapshot/status - Снимок корпуса в памяти (SERVE_FROM_MEMORY)",
+            "GET /metrics - Метрики в формате Prometheus"
         ]
     }
 
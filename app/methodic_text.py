@@ -0,0 +1,73 @@
+import re
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import MethodicEntry
+from text_storage import text_preview_columns, preview_from_row, text_bytes_expr, extract_spans, read_bytes
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+async def text_preview(db: AsyncSession, methodic_id: int, chars: int):
+    """
+    Начало текста и полная длина в символах, вычисленные в SQL
+    (у сжатого текста распаковывается только первая часть).
+    Возвращает (methodic, preview, text_length) или None, если методички нет.
+    """
+    row = (await db.execute(
+        select(MethodicEntry, *text_preview_columns(chars)).where(MethodicEntry.id == methodic_id)
+    )).first()
+    if row is None:
+        return None
+    methodic, inline_preview, first_chunk, text_length = row
+    preview = preview_from_row(inline_preview, first_chunk, text_length, chars)
+    if preview is None:
+        spans = [(methodic_id, methodic_id, 0, chars)]
+        preview = (await db.run_sync(lambda session: extract_spans(session, spans)))[methodic_id]
+    return methodic, preview, text_length
+
+
+async def text_size(db: AsyncSession, methodic_id: int) -> Optional[int]:
+    """Размер текста в байтах UTF-8 или None, если методички нет"""
+    row = (await db.execute(
+        select(text_bytes_expr()).where(MethodicEntry.id == methodic_id)
+    )).first()
+    return row[0] if row else None
+
+
+async def read_text_bytes(db: AsyncSession, methodic_id: int, start: int, length: int) -> bytes:
+    """Фрагмент текста [start, start + length) в байтах UTF-8"""
+    return await db.run_sync(lambda session: read_bytes(session, methodic_id, start, length))
+
+
+def parse_range(header: Optional[str], size: int):
+    """
+    Разбирает заголовок Range (один диапазон bytes=...).
+    Возвращает (start, end) включительно или None, если заголовка нет.
+    """
+    if not header:
+        return None
+
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        raise RangeNotSatisfiable(header)
+
+    first, last = match.groups()
+    if first == '':
+        # bytes=-N: последние N байт
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - suffix, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, end
@@ -0,0 +1,178 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+# Длительности этапов текущего запроса для заголовка Server-Timing: [(stage, seconds), ...]
+request_timings: ContextVar[Optional[list]] = ContextVar("request_timings", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Монотонный счетчик в формате Prometheus"""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Текущее значение в формате Prometheus"""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def set(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами в формате Prometheus"""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # key -> [счетчики по корзинам..., count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state):
+                    labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                inf_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf_labels} {state[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-2]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+def render_metrics() -> str:
+    """Все метрики в текстовом формате Prometheus 0.0.4"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ------------------ МЕТРИКИ ПРИЛОЖЕНИЯ ------------------
+HTTP_REQUEST_SECONDS = Histogram(
+    "methodics_http_request_duration_seconds",
+    "Длительность HTTP-запросов",
+    ("method", "route", "status")
+)
+STAGE_SECONDS = Histogram(
+    "methodics_stage_duration_seconds",
+    "Длительность этапов обработки вопроса",
+    ("stage",)
+)
+CHAT_ANSWERS = Counter(
+    "methodics_chat_answers_total",
+    "Ответы /chat по источнику: qa, llm, llm_cache, manual, not_found",
+    ("path",)
+)
+GEMINI_REQUESTS = Counter(
+    "methodics_gemini_requests_total",
+    "Обращения к Gemini по результату: ok, http_error, timeout, error, "
+    "breaker_open, overloaded, deadline, retry",
+    ("method", "outcome")
+)
+GEMINI_BREAKER_STATE = Gauge(
+    "methodics_gemini_breaker_state",
+    "Состояние автомата Gemini: 0 — closed, 1 — half_open, 2 — open"
+)
+GEMINI_IN_FLIGHT = Gauge(
+    "methodics_gemini_in_flight",
+    "Выполняющиеся сейчас обращения к Gemini"
+)
+
+PROMPT_TOKENS = Histogram(
+    "methodics_prompt_tokens",
+    "Оценка числа токенов промпта, отправленного в Gemini",
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000, 8000)
+)
+
+
+@contextmanager
+def stage(name: str):
+    """Замеряет этап: гистограмма STAGE_SECONDS и Server-Timing текущего запроса"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def server_timing_header(timings: list) -> str:
+    """Значение заголовка Server-Timing; повторяющиеся этапы суммируются"""
+    totals = {}
+    for name, elapsed in timings:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    return ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in totals.items())
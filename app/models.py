@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, LargeBinary
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -10,9 +10,12 @@ class MethodicEntry(Base):
     __tablename__ = "methodic_entries"
 
     id = Column(Integer, primary_key=True)
-    author = Column(Text, nullable=True)
+    # Индекс нужен фильтру по автору в /search и /search/facets
+    author = Column(Text, nullable=True, index=True)
     source_title = Column(Text, nullable=True)
-    methodic_text = Column(Text, nullable=True)
+    # Полный текст загружается только по явному обращению: для поиска и превью он не нужен.
+    # У сжатых методичек NULL, текст хранится в methodic_text_chunks (см. text_storage)
+    methodic_text = deferred(Column(Text, nullable=True))
 
     qa_pairs = relationship("QAEntry", back_populates="methodic", cascade="all, delete-orphan")
 
@@ -31,4 +34,75 @@ class QAEntry(Base):
     methodic = relationship("MethodicEntry", back_populates="qa_pairs")
 
     def __repr__(self):
-        return f"<QAEntry id={self.id} question={self.question[:50]}...>"
\ No newline at end of file
+        return f"<QAEntry id={self.id} question={self.question[:50]}...>"
+
+class QANgram(Base):
+    """Постинг триграммного индекса по нормализованным вопросам qa_entries"""
+    __tablename__ = "qa_ngrams"
+
+    gram = Column(String(3), primary_key=True)
+    qa_id = Column(Integer, ForeignKey('qa_entries.id', ondelete="CASCADE"), primary_key=True, index=True)
+    doc_len = Column(Integer, nullable=False)
+    doc_grams = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<QANgram gram={self.gram!r} qa_id={self.qa_id}>"
+
+
+class MethodicSentence(Base):
+    """Предложение методички, выделенное при сохранении текста"""
+    __tablename__ = "methodic_sentences"
+
+    id = Column(Integer, primary_key=True)
+    methodic_id = Column(Integer, ForeignKey('methodic_entries.id', ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    start_offset = Column(Integer, nullable=False)
+    end_offset = Column(Integer, nullable=False)
+    # Номера терминов предложения (text_normalization.encode_term_ids), uint32 подряд
+    token_ids = Column(LargeBinary, nullable=True)
+    word_count = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<MethodicSentence methodic_id={self.methodic_id} position={self.position}>"
+
+
+class MethodicTextChunk(Base):
+    """Сжатая zlib часть текста методички со смещениями в символах и байтах UTF-8"""
+    __tablename__ = "methodic_text_chunks"
+
+    methodic_id = Column(Integer, ForeignKey('methodic_entries.id', ondelete="CASCADE"), primary_key=True)
+    chunk_no = Column(Integer, primary_key=True)
+    char_start = Column(Integer, nullable=False)
+    char_length = Column(Integer, nullable=False)
+    byte_start = Column(Integer, nullable=False)
+    byte_length = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return f"<MethodicTextChunk methodic_id={self.methodic_id} chunk_no={self.chunk_no}>"
+
+
+class IngestProgress(Base):
+    """Сколько записей источника уже загружено (для продолжения прерванной загрузки)"""
+    __tablename__ = "ingest_progress"
+
+    source = Column(Text, primary_key=True)
+    records = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<IngestProgress source={self.source} records={self.records}>"
+
+
+class CorpusGeneration(Base):
+    """
+    Номер поколения корпуса (одна строка id=1): увеличивается при каждой записи
+    в methodic_entries и qa_entries (триггеры, см. corpus_generation)
+    """
+    __tablename__ = "corpus_generation"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<CorpusGeneration value={self.value}>"
@@ -0,0 +1,145 @@
+# app/parallel_scoring.py
+"""
+Параллельная оценка кандидатов для тяжелых запросов: выбор предложений методичек
+и сравнение вопроса с кандидатами Q&A делятся на части и выполняются в пуле воркеров.
+
+Режим задается SEARCH_WORKERS_MODE:
+- off — все считается в потоке запроса (по умолчанию);
+- thread — пул потоков (дает выигрыш на сборках Python без GIL);
+- process — пул процессов (spawn), в воркеры передаются только строки и числа, без ORM-объектов;
+- auto — thread, если GIL выключен, иначе process.
+
+Число воркеров — SEARCH_WORKERS (0 — по числу ядер). Небольшие запросы не делятся:
+передача данных в процесс дороже самой оценки (пороги SEARCH_PARALLEL_MIN_*).
+Вызванные из AsyncSession.run_sync функции ждут воркеры через await_only,
+поэтому event loop в это время обслуживает другие запросы. Без пула (и для небольших
+запросов) оценка внутри run_sync все равно уходит с event loop в поток (offload).
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+
+from config import settings
+from scoring import rank_sentence_groups, qa_similarities
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def gil_enabled() -> bool:
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled() if is_gil_enabled else True
+
+
+def resolved_mode() -> str:
+    mode = settings.SEARCH_WORKERS_MODE
+    if mode == "auto":
+        return "process" if gil_enabled() else "thread"
+    return mode
+
+
+def worker_count() -> int:
+    return settings.SEARCH_WORKERS or os.cpu_count() or 1
+
+
+def get_executor():
+    """Пул воркеров (создается при первом обращении) или None в режиме off"""
+    global _executor
+    mode = resolved_mode()
+    if mode == "off":
+        return None
+    with _executor_lock:
+        if _executor is None:
+            if mode == "process":
+                # spawn: дочерние процессы не наследуют event loop, соединения с БД и потоки aiosqlite
+                _executor = ProcessPoolExecutor(
+                    max_workers=worker_count(),
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                _executor = ThreadPoolExecutor(max_workers=worker_count(), thread_name_prefix="scoring")
+            print(f"Пул оценки кандидатов: {mode}, воркеров {worker_count()}")
+    return _executor
+
+
+def warm_up():
+    """Запускает воркеры заранее, чтобы первый тяжелый запрос не ждал старта процессов"""
+    executor = get_executor()
+    if executor is not None:
+        for future in [executor.submit(qa_similarities, "", [], 1.0) for _ in range(worker_count())]:
+            future.result()
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def split_balanced(items: list, weights: list, parts: int) -> list:
+    """Делит список на не более чем parts непрерывных частей с примерно равным суммарным весом"""
+    total = sum(weights)
+    target = total / parts if parts else total
+    chunks, current, current_weight = [], [], 0
+    for item, weight in zip(items, weights):
+        current.append(item)
+        current_weight += weight
+        if current_weight >= target and len(chunks) < parts - 1:
+            chunks.append(current)
+            current, current_weight = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def run_parts(fn, arguments: list) -> list:
+    """Выполняет fn(*args) для каждого набора аргументов в пуле и возвращает результаты по порядку"""
+    executor = get_executor()
+    if in_greenlet():
+        # Внутри run_sync: ждем воркеры, не занимая event loop
+        loop = asyncio.get_running_loop()
+        return await_only(asyncio.gather(*(loop.run_in_executor(executor, fn, *args) for args in arguments)))
+    return [future.result() for future in [executor.submit(fn, *args) for args in arguments]]
+
+
+def offload(fn, *args):
+    """
+    fn(*args) вне event loop: внутри run_sync — в потоке через asyncio.to_thread
+    (event loop тем временем обслуживает другие запросы), в синхронном коде — обычный вызов.
+    """
+    if in_greenlet():
+        return await_only(asyncio.to_thread(fn, *args))
+    return fn(*args)
+
+
+def rank_sentence_groups_parallel(groups: list, keyword_ids: list, max_sentences: int = 3) -> list:
+    """
+    То же, что scoring.rank_sentence_groups, но группы (методички) распределяются по воркерам.
+    Результат совпадает с последовательным: каждая группа оценивается независимо.
+    """
+    sizes = [len(group) for group in groups]
+    if (get_executor() is None or len(groups) < 2
+            or sum(sizes) < settings.SEARCH_PARALLEL_MIN_SENTENCES):
+        return offload(rank_sentence_groups, groups, keyword_ids, max_sentences)
+
+    chunks = split_balanced(groups, sizes, worker_count())
+    ranked = run_parts(rank_sentence_groups, [(chunk, keyword_ids, max_sentences) for chunk in chunks])
+    return [best for part in ranked for best in part]
+
+
+def qa_similarities_parallel(question_clean: str, candidates: list, threshold: float) -> list:
+    """То же, что scoring.qa_similarities, с делением кандидатов между воркерами"""
+    if get_executor() is None or len(candidates) < settings.SEARCH_PARALLEL_MIN_QA:
+        return offload(qa_similarities, question_clean, candidates, threshold)
+
+    chunks = split_balanced(candidates, [len(text) for _, text in candidates], worker_count())
+    scored = run_parts(qa_similarities, [(question_clean, chunk, threshold) for chunk in chunks])
+    return [item for part in scored for item in part]
@@ -0,0 +1,145 @@
+import math
+
+from sqlalchemy import event, func, inspect, select, delete, insert
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import QAEntry, QANgram
+from text_normalization import words
+
+NGRAM_SIZE = 3
+
+# Служебная запись индекса: у каждого проиндексированного вопроса ровно одна строка с этим gram.
+# По ней перечисляются все вопросы с длинами (точный отбор по длине) и находятся вопросы,
+# проиндексированные старым форматом; при изменении формата постингов меняется версия в метке
+INDEX_MARK = "\x0003"
+
+# Границы вопроса: короткие вопросы тоже получают триграммы, начало и конец слов различаются
+PADDING = "  "
+
+
+def normalize_question(text: str) -> str:
+    """
+    Приводит вопрос к виду, в котором он сравнивается и индексируется:
+    та же нормализация, что в FTS и оценке предложений (text_normalization.fold), без знаков препинания
+    """
+    return " ".join(words(text))
+
+
+def question_ngrams(question_clean: str) -> set:
+    """Множество символьных триграмм нормализованного вопроса с границами"""
+    padded = PADDING + question_clean + PADDING[0]
+    return {
+        padded[i:i + NGRAM_SIZE]
+        for i in range(len(padded) - NGRAM_SIZE + 1)
+    }
+
+
+def _index_rows(qa_id: int, question: str) -> list:
+    question_clean = normalize_question(question)
+    grams = question_ngrams(question_clean)
+    return [
+        {
+            'gram': gram,
+            'qa_id': qa_id,
+            'doc_len': len(question_clean),
+            'doc_grams': len(grams)
+        }
+        for gram in [INDEX_MARK, *grams]
+    ]
+
+
+def index_qa_entry(connection, qa_id: int, question: str):
+    """Перестраивает постинги одной записи Q&A"""
+    connection.execute(delete(QANgram).where(QANgram.qa_id == qa_id))
+    rows = _index_rows(qa_id, question)
+    if rows:
+        connection.execute(insert(QANgram), rows)
+
+
+def index_new_qa_entries(connection, entries: list):
+    """Индексирует новые записи Q&A одним executemany: entries — пары (qa_id, question)"""
+    rows = [row for qa_id, question in entries for row in _index_rows(qa_id, question)]
+    if rows:
+        connection.execute(insert(QANgram), rows)
+
+
+def sync_qa_index(db: Session) -> int:
+    """
+    Дозаполняет индекс для записей, добавленных в обход ORM или проиндексированных
+    старым форматом, и удаляет постинги удаленных записей. Возвращает число проиндексированных вопросов.
+    """
+    indexed_ids = select(QANgram.qa_id).where(QANgram.gram == INDEX_MARK)
+    missing = db.query(QAEntry.id, QAEntry.question).filter(QAEntry.id.not_in(indexed_ids)).all()
+
+    connection = db.connection()
+    for qa_id, question in missing:
+        index_qa_entry(connection, qa_id, question)
+
+    connection.execute(delete(QANgram).where(QANgram.qa_id.not_in(select(QAEntry.id))))
+    db.commit()
+    return len(missing)
+
+
+def find_qa_candidates(db: Session, question_clean: str, threshold: float):
+    """
+    Возвращает id вопросов-кандидатов для точного сравнения
+    или None, если индекс не может сузить выборку (тогда нужен полный перебор).
+
+    Отбор по длине без потерь: ratio SequenceMatcher не превышает 2*min(a, b)/(a + b).
+    Он почти ничего не отсекает, поэтому по умолчанию (QA_NGRAM_DICE_FACTOR > 0) кандидат
+    должен еще иметь коэффициент Дайса по триграммам не ниже threshold * QA_NGRAM_DICE_FACTOR.
+    Этот отбор эвристический: из ratio не следует оценка снизу для коэффициента Дайса,
+    и редкий похожий вопрос может быть отброшен (полнота измерена, см. config.py).
+    QA_NGRAM_DICE_FACTOR = 0 оставляет только отбор по длине.
+    """
+    if threshold <= 0:
+        return None
+    if threshold > 1:
+        return []
+
+    query_len = len(question_clean)
+    min_len = math.ceil(query_len * threshold / (2 - threshold) - 1e-9)
+    max_len = math.floor(query_len * (2 - threshold) / threshold + 1e-9)
+
+    if settings.QA_NGRAM_DICE_FACTOR <= 0:
+        rows = (
+            db.query(QANgram.qa_id)
+            .filter(QANgram.gram == INDEX_MARK)
+            .filter(QANgram.doc_len.between(min_len, max_len))
+            .all()
+        )
+        return [row[0] for row in rows]
+
+    grams = question_ngrams(question_clean)
+    rows = (
+        db.query(QANgram.qa_id, func.count(QANgram.gram), QANgram.doc_grams)
+        .filter(QANgram.gram.in_(grams))
+        .filter(QANgram.doc_len.between(min_len, max_len))
+        .group_by(QANgram.qa_id, QANgram.doc_grams)
+        .all()
+    )
+
+    min_dice = threshold * settings.QA_NGRAM_DICE_FACTOR
+    return [
+        qa_id
+        for qa_id, shared, doc_grams in rows
+        if 2 * shared / (len(grams) + doc_grams) >= min_dice
+    ]
+
+
+# ------------------ ИНКРЕМЕНТАЛЬНОЕ ОБНОВЛЕНИЕ ------------------
+@event.listens_for(QAEntry, "after_insert")
+def _on_qa_insert(mapper, connection, target):
+    index_qa_entry(connection, target.id, target.question)
+
+
+@event.listens_for(QAEntry, "after_update")
+def _on_qa_update(mapper, connection, target):
+    if inspect(target).attrs.question.history.has_changes():
+        index_qa_entry(connection, target.id, target.question)
+
+
+@event.listens_for(QAEntry, "after_delete")
+def _on_qa_delete(mapper, connection, target):
+    connection.execute(delete(QANgram).where(QANgram.qa_id == target.id))
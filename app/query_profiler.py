@@ -0,0 +1,196 @@
+"""
+Профилирование SQL по запросам: число выражений, строк, байт и время в БД.
+
+Строки и байты считаются на уровне курсора DBAPI, поэтому учитываются любые выражения:
+ORM, Core и text() (FTS5, чтение частей сжатых текстов), а не только ORM-запросы.
+
+Включается настройкой SQL_PROFILING_ENABLED. Тогда каждый ответ получает заголовок
+X-DB-Profile, а в лог пишется строка со статистикой; превышение бюджета из ENDPOINT_QUERY_BUDGETS
+отмечается в логе.
+
+Для тестов:
+    with query_budget(statements=3):
+        search_qa_entries(db, "вопрос")
+
+    response = client.get("/search", params={"query": "..."})
+    assert_query_budget(response, ENDPOINT_QUERY_BUDGETS["GET /search"])
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = "X-DB-Profile"
+
+# Статистика текущего запроса; None — профилирование выключено
+current_stats: ContextVar[Optional["QueryStats"]] = ContextVar("query_stats", default=None)
+
+
+@dataclass
+class QueryStats:
+    statements: int = 0
+    rows: int = 0
+    bytes: int = 0
+    db_time: float = 0.0
+    sql: list = field(default_factory=list)
+
+    def header_value(self) -> str:
+        return (
+            f"statements={self.statements}; rows={self.rows}; "
+            f"bytes={self.bytes}; time_ms={self.db_time * 1000:.1f}"
+        )
+
+
+@dataclass
+class QueryBudget:
+    """Допустимые затраты на запрос; None — без ограничения"""
+    statements: int
+    rows: Optional[int] = None
+    bytes: Optional[int] = None
+
+    def violations(self, stats: dict) -> list:
+        problems = []
+        for name in ('statements', 'rows', 'bytes'):
+            limit = getattr(self, name)
+            if limit is not None and stats[name] > limit:
+                problems.append(f"{name}: {stats[name]} > {limit}")
+        return problems
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# Бюджеты эндпоинтов: "МЕТОД маршрут" -> QueryBudget (с учетом режимов semantic/hybrid)
+# Кэшируемые эндпоинты (response_cache) дополнительно раз в CORPUS_GENERATION_CHECK_INTERVAL
+# перечитывают поколение корпуса — это еще одно выражение
+ENDPOINT_QUERY_BUDGETS = {
+    "GET /search": QueryBudget(statements=3),
+    "GET /search/facets": QueryBudget(statements=3),
+    "GET /methodics/{methodic_id}": QueryBudget(statements=3),
+    "GET /methodics/{methodic_id}/text": QueryBudget(statements=1),
+    "GET /qa/search": QueryBudget(statements=5),
+    "POST /chat": QueryBudget(statements=7),
+    "POST /chat/stream": QueryBudget(statements=7),
+}
+
+
+# ------------------ СБОР СТАТИСТИКИ ------------------
+def _value_bytes(value) -> int:
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if value is None:
+        return 0
+    return 8
+
+
+def _row_bytes(row) -> int:
+    return sum(_value_bytes(value) for value in row)
+
+
+class _CountingCursor:
+    """Обертка курсора DBAPI: считает полученные строки и их размер в статистику запроса"""
+
+    def __init__(self, cursor, stats: QueryStats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _count(self, rows):
+        self._stats.rows += len(rows)
+        self._stats.bytes += sum(_row_bytes(row) for row in rows)
+        return rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._count([row])
+        return row
+
+    def fetchmany(self, *args):
+        return self._count(self._cursor.fetchmany(*args))
+
+    def fetchall(self):
+        return self._count(self._cursor.fetchall())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    if stats is None:
+        return
+    started = conn.info["query_started"].pop()
+    stats.statements += 1
+    stats.db_time += time.perf_counter() - started
+    stats.sql.append(" ".join(statement.split())[:200])
+    # Результат читается через context.cursor: подменяем его оберткой, считающей строки
+    if context is not None and cursor.description is not None:
+        context.cursor = _CountingCursor(cursor, stats)
+
+
+def install():
+    """
+    Подключает обработчики событий ко всем движкам (в том числе к движкам снимков корпуса,
+    создаваемым позже). Повторный вызов ничего не делает.
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def profile_queries():
+    """Собирает статистику SQL внутри блока"""
+    stats = QueryStats()
+    token = current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+
+
+# ------------------ ПРОВЕРКА БЮДЖЕТА ------------------
+def parse_profile_header(value: str) -> dict:
+    parts = dict(part.strip().split("=", 1) for part in value.split(";") if "=" in part)
+    return {
+        'statements': int(parts['statements']),
+        'rows': int(parts['rows']),
+        'bytes': int(parts['bytes']),
+        'time_ms': float(parts['time_ms'])
+    }
+
+
+@contextmanager
+def query_budget(statements: int, rows: Optional[int] = None, bytes: Optional[int] = None):
+    """Падает с QueryBudgetExceeded, если код внутри блока превысил бюджет"""
+    budget = QueryBudget(statements, rows, bytes)
+    install()
+    with profile_queries() as stats:
+        yield stats
+    problems = budget.violations(stats.__dict__)
+    if problems:
+        raise QueryBudgetExceeded(
+            "Превышен бюджет SQL: " + ", ".join(problems) + "\n" + "\n".join(stats.sql)
+        )
+
+
+def assert_query_budget(response, budget: QueryBudget):
+    """Проверяет ответ приложения (заголовок X-DB-Profile) на соответствие бюджету"""
+    value = response.headers.get(PROFILE_HEADER)
+    if value is None:
+        raise QueryBudgetExceeded(f"Нет заголовка {PROFILE_HEADER}: включите SQL_PROFILING_ENABLED")
+    problems = budget.violations(parse_profile_header(value))
+    if problems:
+        raise QueryBudgetExceeded("Превышен бюджет SQL: " + ", ".join(problems))
@@ -0,0 +1,50 @@
+# app/readiness.py
+"""
+Прогрев при старте и готовность к приему трафика.
+
+Схема базы создается синхронно в on_startup, а тяжелые шаги (снимок корпуса в памяти,
+открытие и прогрев семантического индекса, запуск пула воркеров) выполняются в фоне.
+Пока они идут, процесс уже отвечает: /health/live — 200, /health/ready — 503;
+балансировщик переводит трафик на процесс только после готовности.
+"""
+import time
+from contextlib import asynccontextmanager
+
+
+class Readiness:
+    PENDING = "pending"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.components = {}
+        self.finished = False
+
+    def expect(self, *names: str):
+        for name in names:
+            self.components[name] = {'state': self.PENDING}
+
+    @asynccontextmanager
+    async def step(self, name: str):
+        """Шаг прогрева: время и результат записываются в состояние компонента"""
+        started = time.perf_counter()
+        component = self.components.setdefault(name, {'state': self.PENDING})
+        try:
+            yield component
+        except Exception as e:
+            component.update(state=self.FAILED, error=str(e))
+            print(f"⚠️ Прогрев {name} не удался: {e}")
+        else:
+            component['state'] = self.READY
+        component['seconds'] = round(time.perf_counter() - started, 3)
+
+    def is_ready(self) -> bool:
+        return self.finished and all(c['state'] == self.READY for c in self.components.values())
+
+    def snapshot(self) -> dict:
+        return {
+            'status': "ready" if self.is_ready() else ("failed" if self.finished else "starting"),
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'components': self.components
+        }
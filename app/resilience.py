@@ -0,0 +1,147 @@
+# app/resilience.py
+"""
+Защита от медленного или недоступного внешнего сервиса:
+- Deadline — бюджет времени запроса, из которого берутся таймауты попыток;
+- CircuitBreaker — после серии отказов сразу возвращает отказ, пока сервис не восстановится;
+- ConcurrencyLimiter — ограничение одновременных обращений с ожиданием слота не дольше таймаута;
+- backoff_delay — пауза перед повтором (экспоненциальная, со случайным разбросом).
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+
+class Overloaded(Exception):
+    """Свободный слот не появился за отведенное время"""
+
+
+class Deadline:
+    """Момент, к которому запрос должен быть завершен; seconds=None — без ограничения"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return math.inf
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    """
+    Автомат: closed — вызовы разрешены; после failure_threshold отказов подряд — open,
+    вызовы сразу отклоняются reset_timeout секунд; затем half_open — пропускается один пробный
+    вызов, успех замыкает автомат, отказ снова размыкает.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, on_change=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_change = on_change
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.counters = {'rejected': 0, 'opened': 0}
+
+    def _set_state(self, state: str):
+        if state != self._state:
+            print(f"Автомат {self.name}: {self._state} -> {state}")
+            self._state = state
+            if self.on_change:
+                self.on_change(state)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+            return self._state
+
+    def is_open(self) -> bool:
+        """Вызовы сейчас точно будут отклонены (пробный вызов полуоткрытого автомата не расходуется)"""
+        return self.state == self.OPEN
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов; в half_open разрешает только один пробный вызов"""
+        state = self.state
+        with self._lock:
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.counters['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self.counters['opened'] += 1
+                self._set_state(self.OPEN)
+
+    def release(self):
+        """Вызов завершился без результата (отмена, нет слота): пробный вызов можно повторить"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        state = self.state
+        with self._lock:
+            return {'state': state, 'consecutive_failures': self._failures, **self.counters}
+
+
+class ConcurrencyLimiter:
+    """Не более limit одновременных вызовов; ожидание слота ограничено таймаутом"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.rejected = 0
+        self._semaphore = None
+
+    @asynccontextmanager
+    async def slot(self, timeout: float):
+        # Семафор создается внутри работающего event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if self._semaphore.locked():
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=max(timeout, 0.0))
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Overloaded(f"нет свободного слота за {timeout:.1f} с")
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Пауза перед повтором номер attempt (с 0): full jitter, равномерно в [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
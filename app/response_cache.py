@@ -0,0 +1,104 @@
+# app/response_cache.py
+"""
+Кэш ответов эндпоинтов чтения (/search, /search/facets, /qa/search, /methodics/{id}) с ETag.
+
+Ключ — маршрут с параметрами запроса и поколение корпуса (corpus_generation):
+после любой записи в корпус старые записи просто перестают находиться и вытесняются по LRU.
+Тело хранится уже сериализованным в JSON, повторный запрос не пересчитывает и не сериализует результат.
+
+ETag строгий и зависит только от поколения и ключа, поэтому одинаков во всех процессах
+и известен до вычисления результата: на If-None-Match с тем же значением сразу отвечаем 304.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from config import settings
+from corpus_generation import current_generation
+
+
+class ResultCache:
+    """LRU сериализованных ответов с ограничением по числу записей и объему"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (body, headers)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'not_modified': 0, 'evictions': 0}
+
+    def get(self, key) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry
+
+    def put(self, key, body: bytes, headers: dict = None):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[key] = (body, headers or {})
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.counters['evictions'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counters, 'entries': len(self._entries), 'bytes': self._bytes}
+
+
+result_cache = ResultCache(settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_MAX_BYTES)
+
+
+def make_etag(generation: int, key: tuple) -> str:
+    digest = hashlib.sha256(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()[:20]
+    return f'"g{generation}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # "*" не поддерживается: ETag известен до проверки, существует ли ресурс
+    return etag in [value.strip() for value in if_none_match.split(",")]
+
+
+async def cached_json_response(key: tuple, if_none_match: Optional[str], compute,
+                               with_headers: bool = False) -> Response:
+    """
+    JSON-ответ для ключа key (маршрут и параметры): 304, если ETag клиента совпал,
+    иначе тело из кэша или результат await compute(). Исключения compute (например, 404) не кэшируются.
+    with_headers=True — compute возвращает (result, headers); заголовки (например, Link следующей страницы)
+    кэшируются вместе с телом.
+    """
+    generation = await current_generation()
+    etag = make_etag(generation, key)
+    headers = {"ETag": etag, "Cache-Control": settings.RESPONSE_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        result_cache.counters['not_modified'] += 1
+        return Response(status_code=304, headers=headers)
+
+    cache_key = (generation, key)
+    entry = result_cache.get(cache_key) if settings.RESPONSE_CACHE_ENABLED else None
+    if entry is None:
+        result, extra_headers = await compute() if with_headers else (await compute(), {})
+        body = json.dumps(jsonable_encoder(result), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if settings.RESPONSE_CACHE_ENABLED:
+            result_cache.put(cache_key, body, extra_headers)
+    else:
+        body, extra_headers = entry
+    return Response(content=body, media_type="application/json", headers={**headers, **extra_headers})
@@ -0,0 +1,127 @@
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from text_normalization import TERM_ID_DTYPE, stem, fold, term_id
+
+# Тематические слова (можно расширить); сравниваются основы, поэтому подходят любые формы слов
+THEMATIC_WORDS = (
+    'студент', 'обучение', 'преподаватель', 'преподавание', 'образование',
+    'метод', 'методика', 'технология'
+)
+THEMATIC_IDS = tuple(dict.fromkeys(term_id(stem(fold(word))) for word in THEMATIC_WORDS))
+
+KEYWORD_WEIGHT = 3
+THEMATIC_WEIGHT = 1
+LENGTH_BONUS = 1
+# Предпочитаем предложения средней длины
+PREFERRED_WORD_COUNT = (10, 30)
+
+
+class SentenceBatch:
+    """
+    Предложения нескольких методичек, собранные в один массив номеров терминов для пакетной оценки.
+    groups — список групп [(key, token_ids, word_count), ...] в порядке следования в тексте,
+    token_ids — номера терминов предложения (text_normalization.encode_term_ids).
+    """
+
+    def __init__(self, groups: list):
+        self.keys = []
+        self.group_bounds = []
+        blobs = []
+        word_counts = []
+
+        for group in groups:
+            group_start = len(self.keys)
+            for key, token_ids, word_count in group:
+                self.keys.append(key)
+                blobs.append(token_ids or b"")
+                word_counts.append(word_count)
+            self.group_bounds.append((group_start, len(self.keys)))
+
+        self.size = len(self.keys)
+        self.word_counts = np.asarray(word_counts, dtype=np.int64)
+
+        item = TERM_ID_DTYPE.itemsize
+        lengths = np.fromiter((len(blob) // item for blob in blobs), dtype=np.int64, count=self.size)
+        self.terms = np.frombuffer(b"".join(blobs), dtype=TERM_ID_DTYPE)
+        # Номер предложения для каждого термина
+        self.owners = np.repeat(np.arange(self.size, dtype=np.int64), lengths)
+
+    def term_hits(self, term_ids) -> np.ndarray:
+        """Матрица (термины x предложения): есть ли термин в предложении; term_ids без повторов"""
+        hits = np.zeros((len(term_ids), self.size), dtype=bool)
+        if not len(term_ids) or not self.terms.size:
+            return hits
+        wanted = np.asarray(term_ids, dtype=TERM_ID_DTYPE)
+        order = np.argsort(wanted)
+        ordered = wanted[order]
+        positions = np.searchsorted(ordered, self.terms)
+        positions[positions == len(ordered)] = 0
+        matched = ordered[positions] == self.terms
+        hits[order[positions[matched]], self.owners[matched]] = True
+        return hits
+
+
+def score_batch(batch: SentenceBatch, keyword_ids: list) -> np.ndarray:
+    """Оценки релевантности всех предложений пакета"""
+    scores = KEYWORD_WEIGHT * batch.term_hits(keyword_ids).sum(axis=0, dtype=np.int64)
+    scores += THEMATIC_WEIGHT * batch.term_hits(THEMATIC_IDS).sum(axis=0, dtype=np.int64)
+
+    low, high = PREFERRED_WORD_COUNT
+    scores += LENGTH_BONUS * ((batch.word_counts >= low) & (batch.word_counts <= high))
+    return scores
+
+
+def top_sentences_per_group(batch: SentenceBatch, scores: np.ndarray, max_sentences: int = 3) -> list:
+    """
+    Для каждой группы возвращает ключи лучших предложений с ненулевой оценкой.
+    Порядок: оценка по убыванию, затем более короткие, затем более ранние предложения.
+    """
+    if batch.size == 0 or max_sentences <= 0:
+        return [[] for _ in batch.group_bounds]
+
+    # Составной ключ сортировки: чем меньше, тем лучше. Индекс в пакете уникален, поэтому ничьих нет.
+    span = np.int64(batch.size)
+    word_span = np.int64(batch.word_counts.max() + 1)
+    order_key = -scores * (word_span * span) + batch.word_counts * span + np.arange(batch.size, dtype=np.int64)
+
+    result = []
+    for start, end in batch.group_bounds:
+        candidates = np.flatnonzero(scores[start:end] > 0) + start
+        if candidates.size > max_sentences:
+            best = np.argpartition(order_key[candidates], max_sentences - 1)[:max_sentences]
+            candidates = candidates[best]
+        candidates = candidates[np.argsort(order_key[candidates])]
+        result.append([batch.keys[i] for i in candidates])
+    return result
+
+
+def rank_sentence_groups(groups: list, keyword_ids: list, max_sentences: int = 3) -> list:
+    """Оценивает все группы одним пакетом и возвращает ключи лучших предложений каждой группы"""
+    batch = SentenceBatch(groups)
+    scores = score_batch(batch, keyword_ids)
+    return top_sentences_per_group(batch, scores, max_sentences)
+
+
+def calculate_similarity(text1: str, text2: str) -> float:
+    """Вычисляет схожесть двух текстов от 0 до 1"""
+    return SequenceMatcher(None, text1.lower(), text2.lower()).ratio()
+
+
+def qa_similarities(question_clean: str, candidates: list, threshold: float) -> list:
+    """
+    Схожесть вопроса с нормализованными вопросами Q&A.
+    candidates — [(qa_id, question_clean), ...]; возвращает [(qa_id, similarity), ...] не ниже threshold.
+    Перед точным ratio проверяются его дешевые оценки сверху real_quick_ratio (по длинам)
+    и quick_ratio (по числу общих символов): кандидаты ниже порога отбрасываются без потерь.
+    """
+    result = []
+    for qa_id, qa_question_clean in candidates:
+        matcher = SequenceMatcher(None, question_clean.lower(), qa_question_clean.lower())
+        if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+            continue
+        similarity = matcher.ratio()
+        if similarity >= threshold:
+            result.append((qa_id, similarity))
+    return result
@@ -1,196 +1,517 @@
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from sqlalchemy.orm.attributes import set_committed_value
 from models import MethodicEntry, QAEntry
-import re
-from difflib import SequenceMatcher
+from qa_index import normalize_question, find_qa_candidates
+from fts_index import fts_search, fts_search_page, fts_facets
+from sentence_store import segment_text, load_sentences, fetch_sentence_texts
+from scoring import rank_sentence_groups
+from parallel_scoring import rank_sentence_groups_parallel, qa_similarities_parallel, offload
+from text_storage import load_texts, text_preview_columns, preview_from_row, extract_spans
+from semantic_index import get_index
+from context_packer import pack_context
+from text_normalization import normalize_query, encode_term_ids
+from config import settings
+from metrics import stage
+import base64
+import hashlib
+import json
+
+
+def search_qa_entries(db: Session, question: str, threshold: float = 0.6, limit: int = 3,
+                      semantic_fallback: bool = True):
+    """
+    Ищет наиболее похожие вопросы в таблице qa_entries
+    Возвращает готовые ответы, если найдены похожие вопросы
+    semantic_fallback — если посимвольно ничего не прошло порог, искать по смыслу
+    (со своим порогом SEMANTIC_QA_THRESHOLD, а не threshold).
+    """
+    # Очищаем и токенизируем вопрос пользователя
+    question_clean = normalize_question(question)
 
+    # Сужаем выборку по триграммному индексу, точное сравнение — только для кандидатов
+    with stage("qa_candidates"):
+        candidate_ids = find_qa_candidates(db, question_clean, threshold)
+        if candidate_ids is None:
+            candidates = db.query(QAEntry).all()
+        elif candidate_ids:
+            candidates = db.query(QAEntry).filter(QAEntry.id.in_(candidate_ids)).order_by(QAEntry.id).all()
+        else:
+            candidates = []
 
-def calculate_similarity(text1: str, text2: str) -> float:
-    """Вычисляет схожесть двух текстов от 0 до 1"""
-    return SequenceMatcher(None, text1.lower(), text2.lower()).ratio()
+    with stage("qa_similarity"):
+        results = rank_qa_candidates(question_clean, candidates, threshold, limit)
 
+    if not results and semantic_fallback:
+        results = search_qa_semantic(db, question, limit)
 
-def search_qa_entries(db: Session, question: str, threshold: float = 0.6, limit: int = 3):
+    attach_qa_methodics(db, results)
+    return results
+
+
+def semantic_index_for(mode: str = None):
+    """Семантический индекс, если режим поиска его использует и индекс построен"""
+    if (mode or settings.RETRIEVAL_MODE) not in ("semantic", "hybrid"):
+        return None
+    return get_index()
+
+
+def search_qa_semantic(db: Session, question: str, limit: int = 3, mode: str = None) -> list:
     """
-    Ищет наиболее похожие вопросы в таблице qa_entries
-    Возвращает готовые ответы, если найдены похожие вопросы
+    Q&A, близкие к вопросу по семантическому индексу (перефразированные вопросы,
+    которые не находит посимвольное сравнение). В режиме keyword всегда пусто.
     """
-    # Очищаем и токенизируем вопрос пользователя
-    question_clean = re.sub(r'\s+', ' ', question.lower()).strip()
+    index = semantic_index_for(mode)
+    if index is None:
+        return []
 
-    # Получаем все вопросы из базы
-    all_qa = db.query(QAEntry).all()
+    with stage("semantic_qa"):
+        hits = offload(index.search_qa, question, limit, settings.SEMANTIC_QA_THRESHOLD)
+        if not hits:
+            return []
+        by_id = {
+            qa.id: qa
+            for qa in db.query(QAEntry).filter(QAEntry.id.in_([qa_id for qa_id, _ in hits]))
+        }
+    return [by_id[qa_id] for qa_id, _ in hits if qa_id in by_id]
 
-    # Вычисляем схожесть для каждого вопроса
-    qa_with_similarity = []
-    for qa in all_qa:
-        qa_question_clean = re.sub(r'\s+', ' ', qa.question.lower()).strip()
-        similarity = calculate_similarity(question_clean, qa_question_clean)
 
-        if similarity >= threshold:
-            qa_with_similarity.append({
-                'qa': qa,
-                'similarity': similarity
-            })
+def attach_qa_methodics(db: Session, qa_results: list):
+    """
+    Загружает методички найденных Q&A одним запросом (полный текст отложен)
+    и проставляет их в qa.methodic, чтобы связь не подгружалась отдельным запросом на каждую запись.
+    """
+    methodic_ids = sorted({qa.methodic_id for qa in qa_results if qa.methodic_id})
+    methodics = {}
+    if methodic_ids:
+        methodics = {
+            methodic.id: methodic
+            for methodic in db.query(MethodicEntry)
+            .filter(MethodicEntry.id.in_(methodic_ids))
+        }
+    for qa in qa_results:
+        set_committed_value(qa, 'methodic', methodics.get(qa.methodic_id))
+
+
+def rank_qa_candidates(question_clean: str, candidates: list, threshold: float, limit: int,
+                       normalized: dict = None) -> list:
+    """
+    Точное сравнение вопроса с кандидатами.
+    normalized — необязательный словарь {qa_id: нормализованный вопрос}, чтобы не нормализовать повторно.
+    При большом числе кандидатов сравнение идет в пуле воркеров (см. parallel_scoring).
+    """
+    by_id = {qa.id: qa for qa in candidates}
+    pairs = [
+        (qa.id, normalized[qa.id] if normalized else normalize_question(qa.question))
+        for qa in candidates
+    ]
+    # Вычисляем схожесть для каждого кандидата
+    qa_with_similarity = qa_similarities_parallel(question_clean, pairs, threshold)
 
     # Сортируем по схожести и возвращаем лучшие
-    qa_with_similarity.sort(key=lambda x: x['similarity'], reverse=True)
+    qa_with_similarity.sort(key=lambda item: item[1], reverse=True)
 
-    return [item['qa'] for item in qa_with_similarity[:limit]]
+    return [by_id[qa_id] for qa_id, _ in qa_with_similarity[:limit]]
 
 
-def search_methodic_texts(db: Session, query: str, limit: int = 5):
+def search_qa_entries_batch(db: Session, questions: list, limits: list, threshold: float = 0.6) -> list:
     """
-    Поиск в полных текстах методичек (methodic_text)
+    Пакетный вариант search_qa_entries: кандидаты всех вопросов загружаются
+    и нормализуются один раз. Возвращает списки Q&A в порядке вопросов.
     """
-    keywords = re.findall(r'\w+', query.lower())
+    cleaned = [normalize_question(question) for question in questions]
+    with stage("qa_candidates"):
+        candidate_ids = [find_qa_candidates(db, question_clean, threshold) for question_clean in cleaned]
+
+        if any(ids is None for ids in candidate_ids):
+            loaded = db.query(QAEntry).order_by(QAEntry.id).all()
+        else:
+            all_ids = sorted({qa_id for ids in candidate_ids for qa_id in ids})
+            loaded = db.query(QAEntry).filter(QAEntry.id.in_(all_ids)).order_by(QAEntry.id).all() if all_ids else []
+
+    with stage("qa_similarity"):
+        by_id = {qa.id: qa for qa in loaded}
+        normalized = {qa.id: normalize_question(qa.question) for qa in loaded}
+
+        results = []
+        for question_clean, ids, limit in zip(cleaned, candidate_ids, limits):
+            candidates = loaded if ids is None else [by_id[qa_id] for qa_id in sorted(ids) if qa_id in by_id]
+            results.append(rank_qa_candidates(question_clean, candidates, threshold, limit, normalized))
+
+    for i, (question, limit) in enumerate(zip(questions, limits)):
+        if not results[i]:
+            results[i] = search_qa_semantic(db, question, limit)
+
+    attach_qa_methodics(db, [qa for qa_results in results for qa in qa_results])
+    return results
+
 
-    if not keywords:
+def search_methodic_texts(db: Session, query: str, limit: int = 5, with_text: bool = True):
+    """
+    Поиск в полных текстах методичек через FTS5-индекс methodic_fts.
+    Результаты упорядочены по BM25.
+    methodic_text отложенная колонка; with_text=True загружает полные тексты (в том числе сжатые).
+    """
+    with stage("fts_search"):
+        ranked_ids = fts_search(db, query, limit)
+        methodics = load_ranked_methodics(db, ranked_ids)
+        if with_text and methodics:
+            texts = load_texts(db.connection(), ranked_ids)
+            for methodic in methodics:
+                set_committed_value(methodic, 'methodic_text', texts.get(methodic.id))
+    return methodics
+
+
+def load_ranked_methodics(db: Session, ranked_ids: list) -> list:
+    """Методички одним запросом в порядке ranked_ids (удаленные пропускаются)"""
+    if not ranked_ids:
         return []
+    by_id = {
+        methodic.id: methodic
+        for methodic in db.query(MethodicEntry).filter(MethodicEntry.id.in_(ranked_ids))
+    }
+    return [by_id[methodic_id] for methodic_id in ranked_ids if methodic_id in by_id]
 
-    conditions = []
-    for keyword in keywords:
-        if len(keyword) > 2:
-            conditions.append(MethodicEntry.methodic_text.ilike(f"%{keyword}%"))
-            conditions.append(MethodicEntry.source_title.ilike(f"%{keyword}%"))
-            conditions.append(MethodicEntry.author.ilike(f"%{keyword}%"))
 
-    if not conditions:
-        return []
+def fuse_rankings(rankings: list, limit: int, k: int = 60) -> list:
+    """Объединение ранжированных списков id по reciprocal rank fusion"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda item: -scores[item])[:limit]
 
-    # Используем DISTINCT или группировку чтобы избежать дубликатов
-    results = db.query(MethodicEntry).filter(or_(*conditions)).limit(limit).all()
-    return results
+
+def rank_methodic_ids(db: Session, question: str, limit: int = 5, mode: str = None) -> tuple:
+    """
+    id методичек для вопроса в выбранном режиме поиска (RETRIEVAL_MODE по умолчанию):
+    keyword — BM25 по FTS5, semantic — ближайшие фрагменты в индексе LSA, hybrid — объединение рангов.
+    Возвращает (ranked_ids, passages), где passages — {methodic_id: позиция лучшего фрагмента}.
+    Если семантический индекс не построен, используется keyword.
+    """
+    mode = mode or settings.RETRIEVAL_MODE
+    index = semantic_index_for(mode)
+
+    keyword_ids = []
+    if index is None or mode == "hybrid":
+        with stage("fts_search"):
+            keyword_ids = fts_search(db, question, limit)
+    if index is None:
+        return keyword_ids, {}
+
+    with stage("semantic_search"):
+        passages = {}
+        # Несколько фрагментов на методичку, чтобы после группировки осталось limit методичек
+        for methodic_id, position, _ in offload(index.search_passages, question, limit * 10):
+            passages.setdefault(methodic_id, position)
+        semantic_ids = list(passages)[:limit]
+
+    if mode == "semantic":
+        return semantic_ids, passages
+    return fuse_rankings([keyword_ids, semantic_ids], limit), passages
+
+
+def add_passage_sentences(db: Session, best_ids: dict, stored: dict, passages: dict, question: str,
+                          max_sentences: int = 3):
+    """
+    Для методичек, найденных семантически, но без совпадений по ключевым словам,
+    берет предложения лучшего фрагмента, ближайшие к вопросу. Изменяет best_ids на месте.
+    Тексты предложений этих фрагментов вырезаются одним запросом.
+    """
+    index = get_index()
+    if index is None:
+        return
+    window = index.meta['passage_sentences']
+    windows = {}
+    for methodic_id, position in passages.items():
+        passage = (stored.get(methodic_id) or [])[position:position + window]
+        if passage and not best_ids.get(methodic_id):
+            windows[methodic_id] = [sentence_id for sentence_id, _, _ in passage]
+    if not windows:
+        return
+
+    texts = fetch_sentence_texts(db, [sentence_id for ids in windows.values() for sentence_id in ids])
+    for methodic_id, sentence_ids in windows.items():
+        best = offload(index.best_sentences, question, [texts.get(sid, "") for sid in sentence_ids], max_sentences)
+        best_ids[methodic_id] = [sentence_ids[i] for i in best]
+
+
+def search_methodic_previews(db: Session, query: str, limit: int = 5, preview_chars: int = 200) -> list:
+    """
+    Поиск для списка результатов: вместо полного текста из базы вырезается только начало
+    (у сжатых методичек распаковывается первая часть).
+    Возвращает [(methodic, preview, text_length), ...] в порядке BM25.
+    """
+    with stage("fts_search"):
+        return load_previews(db, fts_search(db, query, limit), preview_chars)
 
 
-def find_relevant_sentences(text: str, question: str, max_sentences: int = 3) -> list:
+class InvalidCursor(ValueError):
+    """Курсор поврежден или выдан для другого запроса"""
+
+
+def cursor_scope(query: str, author: str = None) -> str:
+    return hashlib.sha256(json.dumps([query, author], ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(query: str, author: str, score: float, methodic_id: int) -> str:
+    """Позиция (BM25, id) последнего результата страницы, привязанная к запросу и фильтру"""
+    payload = json.dumps({'s': score, 'i': methodic_id, 'q': cursor_scope(query, author)})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, query: str, author: str = None) -> tuple:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        score, methodic_id, scope = float(payload['s']), int(payload['i']), payload['q']
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Некорректный курсор")
+    if scope != cursor_scope(query, author):
+        raise InvalidCursor("Курсор выдан для другого запроса")
+    return score, methodic_id
+
+
+def search_methodic_preview_page(db: Session, query: str, limit: int = 10, cursor: str = None,
+                                 author: str = None, preview_chars: int = 200) -> tuple:
     """
-    Улучшенный поиск релевантных предложений с учетом контекста вопроса
+    Страница результатов search_methodic_previews после позиции cursor (keyset-пагинация по BM25 и id):
+    каждая следующая страница стоит столько же, сколько первая.
+    Возвращает (results, next_cursor); next_cursor = None на последней странице.
     """
-    if not text:
+    after = decode_cursor(cursor, query, author) if cursor else None
+    with stage("fts_search"):
+        page = fts_search_page(db, query, limit, after, author)
+        results = load_previews(db, [methodic_id for methodic_id, _ in page], preview_chars)
+    next_cursor = None
+    if len(page) == limit:
+        last_id, last_score = page[-1]
+        next_cursor = encode_cursor(query, author, last_score, last_id)
+    return results, next_cursor
+
+
+def search_facets(db: Session, query: str, limit: int = 10, author: str = None) -> dict:
+    with stage("fts_search"):
+        return fts_facets(db, query, limit, author)
+
+
+def load_previews(db: Session, ranked_ids: list, preview_chars: int = 200) -> list:
+    """[(methodic, preview, text_length), ...] в порядке ranked_ids"""
+    if not ranked_ids:
         return []
 
-    sentences = re.split(r'(?<=[.!?])\s+(?=[А-ЯA-Z0-9])', text)
+    rows = (
+        db.query(MethodicEntry, *text_preview_columns(preview_chars))
+        .filter(MethodicEntry.id.in_(ranked_ids))
+        .all()
+    )
+
+    by_id = {}
+    for methodic, inline_preview, first_chunk, text_length in rows:
+        preview = preview_from_row(inline_preview, first_chunk, text_length, preview_chars)
+        by_id[methodic.id] = [methodic, preview, text_length]
+    missing = [
+        (methodic_id, methodic_id, 0, preview_chars)
+        for methodic_id, (_, preview, _) in by_id.items() if preview is None
+    ]
+    for methodic_id, preview in extract_spans(db.connection(), missing).items():
+        by_id[methodic_id][1] = preview
+    return [tuple(by_id[methodic_id]) for methodic_id in ranked_ids if methodic_id in by_id]
 
-    keywords = re.findall(r'\w+', question.lower())
-    keywords = [k for k in keywords if len(k) > 3]  # Более длинные слова
 
-    relevant_sentences = []
+def question_keywords(question: str) -> list:
+    """Номера терминов ключевых слов вопроса для оценки предложений (более длинные слова)"""
+    return list(normalize_query(question).keyword_ids)
 
-    for sentence in sentences:
-        sentence_lower = sentence.lower()
 
-        score = 0
+def find_relevant_sentences(text: str, question: str, max_sentences: int = 3) -> list:
+    """
+    Улучшенный поиск релевантных предложений с учетом контекста вопроса
+    """
+    if not text:
+        return []
+
+    sentences = []
+    for start, end in segment_text(text):
+        sentence = text[start:end]
+        sentences.append((sentence, encode_term_ids(sentence), len(sentence.split())))
 
-        # 1. Ключевые слова
-        for keyword in keywords:
-            if keyword in sentence_lower:
-                score += 3
+    return rank_sentence_groups([sentences], question_keywords(question), max_sentences)[0]
 
-        # 2. Тематические слова (можно расширить)
-        thematic_words = ['студент', 'обучен', 'преподава', 'образован', 'метод', 'технолог']
-        for word in thematic_words:
-            if word in sentence_lower:
-                score += 1
 
-        # 3. Длина предложения (предпочитаем средние)
-        word_count = len(sentence.split())
-        if 10 <= word_count <= 30:
-            score += 1
+def find_relevant_stored_sentences(db: Session, methodic_ids: list, question: str, max_sentences: int = 3,
+                                   passages: dict = None) -> dict:
+    """
+    То же, что find_relevant_sentences, но по предложениям из methodic_sentences:
+    полный текст не читается, из базы вырезаются только выбранные предложения.
+    passages — лучшие фрагменты семантического поиска {methodic_id: позиция} для методичек без совпадений.
+    Возвращает {methodic_id: [sentence, ...]}
+    """
+    with stage("sentence_load"):
+        stored = load_sentences(db, methodic_ids)
 
-        if score > 0:
-            relevant_sentences.append({
-                'sentence': sentence.strip(),
-                'score': score,
-                'word_count': word_count
-            })
+    # Все предложения всех методичек оцениваются одним пакетом
+    with stage("sentence_scoring"):
+        ranked = rank_sentence_groups_parallel(list(stored.values()), question_keywords(question), max_sentences)
+        best_ids = dict(zip(stored.keys(), ranked))
+        if passages:
+            add_passage_sentences(db, best_ids, stored, passages, question, max_sentences)
 
-    relevant_sentences.sort(key=lambda x: (x['score'], -x['word_count']), reverse=True)
+    with stage("sentence_fetch"):
+        texts = fetch_sentence_texts(db, [sid for ids in best_ids.values() for sid in ids])
 
-    return [s['sentence'] for s in relevant_sentences[:max_sentences]]
+    return {
+        methodic_id: [texts[sid] for sid in ids if sid in texts]
+        for methodic_id, ids in best_ids.items()
+    }
 
 
-def search_methodics_with_context(db: Session, question: str, limit: int = 5):
+def search_methodics_with_context(db: Session, question: str, limit: int = 5, qa_results: list = None,
+                                  mode: str = None):
     """
     Основная функция поиска
+    qa_results — уже найденные Q&A (если None, ищутся здесь).
+    mode — keyword, semantic или hybrid (по умолчанию RETRIEVAL_MODE).
     """
-    qa_results = search_qa_entries(db, question, limit=limit)
+    if qa_results is None:
+        qa_results = search_qa_entries(db, question, limit=limit)
+
+    ranked_ids, passages = rank_methodic_ids(db, question, limit, mode)
+    methodic_results = load_ranked_methodics(db, ranked_ids)
+    relevant_by_id = find_relevant_stored_sentences(
+        db,
+        [methodic.id for methodic in methodic_results],
+        question,
+        max_sentences=3,
+        passages=passages
+    )
 
-    methodic_results = search_methodic_texts(db, question, limit)
+    return {
+        'qa_results': qa_results,
+        'methodic_contexts': build_methodic_contexts(methodic_results, relevant_by_id)
+    }
 
+
+def build_methodic_contexts(methodic_results: list, relevant_by_id: dict) -> list:
+    """Методички с найденными релевантными предложениями, самые содержательные первыми"""
     methodic_contexts = []
     for methodic in methodic_results:
-        if methodic.methodic_text:
-            relevant_sentences = find_relevant_sentences(
-                methodic.methodic_text,
-                question,
-                max_sentences=3
-            )
+        relevant_sentences = relevant_by_id.get(methodic.id)
 
-            if relevant_sentences:
-                methodic_contexts.append({
-                    'methodic': methodic,
-                    'relevant_sentences': relevant_sentences,
-                    'score': len(relevant_sentences)
-                })
+        if relevant_sentences:
+            methodic_contexts.append({
+                'methodic': methodic,
+                'relevant_sentences': relevant_sentences,
+                'score': len(relevant_sentences)
+            })
 
     methodic_contexts.sort(key=lambda x: x['score'], reverse=True)
+    return methodic_contexts
 
-    return {
-        'qa_results': qa_results,
-        'methodic_contexts': methodic_contexts
-    }
+
+def search_methodics_with_context_batch(db: Session, questions: list, limits: list,
+                                        qa_results: list = None, mode: str = None) -> list:
+    """
+    Пакетный вариант search_methodics_with_context.
+    Каждая методичка и ее предложения загружаются один раз на весь пакет,
+    тексты выбранных предложений вырезаются одним запросом.
+    qa_results — уже найденные Q&A для каждого вопроса (если None, ищутся здесь).
+    """
+    if qa_results is None:
+        qa_results = search_qa_entries_batch(db, questions, limits)
+
+    rankings = [rank_methodic_ids(db, question, limit, mode) for question, limit in zip(questions, limits)]
+    ranked_ids = [ids for ids, _ in rankings]
+    all_ids = sorted({methodic_id for ids in ranked_ids for methodic_id in ids})
+    methodics = {methodic.id: methodic for methodic in load_ranked_methodics(db, all_ids)}
+
+    with stage("sentence_load"):
+        stored = load_sentences(db, all_ids)
+
+    # Ключевые слова у каждого вопроса свои, поэтому оценка — по вопросу, но без повторной загрузки
+    with stage("sentence_scoring"):
+        best_ids = []
+        for question, (ids, passages) in zip(questions, rankings):
+            group_ids = [methodic_id for methodic_id in ids if methodic_id in stored]
+            ranked = rank_sentence_groups_parallel(
+                [stored[methodic_id] for methodic_id in group_ids], question_keywords(question), 3
+            )
+            best = dict(zip(group_ids, ranked))
+            if passages:
+                add_passage_sentences(db, best, stored, {m: p for m, p in passages.items() if m in best}, question)
+            best_ids.append(best)
+
+    with stage("sentence_fetch"):
+        texts = fetch_sentence_texts(db, sorted({sid for best in best_ids for ids in best.values() for sid in ids}))
+
+    results = []
+    for ids, best, qa in zip(ranked_ids, best_ids, qa_results):
+        relevant_by_id = {
+            methodic_id: [texts[sid] for sid in sentence_ids if sid in texts]
+            for methodic_id, sentence_ids in best.items()
+        }
+        methodic_results = [methodics[methodic_id] for methodic_id in ids if methodic_id in methodics]
+        results.append({
+            'qa_results': qa,
+            'methodic_contexts': build_methodic_contexts(methodic_results, relevant_by_id)
+        })
+    return results
 
 
 def format_context_for_prompt(search_results: dict, question: str) -> str:
     """
-    Улучшенное форматирование контекста для промпта Gemini
+    Контекст для промпта Gemini: лучшие фрагменты без дублей в пределах PROMPT_CONTEXT_TOKENS.
+    Инструкции к ответу задаются в самом промпте (build_gemini_body), а не в контексте.
     """
-    formatted_parts = []
+    return pack_context(search_results, question).text
+
+
+# ------------------ АСИНХРОННЫЕ ВАРИАНТЫ ------------------
+# Те же функции поиска поверх AsyncSession: синхронный код выполняется через run_sync,
+# а запросы к SQLite идут через aiosqlite и не блокируют event loop.
+# run_sync исполняет код в потоке event loop, поэтому тяжелая оценка (SequenceMatcher,
+# NumPy семантического индекса) вынесена в поток или пул воркеров через parallel_scoring.offload.
+# Ленивая загрузка вне run_sync невозможна, поэтому связь qa.methodic,
+# нужная после поиска, проставляется заранее (attach_qa_methodics).
+async def search_qa_entries_async(db: AsyncSession, question: str, threshold: float = 0.6, limit: int = 3,
+                                  semantic_fallback: bool = True):
+    return await db.run_sync(
+        lambda session: search_qa_entries(session, question, threshold, limit, semantic_fallback)
+    )
+
+
+async def search_qa_entries_batch_async(db: AsyncSession, questions: list, limits: list,
+                                        threshold: float = 0.6) -> list:
+    return await db.run_sync(lambda session: search_qa_entries_batch(session, questions, limits, threshold))
+
+
+async def search_methodic_texts_async(db: AsyncSession, query: str, limit: int = 5, with_text: bool = True):
+    return await db.run_sync(lambda session: search_methodic_texts(session, query, limit, with_text))
 
-    # 1. Форматируем Q&A результаты
-    if search_results['qa_results']:
-        formatted_parts.append("=== НАЙДЕННЫЕ ГОТОВЫЕ ОТВЕТЫ ===")
-        for i, qa in enumerate(search_results['qa_results'], 1):
-            formatted_parts.append(f"\nВОПРОС {i}: {qa.question}")
-            formatted_parts.append(f"ОТВЕТ {i}: {qa.answer}")
-            if qa.methodic:
-                formatted_parts.append(f"(Из методички: {qa.methodic.source_title})")
 
-    # 2. Форматируем контекст из методичек с указанием релевантности
-    if search_results['methodic_contexts']:
-        formatted_parts.append("\n=== РЕЛЕВАНТНЫЕ ФРАГМЕНТЫ ИЗ МЕТОДИЧЕК ===")
+async def search_methodic_previews_async(db: AsyncSession, query: str, limit: int = 5, preview_chars: int = 200):
+    return await db.run_sync(lambda session: search_methodic_previews(session, query, limit, preview_chars))
 
-        for i, ctx in enumerate(search_results['methodic_contexts'], 1):
-            methodic = ctx['methodic']
 
-            formatted_parts.append(f"\n──── МЕТОДИЧКА {i} ────")
-            formatted_parts.append(f"Заголовок: {methodic.source_title or 'Без названия'}")
-            if methodic.author:
-                formatted_parts.append(f"Автор: {methodic.author}")
+async def search_methodic_preview_page_async(db: AsyncSession, query: str, limit: int = 10, cursor: str = None,
+                                             author: str = None, preview_chars: int = 200) -> tuple:
+    return await db.run_sync(
+        lambda session: search_methodic_preview_page(session, query, limit, cursor, author, preview_chars)
+    )
 
-            formatted_parts.append(f"Релевантные фрагменты:")
-            for j, sentence in enumerate(ctx['relevant_sentences'], 1):
-                clean_sentence = re.sub(r'\s+', ' ', sentence).strip()
-                if len(clean_sentence) > 300:
-                    clean_sentence = clean_sentence[:300] + "..."
-                formatted_parts.append(f"  {j}. {clean_sentence}")
 
-    if not formatted_parts:
-        return "По вашему запросу ничего не найдено."
+async def search_facets_async(db: AsyncSession, query: str, limit: int = 10, author: str = None) -> dict:
+    return await db.run_sync(lambda session: search_facets(session, query, limit, author))
 
-    instruction = f"""
-ВАЖНАЯ ИНСТРУКЦИЯ:
-На основе приведенных выше материалов ответьте на вопрос: "{question}"
 
-ТРЕБОВАНИЯ К ОТВЕТУ:
-1. Отвечайте ТОЛЬКО на основе предоставленных материалов
-2. Не добавляйте информацию "от себя"
-3. Если информации недостаточно, скажите об этом
-4. Структурируйте ответ по пунктам
-5. Цитируйте источники (Методичка 1, Методичка 2 и т.д.)
-"""
+async def search_methodics_with_context_async(db: AsyncSession, question: str, limit: int = 5,
+                                              qa_results: list = None, mode: str = None):
+    return await db.run_sync(
+        lambda session: search_methodics_with_context(session, question, limit, qa_results, mode)
+    )
 
-    formatted_parts.append(instruction)
 
-    return "\n".join(formatted_parts)
\ No newline at end of file
+async def search_methodics_with_context_batch_async(db: AsyncSession, questions: list, limits: list,
+                                                    qa_results: list = None, mode: str = None) -> list:
+    return await db.run_sync(
+        lambda session: search_methodics_with_context_batch(session, questions, limits, qa_results, mode)
+    )
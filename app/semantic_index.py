@@ -0,0 +1,496 @@
+# app/semantic_index.py
+"""
+Локальный семантический индекс: TF-IDF + усеченное SVD (LSA) на NumPy, без загрузки моделей по сети.
+
+Документы — вопросы qa_entries и фрагменты методичек (окна по SEMANTIC_PASSAGE_SENTENCES
+предложений из methodic_sentences). Векторы нормированы, близость — косинус.
+Для приближенного поиска векторы разбиты на кластеры k-means (IVF): запрос сравнивается
+с центроидами и затем только с векторами SEMANTIC_NPROBE ближайших кластеров.
+Все массивы, включая отсортированный словарь, хранятся в .npy и открываются через memory map:
+в память попадают только прочитанные страницы, и несколько процессов uvicorn делят одни и те же
+страницы кэша ОС, а не держат по своей копии. Формат версионирован (FORMAT_VERSION в meta.json);
+индекс другой версии не загружается, его нужно перестроить. В meta.json записывается и отпечаток
+корпуса (число и максимальный id записей), по которому видно, что индекс устарел.
+
+Индекс строится отдельно и не обновляется при изменении данных — после загрузки
+новых методичек или Q&A его нужно перестроить:
+    python semantic_index.py build
+    python semantic_index.py query "как оценить работу наставника"
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+from config import settings
+from text_normalization import terms
+
+# Сколько ненулевых элементов разреженной матрицы умножается за один проход (ограничивает память)
+BLOCK_NNZ = 200_000
+
+# Версия формата файлов индекса; меняется при несовместимых изменениях
+# (3 — термины строятся стеммингом text_normalization вместо обрезки слов)
+FORMAT_VERSION = 3
+
+# Шаг чтения при прогреве memory map (размер страницы)
+PAGE_BYTES = 4096
+
+
+def tokenize(text: str) -> list:
+    return [term for term in terms(text) if not term.isdigit()]
+
+
+# ------------------ РАЗРЕЖЕННЫЕ МАТРИЦЫ ------------------
+class SparseRows:
+    """Разреженная матрица в формате CSR (indptr, indices, data)"""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, columns: int):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.columns = columns
+
+    @property
+    def rows(self) -> int:
+        return len(self.indptr) - 1
+
+    def dot(self, dense: np.ndarray) -> np.ndarray:
+        """self @ dense блоками строк"""
+        out = np.zeros((self.rows, dense.shape[1]), dtype=np.float32)
+        row = 0
+        while row < self.rows:
+            base = self.indptr[row]
+            end_row = int(np.searchsorted(self.indptr, base + BLOCK_NNZ, side='right')) - 1
+            end_row = min(max(end_row, row + 1), self.rows)
+            starts = self.indptr[row:end_row] - base
+            nonempty = self.indptr[row + 1:end_row + 1] > self.indptr[row:end_row]
+            if nonempty.any():
+                stop = self.indptr[end_row]
+                products = self.data[base:stop, None] * dense[self.indices[base:stop]]
+                out[row:end_row][nonempty] = np.add.reduceat(products, starts[nonempty], axis=0)
+            row = end_row
+        return out
+
+    def transpose(self) -> "SparseRows":
+        row_ids = np.repeat(np.arange(self.rows, dtype=np.int64), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind='stable')
+        counts = np.bincount(self.indices, minlength=self.columns)
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        return SparseRows(indptr, row_ids[order], self.data[order], self.rows)
+
+
+def tfidf_matrix(documents: list, vocabulary: dict, idf: np.ndarray) -> SparseRows:
+    """Строки TF-IDF (сублинейный tf, L2-нормировка) для токенизированных документов"""
+    indptr = [0]
+    indices = []
+    data = []
+    for tokens in documents:
+        counts = Counter(vocabulary[token] for token in tokens if token in vocabulary)
+        if counts:
+            ids = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            weights = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * idf[ids]
+            weights /= np.linalg.norm(weights)
+            indices.append(ids)
+            data.append(weights.astype(np.float32))
+        indptr.append(indptr[-1] + len(counts))
+    return SparseRows(
+        np.array(indptr, dtype=np.int64),
+        np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64),
+        np.concatenate(data) if data else np.zeros(0, dtype=np.float32),
+        len(idf)
+    )
+
+
+def randomized_svd(matrix: SparseRows, dimensions: int, seed: int = 0, power_iterations: int = 3) -> np.ndarray:
+    """Правые сингулярные векторы (dimensions x columns) рандомизированным методом Halko"""
+    rng = np.random.default_rng(seed)
+    transposed = matrix.transpose()
+    width = min(dimensions + 10, matrix.columns, matrix.rows)
+
+    sample = matrix.dot(rng.standard_normal((matrix.columns, width)).astype(np.float32))
+    basis, _ = np.linalg.qr(sample)
+    for _ in range(power_iterations):
+        basis, _ = np.linalg.qr(transposed.dot(basis))
+        basis, _ = np.linalg.qr(matrix.dot(basis))
+
+    projected = transposed.dot(basis).T  # basis.T @ matrix
+    _, _, components = np.linalg.svd(projected, full_matrices=False)
+    return components[:dimensions].astype(np.float32)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def kmeans(vectors: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Сферический k-means: центроиды (clusters x dims)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign_clusters(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        empty = np.bincount(labels, minlength=clusters) == 0
+        sums[empty] = centroids[empty]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def assign_clusters(vectors: np.ndarray, centroids: np.ndarray, block: int = 65536) -> np.ndarray:
+    return np.concatenate([
+        np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), block)
+    ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+
+# ------------------ ХРАНЕНИЕ И ПОИСК ------------------
+def touch_pages(array: np.ndarray) -> int:
+    """Читает по байту с каждой страницы массива (прогрев memory map); возвращает число байт"""
+    raw = np.asarray(array).reshape(-1).view(np.uint8)
+    if raw.size:
+        int(raw[::PAGE_BYTES].sum())
+    return int(raw.size)
+
+
+class Vocabulary:
+    """Отсортированные термины в массиве .npy: номер термина — его позиция, поиск — двоичный"""
+
+    def __init__(self, terms: np.ndarray):
+        self.terms = terms
+        self.width = terms.dtype.itemsize // 4 if terms.dtype.kind == 'U' else 0
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def ids(self, tokens) -> dict:
+        """{токен: номер термина} для токенов, которые есть в словаре"""
+        unique = sorted({token for token in tokens if len(token) <= self.width})
+        if not unique:
+            return {}
+        positions = np.searchsorted(self.terms, np.array(unique, dtype=self.terms.dtype))
+        found = {}
+        for token, position in zip(unique, positions.tolist()):
+            if position < len(self.terms) and self.terms[position] == token:
+                found[token] = position
+        return found
+
+
+class VectorSet:
+    """Векторы документов, упорядоченные по кластерам IVF, с ключами документов"""
+
+    def __init__(self, vectors: np.ndarray, keys: np.ndarray, centroids: np.ndarray, offsets: np.ndarray):
+        self.vectors = vectors
+        self.keys = keys
+        self.centroids = centroids
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, keys: np.ndarray, seed: int = 0) -> "VectorSet":
+        clusters = max(1, min(len(vectors), int(math.sqrt(len(vectors)))))
+        if not len(vectors):
+            return cls(vectors, keys, np.zeros((0, vectors.shape[1]), dtype=np.float32), np.zeros(1, dtype=np.int64))
+        centroids = kmeans(vectors, clusters, seed=seed)
+        labels = assign_clusters(vectors, centroids)
+        order = np.argsort(labels, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=clusters))))
+        return cls(vectors[order], keys[order], centroids, offsets)
+
+    def save(self, directory: str, name: str):
+        for part in ('vectors', 'keys', 'centroids', 'offsets'):
+            np.save(os.path.join(directory, f"{name}_{part}.npy"), getattr(self, part))
+
+    @classmethod
+    def load(cls, directory: str, name: str) -> "VectorSet":
+        return cls(*(
+            np.load(os.path.join(directory, f"{name}_{part}.npy"), mmap_mode='r')
+            for part in ('vectors', 'keys', 'centroids', 'offsets')
+        ))
+
+    def search(self, query: np.ndarray, limit: int, nprobe: int) -> list:
+        """[(key, score), ...] по убыванию косинуса среди nprobe ближайших кластеров"""
+        # Нулевой вектор — в запросе нет ни одного слова из словаря
+        if not len(self.centroids) or limit <= 0 or not query.any():
+            return []
+        probes = np.argsort(-(self.centroids @ query))[:nprobe]
+        ranges = [(self.offsets[c], self.offsets[c + 1]) for c in probes if self.offsets[c + 1] > self.offsets[c]]
+        if not ranges:
+            return []
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        scores = np.asarray(self.vectors[rows]) @ query
+        best = np.argsort(-scores)[:limit]
+        return [(self.keys[rows[i]], float(scores[i])) for i in best]
+
+
+class SemanticIndex:
+    """Словарь, веса idf, проекция LSA и два набора векторов: вопросы Q&A и фрагменты методичек"""
+
+    def __init__(self, vocabulary: Vocabulary, idf: np.ndarray, term_vectors: np.ndarray,
+                 qa: VectorSet, passages: VectorSet, meta: dict):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.term_vectors = term_vectors  # terms x dims
+        self.qa = qa
+        self.passages = passages
+        self.meta = meta
+
+    def embed(self, texts: list) -> np.ndarray:
+        """Нормированные векторы LSA для текстов (нулевой вектор, если нет известных слов)"""
+        documents = [tokenize(text) for text in texts]
+        term_ids = self.vocabulary.ids(token for tokens in documents for token in tokens)
+        matrix = tfidf_matrix(documents, term_ids, self.idf)
+        return normalize_rows(matrix.dot(self.term_vectors))
+
+    def best_sentences(self, question: str, sentences: list, limit: int) -> list:
+        """Номера limit предложений, ближайших к вопросу, в порядке следования"""
+        vectors = self.embed([question] + sentences)
+        scores = vectors[1:] @ vectors[0]
+        return sorted(np.argsort(-scores)[:limit].tolist())
+
+    def search_qa(self, question: str, limit: int, threshold: float) -> list:
+        """[(qa_id, score), ...] с косинусом не ниже threshold"""
+        query = self.embed([question])[0]
+        hits = self.qa.search(query, limit, settings.SEMANTIC_NPROBE)
+        return [(int(qa_id), score) for qa_id, score in hits if score >= threshold]
+
+    def search_passages(self, question: str, limit: int) -> list:
+        """[(methodic_id, position, score), ...]: position — номер первого предложения фрагмента"""
+        query = self.embed([question])[0]
+        hits = self.passages.search(query, limit, settings.SEMANTIC_NPROBE)
+        return [(int(key[0]), int(key[1]), score) for key, score in hits]
+
+    def arrays(self) -> list:
+        arrays = [self.vocabulary.terms, self.idf, self.term_vectors]
+        for vector_set in (self.qa, self.passages):
+            arrays.extend([vector_set.vectors, vector_set.keys, vector_set.centroids, vector_set.offsets])
+        return arrays
+
+    def prefetch(self) -> int:
+        """Заранее читает все страницы индекса, чтобы первые запросы не ждали диск"""
+        return sum(touch_pages(array) for array in self.arrays())
+
+    def save(self, directory: str):
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+        np.save(os.path.join(directory, "vocabulary.npy"), self.vocabulary.terms)
+        np.save(os.path.join(directory, "idf.npy"), self.idf)
+        np.save(os.path.join(directory, "term_vectors.npy"), self.term_vectors)
+        self.qa.save(directory, "qa")
+        self.passages.save(directory, "passages")
+
+    @classmethod
+    def load(cls, directory: str) -> "SemanticIndex":
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(
+                f"формат индекса {meta.get('format_version', 1)}, ожидается {FORMAT_VERSION}"
+            )
+        return cls(
+            Vocabulary(np.load(os.path.join(directory, "vocabulary.npy"), mmap_mode='r')),
+            np.load(os.path.join(directory, "idf.npy"), mmap_mode='r'),
+            np.load(os.path.join(directory, "term_vectors.npy"), mmap_mode='r'),
+            VectorSet.load(directory, "qa"),
+            VectorSet.load(directory, "passages"),
+            meta
+        )
+
+
+# ------------------ ПОСТРОЕНИЕ ------------------
+def iter_passages(connection, window: int):
+    """
+    Фрагменты методичек: ((methodic_id, position), текст из window предложений подряд).
+    Предложения вырезаются по смещениям из текста методички, который загружается (и распаковывается) один раз.
+    """
+    from sqlalchemy import select
+    from models import MethodicSentence
+    from text_storage import load_text
+
+    rows = connection.execute(
+        select(
+            MethodicSentence.methodic_id,
+            MethodicSentence.position,
+            MethodicSentence.start_offset,
+            MethodicSentence.end_offset
+        )
+        .order_by(MethodicSentence.methodic_id, MethodicSentence.position)
+    ).all()
+    current_id, start, sentences, text = None, 0, [], ""
+    for methodic_id, position, start_offset, end_offset in rows:
+        if methodic_id != current_id or len(sentences) == window:
+            if sentences:
+                yield (current_id, start), " ".join(sentences)
+            if methodic_id != current_id:
+                text = load_text(connection, methodic_id) or ""
+            current_id, start, sentences = methodic_id, position, []
+        sentences.append(text[start_offset:end_offset])
+    if sentences:
+        yield (current_id, start), " ".join(sentences)
+
+
+def corpus_fingerprint(connection) -> dict:
+    """Число и максимальный id записей Q&A и методичек: меняется после загрузки или удаления данных"""
+    from sqlalchemy import select, func
+    from models import QAEntry, MethodicEntry
+
+    fingerprint = {}
+    for name, model in (('qa_entries', QAEntry), ('methodics', MethodicEntry)):
+        count, max_id = connection.execute(select(func.count(model.id), func.max(model.id))).one()
+        fingerprint[name] = [count, max_id or 0]
+    return fingerprint
+
+
+def is_stale(index: SemanticIndex, connection) -> bool:
+    """Индекс построен по другому содержимому базы"""
+    return index.meta.get('corpus') != corpus_fingerprint(connection)
+
+
+def build_index(connection, dimensions: int = None, window: int = None, seed: int = 0) -> SemanticIndex:
+    """Строит индекс по текущему содержимому базы"""
+    from sqlalchemy import select
+    from models import QAEntry
+
+    dimensions = dimensions or settings.SEMANTIC_DIMENSIONS
+    window = window or settings.SEMANTIC_PASSAGE_SENTENCES
+
+    fingerprint = corpus_fingerprint(connection)
+    qa_rows = connection.execute(select(QAEntry.id, QAEntry.question).order_by(QAEntry.id)).all()
+    qa_keys = np.array([qa_id for qa_id, _ in qa_rows], dtype=np.int64)
+    qa_tokens = [tokenize(question) for _, question in qa_rows]
+
+    passage_keys = []
+    passage_tokens = []
+    for key, text in iter_passages(connection, window):
+        passage_keys.append(key)
+        passage_tokens.append(tokenize(text))
+    passage_keys = np.array(passage_keys, dtype=np.int64).reshape(-1, 2)
+
+    documents = qa_tokens + passage_tokens
+    document_frequency = Counter(token for tokens in documents for token in set(tokens))
+    min_df = 2 if len(documents) >= 100 else 1
+    vocabulary = sorted(
+        (term for term, df in document_frequency.items() if df >= min_df),
+        key=lambda term: (-document_frequency[term], term)
+    )[:settings.SEMANTIC_MAX_TERMS]
+    vocabulary.sort()
+    term_ids = {term: i for i, term in enumerate(vocabulary)}
+    idf = np.array(
+        [math.log((1 + len(documents)) / (1 + document_frequency[term])) + 1.0 for term in vocabulary],
+        dtype=np.float32
+    )
+
+    matrix = tfidf_matrix(documents, term_ids, idf)
+    if not vocabulary or matrix.rows < 2:
+        raise ValueError("Недостаточно данных для построения семантического индекса")
+    components = randomized_svd(matrix, min(dimensions, matrix.rows - 1, len(vocabulary)), seed)
+    term_vectors = np.ascontiguousarray(components.T)
+    vectors = normalize_rows(matrix.dot(term_vectors))
+
+    return SemanticIndex(
+        Vocabulary(np.array(vocabulary, dtype=str)),
+        idf,
+        term_vectors,
+        VectorSet.build(vectors[:len(qa_rows)], qa_keys, seed),
+        VectorSet.build(vectors[len(qa_rows):], passage_keys, seed),
+        {
+            'format_version': FORMAT_VERSION,
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'corpus': fingerprint,
+            'dimensions': int(components.shape[0]),
+            'terms': len(vocabulary),
+            'qa_entries': len(qa_rows),
+            'passages': len(passage_keys),
+            'passage_sentences': window
+        }
+    )
+
+
+def write_index(index: SemanticIndex, directory: str):
+    """Записывает индекс во временный каталог и подменяет им старый"""
+    staging = directory + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    index.save(staging)
+
+    previous = directory + ".old"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(directory):
+        os.replace(directory, previous)
+    os.replace(staging, directory)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+# ------------------ ТЕКУЩИЙ ИНДЕКС ------------------
+_index = None
+_load_attempted = False
+
+
+def load_index(directory: str = None):
+    """Открывает индекс с диска; None, если он еще не построен"""
+    global _index, _load_attempted
+    directory = directory or settings.SEMANTIC_INDEX_DIR
+    _load_attempted = True
+    if not os.path.exists(os.path.join(directory, "meta.json")):
+        print(f"⚠️ Семантический индекс не найден ({directory}): python semantic_index.py build")
+        _index = None
+        return None
+    try:
+        _index = SemanticIndex.load(directory)
+    except (ValueError, OSError) as e:
+        print(f"⚠️ Семантический индекс не загружен ({e}): python semantic_index.py build")
+        _index = None
+        return None
+    print(f"Семантический индекс: {_index.meta['qa_entries']} вопросов, {_index.meta['passages']} фрагментов")
+    return _index
+
+
+def get_index():
+    """Загруженный индекс (при первом обращении открывается с диска) или None"""
+    if not _load_attempted:
+        load_index()
+    return _index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный семантический индекс (TF-IDF + LSA)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Построить индекс по базе")
+    build.add_argument("--output", default=settings.SEMANTIC_INDEX_DIR)
+    build.add_argument("--dimensions", type=int, default=settings.SEMANTIC_DIMENSIONS)
+    build.add_argument("--passage-sentences", type=int, default=settings.SEMANTIC_PASSAGE_SENTENCES)
+
+    query = subparsers.add_parser("query", help="Проверить поиск по построенному индексу")
+    query.add_argument("text")
+    query.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        from database import engine, init_db
+        init_db()
+        started = time.perf_counter()
+        with engine.connect() as connection:
+            index = build_index(connection, args.dimensions, args.passage_sentences)
+        write_index(index, args.output)
+        print(f"Готово за {time.perf_counter() - started:.1f} с: {json.dumps(index.meta, ensure_ascii=False)}")
+        return 0
+
+    index = load_index()
+    if index is None:
+        return 1
+    for qa_id, score in index.search_qa(args.text, args.limit, threshold=-1.0):
+        print(f"qa {qa_id}: {score:.3f}")
+    for methodic_id, position, score in index.search_passages(args.text, args.limit):
+        print(f"methodic {methodic_id} @ {position}: {score:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
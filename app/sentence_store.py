@@ -0,0 +1,222 @@
+import re
+
+from sqlalchemy import event, inspect, select, delete, insert, update, func, and_, bindparam, text as sql_text
+from sqlalchemy.orm import Session
+
+from models import MethodicEntry, MethodicSentence, MethodicTextChunk
+from text_storage import text_length_expr, load_text, decompress_chunk
+from text_normalization import encode_term_ids
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=[А-ЯA-Z0-9])')
+
+
+def segment_text(text: str) -> list:
+    """
+    Делит текст на предложения и возвращает их границы (start, end)
+    без окружающих пробелов. Пустые фрагменты пропускаются.
+    """
+    if not text:
+        return []
+
+    raw_spans = []
+    start = 0
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        raw_spans.append((start, match.start()))
+        start = match.end()
+    raw_spans.append((start, len(text)))
+
+    spans = []
+    for start, end in raw_spans:
+        piece = text[start:end]
+        stripped = piece.strip()
+        if not stripped:
+            continue
+        start += len(piece) - len(piece.lstrip())
+        spans.append((start, start + len(stripped)))
+    return spans
+
+
+def sentence_rows(methodic_id: int, text: str) -> list:
+    rows = []
+    for position, (start, end) in enumerate(segment_text(text)):
+        sentence = text[start:end]
+        rows.append({
+            'methodic_id': methodic_id,
+            'position': position,
+            'start_offset': start,
+            'end_offset': end,
+            'token_ids': encode_term_ids(sentence),
+            'word_count': len(sentence.split())
+        })
+    return rows
+
+
+def store_sentences(connection, methodic_id: int, text: str):
+    """Пересобирает предложения одной методички"""
+    connection.execute(delete(MethodicSentence).where(MethodicSentence.methodic_id == methodic_id))
+    rows = sentence_rows(methodic_id, text)
+    if rows:
+        connection.execute(insert(MethodicSentence), rows)
+
+
+def store_new_sentences(connection, documents: list):
+    """Сохраняет предложения новых методичек одним executemany: documents — пары (methodic_id, text)"""
+    rows = [row for methodic_id, text in documents for row in sentence_rows(methodic_id, text)]
+    if rows:
+        connection.execute(insert(MethodicSentence), rows)
+
+
+def sync_sentence_store(db: Session) -> int:
+    """Сегментирует методички, у которых еще нет предложений. Возвращает их количество."""
+    segmented_ids = select(MethodicSentence.methodic_id).distinct()
+    missing_ids = [
+        row[0] for row in db.query(MethodicEntry.id)
+        .filter(text_length_expr() > 0)
+        .filter(MethodicEntry.id.not_in(segmented_ids))
+        .all()
+    ]
+
+    connection = db.connection()
+    for methodic_id in missing_ids:
+        store_sentences(connection, methodic_id, load_text(connection, methodic_id))
+
+    connection.execute(
+        delete(MethodicSentence).where(MethodicSentence.methodic_id.not_in(select(MethodicEntry.id)))
+    )
+    db.commit()
+    return len(missing_ids)
+
+
+def sync_sentence_terms(db: Session) -> int:
+    """
+    Приводит methodic_sentences старых баз к текущей схеме: добавляет колонку token_ids,
+    заполняет номера терминов там, где их нет (предложения вырезаются из текста методички по смещениям),
+    и удаляет колонку sentence_lower — вторую, несжатую копию текста.
+    Место в файле освобождает VACUUM (python text_storage.py compress --vacuum).
+    Возвращает число обновленных предложений.
+    """
+    connection = db.connection()
+    table = MethodicSentence.__tablename__
+    columns = {column['name'] for column in inspect(connection).get_columns(table)}
+    if 'token_ids' not in columns:
+        connection.execute(sql_text(f"ALTER TABLE {table} ADD COLUMN token_ids BLOB"))
+
+    statement = (
+        update(MethodicSentence)
+        .where(MethodicSentence.id == bindparam('sentence_id'))
+        .values(token_ids=bindparam('new_token_ids'))
+    )
+    missing_ids = [
+        row[0] for row in connection.execute(
+            select(MethodicSentence.methodic_id).where(MethodicSentence.token_ids.is_(None)).distinct()
+        )
+    ]
+    updated = 0
+    for methodic_id in missing_ids:
+        text = load_text(connection, methodic_id) or ""
+        rows = connection.execute(
+            select(MethodicSentence.id, MethodicSentence.start_offset, MethodicSentence.end_offset)
+            .where(MethodicSentence.methodic_id == methodic_id)
+            .where(MethodicSentence.token_ids.is_(None))
+        ).all()
+        connection.execute(statement, [
+            {'sentence_id': sentence_id, 'new_token_ids': encode_term_ids(text[start:end])}
+            for sentence_id, start, end in rows
+        ])
+        updated += len(rows)
+
+    if 'sentence_lower' in columns:
+        connection.execute(sql_text(f"ALTER TABLE {table} DROP COLUMN sentence_lower"))
+        print("Колонка methodic_sentences.sentence_lower удалена, место освободит VACUUM")
+    db.commit()
+    return updated
+
+
+def load_sentences(db: Session, methodic_ids: list) -> dict:
+    """
+    Загружает предсегментированные предложения методичек без чтения полного текста.
+    Возвращает {methodic_id: [(sentence_id, token_ids, word_count), ...]} в порядке следования.
+    """
+    if not methodic_ids:
+        return {}
+
+    rows = (
+        db.query(
+            MethodicSentence.methodic_id,
+            MethodicSentence.id,
+            MethodicSentence.token_ids,
+            MethodicSentence.word_count
+        )
+        .filter(MethodicSentence.methodic_id.in_(methodic_ids))
+        .order_by(MethodicSentence.methodic_id, MethodicSentence.position)
+        .all()
+    )
+
+    sentences = {methodic_id: [] for methodic_id in methodic_ids}
+    for methodic_id, sentence_id, token_ids, word_count in rows:
+        sentences[methodic_id].append((sentence_id, token_ids, word_count))
+    return sentences
+
+
+def fetch_sentence_texts(db: Session, sentence_ids: list) -> dict:
+    """
+    Вырезает исходный текст выбранных предложений по смещениям.
+    Несжатый текст режется средствами SQL, у сжатого распаковываются только части с этими предложениями.
+    """
+    if not sentence_ids:
+        return {}
+
+    rows = (
+        db.query(
+            MethodicSentence.id,
+            MethodicSentence.methodic_id,
+            MethodicSentence.start_offset,
+            MethodicSentence.end_offset,
+            func.substr(
+                MethodicEntry.methodic_text,
+                MethodicSentence.start_offset + 1,
+                MethodicSentence.end_offset - MethodicSentence.start_offset
+            ),
+            MethodicTextChunk.char_start,
+            MethodicTextChunk.data
+        )
+        .join(MethodicEntry, MethodicEntry.id == MethodicSentence.methodic_id)
+        .outerjoin(MethodicTextChunk, and_(
+            MethodicTextChunk.methodic_id == MethodicSentence.methodic_id,
+            MethodicTextChunk.char_start < MethodicSentence.end_offset,
+            MethodicTextChunk.char_start + MethodicTextChunk.char_length > MethodicSentence.start_offset
+        ))
+        .filter(MethodicSentence.id.in_(sentence_ids))
+        .order_by(MethodicSentence.id, MethodicTextChunk.char_start)
+        .all()
+    )
+
+    texts = {}
+    chunks = {}
+    for sentence_id, methodic_id, start, end, inline, char_start, data in rows:
+        if data is None:
+            texts[sentence_id] = inline
+            continue
+        key = (methodic_id, char_start)
+        if key not in chunks:
+            chunks[key] = decompress_chunk(data)
+        piece = chunks[key][max(start - char_start, 0):end - char_start]
+        texts[sentence_id] = texts.get(sentence_id, "") + piece
+    return texts
+
+
+# ------------------ СИНХРОНИЗАЦИЯ С methodic_entries ------------------
+@event.listens_for(MethodicEntry, "after_insert")
+def _on_methodic_insert(mapper, connection, target):
+    store_sentences(connection, target.id, target.methodic_text)
+
+
+@event.listens_for(MethodicEntry, "after_update")
+def _on_methodic_update(mapper, connection, target):
+    if inspect(target).attrs.methodic_text.history.has_changes():
+        store_sentences(connection, target.id, target.methodic_text)
+
+
+@event.listens_for(MethodicEntry, "after_delete")
+def _on_methodic_delete(mapper, connection, target):
+    connection.execute(delete(MethodicSentence).where(MethodicSentence.methodic_id == target.id))
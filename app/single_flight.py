@@ -0,0 +1,29 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные одинаковые вызовы: первый запрос выполняет работу,
+    остальные с тем же ключом ждут его результат.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.counters = {'executed': 0, 'coalesced': 0}
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters['coalesced'] += 1
+        else:
+            self.counters['executed'] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        # shield: отмена одного из ожидающих запросов не должна отменять общую работу
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
@@ -0,0 +1,141 @@
+# app/tests/conftest.py
+"""
+Общее окружение тестов: копия data/methodics.db во временной папке, заглушка Gemini
+(gemini_stub.py) и само приложение, запущенные uvicorn в фоновых потоках на свободных портах.
+
+Настройки читаются при импорте config, поэтому переменные окружения задаются здесь,
+до импорта модулей приложения.
+"""
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+import uvicorn
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+WORK_DIR = Path(tempfile.mkdtemp(prefix="edugpt-tests-"))
+shutil.copy(APP_DIR / "data" / "methodics.db", WORK_DIR / "methodics.db")
+STUB_PORT = free_port()
+
+os.environ.update({
+    "GEMINI_API_URL": f"http://127.0.0.1:{STUB_PORT}/v1beta/models/stub:generateContent",
+    "GEMINI_API_KEY": "test-key",
+    "DATABASE_URL": f"sqlite:///{WORK_DIR / 'methodics.db'}",
+    "SEMANTIC_INDEX_DIR": str(WORK_DIR / "semantic_index"),
+    "SQL_PROFILING_ENABLED": "true",
+    # Кэши выключены: каждый запрос должен доходить до базы и до Gemini
+    "RESPONSE_CACHE_ENABLED": "false",
+    "LLM_CACHE_ENABLED": "false",
+})
+
+import gemini_client  # noqa: E402
+import gemini_stub  # noqa: E402
+
+# Вопрос без готового ответа в Q&A, но с фрагментами в текстах методичек: /chat идет в Gemini
+CHAT_QUESTION = "Какие формы наставничества применяются на производстве?"
+
+
+class ServerThread:
+    """uvicorn в фоновом потоке со своим event loop"""
+
+    def __init__(self, app, port: int):
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 60.0):
+        self.thread.start()
+        started_at = time.monotonic()
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() - started_at > timeout:
+                raise RuntimeError(f"Сервер на порту {self.port} не запустился")
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+class StubControl:
+    """Управление заглушкой Gemini: сбои через /faults, счетчики через /stats (обнуляются перед каждым тестом)"""
+
+    def __init__(self, url: str):
+        self.http = httpx.Client(base_url=url, timeout=10)
+
+    def faults(self, **values) -> dict:
+        return self.http.post("/faults", json=values).raise_for_status().json()
+
+    def stats(self) -> dict:
+        return self.http.get("/stats").raise_for_status().json()
+
+    def reset(self, timeout: float = 10.0):
+        """Снимает сбои, дожидается зависших вызовов прошлого теста и обнуляет счетчики"""
+        self.faults(delay=0.0, error_rate=0.0, hang_rate=0.0, error_status=503, stream_break_after=0, bad_body="")
+        started_at = time.monotonic()
+        while self.stats()["in_flight"] and time.monotonic() - started_at < timeout:
+            time.sleep(0.05)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.http.delete("/stats").raise_for_status()
+
+
+@pytest.fixture(scope="session")
+def stub():
+    server = ServerThread(gemini_stub.app, STUB_PORT)
+    server.start()
+    control = StubControl(server.url)
+    yield control
+    control.http.close()
+    server.stop()
+
+
+@pytest.fixture(scope="session")
+def app_server(stub):
+    import main
+
+    server = ServerThread(main.app, free_port())
+    server.start()
+    with httpx.Client(base_url=server.url, timeout=30) as client:
+        started_at = time.monotonic()
+        while client.get("/health/ready").status_code != 200:
+            if time.monotonic() - started_at > 60:
+                raise RuntimeError("Приложение не завершило прогрев")
+            time.sleep(0.1)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(app_server):
+    with httpx.Client(base_url=app_server.url, timeout=30) as http:
+        yield http
+
+
+@pytest.fixture(autouse=True)
+def reset_gemini(request):
+    """Каждый тест начинает с исправной заглушки и замкнутого автомата"""
+    if "stub" in request.fixturenames:
+        request.getfixturevalue("stub").reset()
+    gemini_client.gemini_breaker.record_success()
+    yield
@@ -0,0 +1,67 @@
+# app/tests/test_answer_cache.py
+"""
+Постоянный уровень кэша ответов: просроченные записи удаляются по индексу и не при каждой записи.
+"""
+import pytest
+
+import answer_cache as answer_cache_module
+from answer_cache import AnswerCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(answer_cache_module.time, "time", lambda: clock[0])
+    cache = AnswerCache(max_entries=100, max_bytes=1024 * 1024, ttl=10, db_path=str(tmp_path / "llm_cache.db"),
+                        cleanup_interval=60)
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+    yield cache, clock, statements
+    cache._db.close()
+
+
+def cleanups(statements: list) -> int:
+    return len([statement for statement in statements if statement.startswith("DELETE FROM llm_cache WHERE expires_at")])
+
+
+def persistent_keys(cache) -> list:
+    return [row[0] for row in cache._db.execute("SELECT key FROM llm_cache ORDER BY key")]
+
+
+def test_expired_entries_are_cleaned_up_on_interval(cache):
+    cache, clock, statements = cache
+    for i in range(5):
+        cache.put(f"old-{i}", "ответ", [1])
+    assert cleanups(statements) == 1
+
+    clock[0] += 30
+    cache.put("new", "ответ", [2])
+    # Интервал не прошел: просроченные записи еще лежат, но уже не выдаются
+    assert cleanups(statements) == 1
+    assert len(persistent_keys(cache)) == 6
+    cache._entries.clear()
+    assert cache.get("old-0") is None
+
+    clock[0] += 31
+    cache.put("newest", "ответ", [2])
+    assert cleanups(statements) == 2
+    assert persistent_keys(cache) == ["newest"]
+    links = cache._db.execute("SELECT key, methodic_id FROM llm_cache_methodics").fetchall()
+    assert links == [("newest", 2)]
+
+
+def test_cleanup_uses_expires_index(cache):
+    cache, _, _ = cache
+    plan = cache._db.execute("EXPLAIN QUERY PLAN DELETE FROM llm_cache WHERE expires_at <= 0").fetchall()
+    assert "llm_cache_expires" in " ".join(str(row) for row in plan)
+
+
+def test_invalidate_methodic_removes_links(cache):
+    cache, _, _ = cache
+    cache.put("a", "ответ", [1, 2])
+    cache.put("b", "ответ", [2])
+    cache.put("a", "новый ответ", [3])
+
+    cache.invalidate_methodic(2)
+    assert persistent_keys(cache) == ["a"]
+    assert cache._db.execute("SELECT key, methodic_id FROM llm_cache_methodics").fetchall() == [("a", 3)]
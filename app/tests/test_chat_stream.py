@@ -0,0 +1,104 @@
+# app/tests/test_chat_stream.py
+"""
+/chat/stream на заглушке Gemini: оборванный или неудачный поток заменяется ответом вручную.
+"""
+import json
+import sqlite3
+
+import pytest
+
+import main
+from answer_cache import AnswerCache
+from config import settings
+from conftest import CHAT_QUESTION, WORK_DIR
+
+MANUAL_ANSWER_PREFIX = "На основе анализа методических материалов:"
+
+
+def stream_events(client, question: str = CHAT_QUESTION) -> list:
+    """События SSE ответа: [(event, data), ...]"""
+    response = client.post("/chat/stream", json={"question": question})
+    assert response.status_code == 200
+    events = []
+    for block in response.text.split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def final_answer(events: list) -> dict:
+    answers = [data for event, data in events if event == "answer"]
+    assert len(answers) == 1
+    assert events[-1][0] == "done"
+    return answers[0]
+
+
+def test_stream_completes(client, stub):
+    events = stream_events(client)
+    tokens = [data["text"] for event, data in events if event == "token"]
+    answer = final_answer(events)
+
+    assert len(tokens) > 1
+    assert answer["fallback"] is False
+    assert answer["answer"] == "".join(tokens).strip()
+
+
+def test_interrupted_stream_falls_back(client, stub):
+    # Три фрагмента уже содержат слова вопроса и прошли бы проверку качества как целый ответ
+    stub.faults(stream_break_after=3)
+
+    events = stream_events(client)
+    answer = final_answer(events)
+
+    assert [event for event, _ in events].count("token") == 3
+    assert answer["fallback"] is True
+    assert answer["answer"].startswith(MANUAL_ANSWER_PREFIX)
+
+
+def test_failed_stream_falls_back(client, stub):
+    stub.faults(error_rate=1.0)
+
+    events = stream_events(client)
+    answer = final_answer(events)
+
+    assert stub.stats()["calls"] == 1
+    assert "token" not in [event for event, _ in events]
+    assert answer["fallback"] is True
+    assert answer["answer"].startswith(MANUAL_ANSWER_PREFIX)
+
+
+@pytest.fixture
+def llm_cache(monkeypatch):
+    """Включенный кэш ответов Gemini с постоянным уровнем в отдельном файле"""
+    db_path = WORK_DIR / "llm_cache_stream.db"
+    db_path.unlink(missing_ok=True)
+    cache = AnswerCache(max_entries=100, max_bytes=1024 * 1024, ttl=60, db_path=str(db_path))
+    monkeypatch.setattr(main, "answer_cache", cache)
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    yield cache, db_path
+    cache._db.close()
+
+
+def persistent_entries(db_path) -> int:
+    with sqlite3.connect(db_path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+def test_interrupted_stream_is_not_cached(client, stub, llm_cache):
+    cache, db_path = llm_cache
+    stub.faults(stream_break_after=3)
+    assert final_answer(stream_events(client))["fallback"] is True
+    assert cache.stats()["entries"] == 0
+    assert persistent_entries(db_path) == 0
+
+    # Следующий такой же вопрос снова идет в Gemini, а не получает оборванный ответ из кэша
+    stub.faults(stream_break_after=0)
+    assert final_answer(stream_events(client))["fallback"] is False
+    assert stub.stats()["calls"] == 2
+    assert cache.stats()["entries"] == 1
+    assert persistent_entries(db_path) == 1
+
+    # Полный ответ уже берется из кэша
+    assert final_answer(stream_events(client))["fallback"] is False
+    assert stub.stats()["calls"] == 2
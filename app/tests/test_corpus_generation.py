@@ -0,0 +1,50 @@
+# app/tests/test_corpus_generation.py
+"""
+Поколение корпуса растет при любой записи в methodic_entries и qa_entries, в том числе
+прямым SQL в обход ORM, и ETag ответов после этого меняется.
+"""
+import sqlite3
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from config import settings
+from conftest import WORK_DIR
+from corpus_generation import read_generation, sync_corpus_generation
+from models import Base
+
+SEARCH_QUERY = "наставничество"
+
+
+def test_triggers_bump_generation_on_direct_sql():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    start = sync_corpus_generation(db)
+
+    connection = db.connection()
+    connection.execute(text("INSERT INTO methodic_entries (author, source_title) VALUES ('Автор', 'Название')"))
+    connection.execute(text("INSERT INTO qa_entries (question, answer) VALUES ('Вопрос?', 'Ответ')"))
+    connection.execute(text("UPDATE qa_entries SET answer = 'Другой ответ'"))
+    connection.execute(text("DELETE FROM qa_entries"))
+    db.commit()
+
+    assert read_generation(db.connection()) == start + 4
+    # Повторный вызов при старте не дублирует триггеры
+    assert sync_corpus_generation(db) == start + 4
+    db.close()
+    engine.dispose()
+
+
+def test_etag_changes_after_direct_sql_write(client, monkeypatch):
+    monkeypatch.setattr(settings, "CORPUS_GENERATION_CHECK_INTERVAL", 0.0)
+    etag = client.get("/search", params={"query": SEARCH_QUERY}).headers["ETag"]
+    assert client.get("/search", params={"query": SEARCH_QUERY}, headers={"If-None-Match": etag}).status_code == 304
+
+    with sqlite3.connect(WORK_DIR / "methodics.db") as connection:
+        cursor = connection.execute("INSERT INTO qa_entries (question, answer) VALUES ('Вопрос теста?', 'Ответ')")
+        connection.execute("DELETE FROM qa_entries WHERE id = ?", (cursor.lastrowid,))
+
+    response = client.get("/search", params={"query": SEARCH_QUERY}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
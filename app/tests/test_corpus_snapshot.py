@@ -0,0 +1,37 @@
+# app/tests/test_corpus_snapshot.py
+"""
+Старый снимок корпуса закрывается только после закрытия открытых на нем сессий.
+"""
+import asyncio
+
+from sqlalchemy import text
+
+import corpus_snapshot
+from config import settings
+from conftest import WORK_DIR
+from database import init_db
+
+COUNT_METHODICS = text("SELECT COUNT(*) FROM methodic_entries")
+
+
+def test_retire_waits_for_open_sessions(monkeypatch):
+    monkeypatch.setattr(settings, "SNAPSHOT_RETIRE_SECONDS", 0.05)
+    init_db()
+
+    async def scenario():
+        snapshot = corpus_snapshot.build_snapshot(str(WORK_DIR / "methodics.db"))
+        # Сессия открыта (как у потока /methodics/{id}/text), но еще ничего не прочитала
+        session = snapshot.session_factory()
+        retiring = asyncio.ensure_future(corpus_snapshot.retire(snapshot))
+        await asyncio.sleep(0.2)
+
+        assert not retiring.done()
+        count = (await session.execute(COUNT_METHODICS)).scalar()
+        await session.close()
+        await session.close()
+        await asyncio.wait_for(retiring, timeout=5)
+        return count, snapshot.sessions
+
+    count, sessions = asyncio.run(scenario())
+    assert count > 0
+    assert sessions == 0
@@ -0,0 +1,47 @@
+# app/tests/test_gemini_client_pool.py
+"""
+Одновременные /chat используют один общий клиент Gemini и его пул keep-alive соединений.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import gemini_client
+from conftest import CHAT_QUESTION
+
+CONCURRENCY = 8
+ROUNDS = 3
+
+
+def ask(client, question: str) -> str:
+    response = client.post("/chat", json={"question": question})
+    assert response.status_code == 200
+    return response.json()["answer"]
+
+
+def test_concurrent_chat_reuses_pooled_client(client, stub, monkeypatch):
+    # Клиент создается лениво первым вызовом Gemini
+    ask(client, CHAT_QUESTION)
+    pooled = gemini_client._client
+    assert pooled is not None and not pooled.is_closed
+
+    created = []
+    original_client = gemini_client.httpx.AsyncClient
+
+    def counting_client(*args, **kwargs):
+        created.append(1)
+        return original_client(*args, **kwargs)
+
+    monkeypatch.setattr(gemini_client.httpx, "AsyncClient", counting_client)
+    stub.faults(delay=0.2)
+    stub.reset_stats()
+
+    # Разные вопросы: одинаковые /chat объединил бы в один вызов Gemini
+    questions = [f"{CHAT_QUESTION} Вариант {i}" for i in range(CONCURRENCY * ROUNDS)]
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        list(pool.map(lambda question: ask(client, question), questions))
+
+    stats = stub.stats()
+    assert stats["calls"] == CONCURRENCY * ROUNDS
+    assert gemini_client._client is pooled
+    assert created == []
+    # Соединения пула переиспользуются между волнами запросов, а не открываются на каждый вызов
+    assert stats["connections"] <= CONCURRENCY
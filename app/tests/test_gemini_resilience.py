@@ -0,0 +1,165 @@
+# app/tests/test_gemini_resilience.py
+"""
+Защита вызовов Gemini на заглушке со сбоями: автомат, дедлайн /chat, повторы и лимит одновременных вызовов.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import gemini_client
+from config import settings
+from conftest import CHAT_QUESTION
+from resilience import ConcurrencyLimiter
+
+# Так начинается ответ заглушки; ответ, собранный вручную из фрагментов, начинается иначе
+STUB_ANSWER_PREFIX = "Ответ на вопрос:"
+
+
+def ask(client, question: str = CHAT_QUESTION) -> str:
+    response = client.post("/chat", json={"question": question})
+    assert response.status_code == 200
+    return response.json()["answer"]
+
+
+def breaker_state(client) -> str:
+    return client.get("/gemini/status").json()["breaker"]["state"]
+
+
+def test_breaker_opens_then_half_opens_then_closes(client, stub, monkeypatch):
+    monkeypatch.setattr(gemini_client.gemini_breaker, "failure_threshold", 2)
+    monkeypatch.setattr(gemini_client.gemini_breaker, "reset_timeout", 0.5)
+    stub.faults(error_rate=1.0)
+
+    for _ in range(2):
+        assert not ask(client).startswith(STUB_ANSWER_PREFIX)
+    assert stub.stats()["calls"] == 2
+    assert breaker_state(client) == "open"
+
+    # Разомкнутый автомат не пропускает вызов к Gemini: сразу ответ по фрагментам
+    assert not ask(client).startswith(STUB_ANSWER_PREFIX)
+    assert stub.stats()["calls"] == 2
+
+    stub.faults(error_rate=0.0)
+    time.sleep(0.6)
+    assert breaker_state(client) == "half_open"
+
+    # Удачный пробный вызов замыкает автомат
+    assert ask(client).startswith(STUB_ANSWER_PREFIX)
+    assert stub.stats()["calls"] == 3
+    assert breaker_state(client) == "closed"
+
+
+def test_half_open_probe_failure_reopens(client, stub, monkeypatch):
+    monkeypatch.setattr(gemini_client.gemini_breaker, "failure_threshold", 1)
+    monkeypatch.setattr(gemini_client.gemini_breaker, "reset_timeout", 0.3)
+    stub.faults(error_rate=1.0)
+
+    ask(client)
+    assert breaker_state(client) == "open"
+    time.sleep(0.4)
+    assert breaker_state(client) == "half_open"
+
+    ask(client)
+    assert stub.stats()["calls"] == 2
+    assert breaker_state(client) == "open"
+
+
+def test_hanging_upstream_hits_deadline(client, stub, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_DEADLINE_SECONDS", 1.0)
+    stub.faults(hang_rate=1.0, hang_seconds=3.0)
+
+    started_at = time.monotonic()
+    answer = ask(client)
+    elapsed = time.monotonic() - started_at
+
+    assert stub.stats()["hangs"] == 1
+    assert elapsed < 2.5
+    # Вместо ответа Gemini — ответ по найденным фрагментам
+    assert answer.startswith("На основе анализа методических материалов:")
+
+
+@pytest.mark.parametrize("status, expected_calls", [(503, 3), (429, 3), (500, 3), (400, 1), (403, 1)])
+def test_retries_only_retryable_statuses(client, stub, monkeypatch, status, expected_calls):
+    monkeypatch.setattr(settings, "GEMINI_RETRIES", 2)
+    monkeypatch.setattr(settings, "GEMINI_RETRY_BACKOFF", 0.01)
+    stub.faults(error_rate=1.0, error_status=status)
+
+    assert not ask(client).startswith(STUB_ANSWER_PREFIX)
+    assert stub.stats()["calls"] == expected_calls
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404])
+def test_request_errors_do_not_open_breaker(client, stub, monkeypatch, status):
+    monkeypatch.setattr(gemini_client.gemini_breaker, "failure_threshold", 1)
+    stub.faults(error_rate=1.0, error_status=status)
+
+    for _ in range(2):
+        assert not ask(client).startswith(STUB_ANSWER_PREFIX)
+    # Ошибка запроса не говорит о недоступности Gemini: каждый вызов доходит до сервиса
+    assert stub.stats()["calls"] == 2
+    assert breaker_state(client) == "closed"
+
+
+@pytest.mark.parametrize("bad_body", ["blocked", "malformed"])
+def test_bad_response_body_counts_as_failure(client, stub, monkeypatch, bad_body):
+    monkeypatch.setattr(gemini_client.gemini_breaker, "failure_threshold", 1)
+    stub.faults(bad_body=bad_body)
+
+    assert not ask(client).startswith(STUB_ANSWER_PREFIX)
+    assert stub.stats()["calls"] == 1
+    assert breaker_state(client) == "open"
+
+
+def test_retry_recovers_after_transient_failure(client, stub, monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_RETRIES", 2)
+    monkeypatch.setattr(gemini_client, "backoff_delay", lambda attempt, base, cap: 0.5)
+    stub.faults(error_rate=1.0)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        answer = pool.submit(ask, client)
+        # Первая попытка получила 503, сбой снимается во время паузы перед повтором
+        while stub.stats()["errors"] == 0:
+            time.sleep(0.01)
+        stub.faults(error_rate=0.0)
+        assert answer.result().startswith(STUB_ANSWER_PREFIX)
+    stats = stub.stats()
+    assert (stats["calls"], stats["errors"]) == (2, 1)
+
+
+def concurrent_questions(count: int) -> list:
+    """Разные вопросы: одинаковые /chat объединил бы в один вызов Gemini"""
+    return [f"{CHAT_QUESTION} Вариант {i}" for i in range(count)]
+
+
+def test_concurrency_cap_holds(client, stub, monkeypatch):
+    limiter = ConcurrencyLimiter(2)
+    monkeypatch.setattr(gemini_client, "gemini_limiter", limiter)
+    stub.faults(delay=0.3)
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        answers = list(pool.map(lambda question: ask(client, question), concurrent_questions(6)))
+
+    stats = stub.stats()
+    assert stats["calls"] == 6
+    assert stats["max_in_flight"] == 2
+    assert limiter.rejected == 0
+    assert limiter.in_flight == 0
+    assert all(answer.startswith(STUB_ANSWER_PREFIX) for answer in answers)
+
+
+def test_concurrency_cap_rejects_after_queue_timeout(client, stub, monkeypatch):
+    limiter = ConcurrencyLimiter(2)
+    monkeypatch.setattr(gemini_client, "gemini_limiter", limiter)
+    monkeypatch.setattr(settings, "GEMINI_QUEUE_TIMEOUT", 0.2)
+    stub.faults(delay=2.0)
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        answers = list(pool.map(lambda question: ask(client, question), concurrent_questions(5)))
+
+    stats = stub.stats()
+    assert stats["max_in_flight"] <= 2
+    assert stats["calls"] == 2
+    assert limiter.rejected == 3
+    # Не дождавшиеся слота получают ответ по фрагментам
+    assert sum(answer.startswith(STUB_ANSWER_PREFIX) for answer in answers) == 2
@@ -0,0 +1,54 @@
+# app/tests/test_ingest.py
+"""
+Чтение источников ingest.py.
+"""
+import csv
+
+from sqlalchemy import create_engine, event
+
+from fts_index import ensure_fts_table
+from ingest import read_csv, write_batch
+from models import Base
+from text_storage import load_text
+
+LONG_TEXT_CHARS = 300 * 1024
+
+
+def test_read_csv_accepts_long_text(tmp_path):
+    path = tmp_path / "methodics.csv"
+    text = "Длинный текст методички. " * (LONG_TEXT_CHARS // 25)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["author", "title", "text"])
+        writer.writeheader()
+        writer.writerow({"author": "Автор", "title": "Методичка", "text": text})
+        writer.writerow({"author": "", "title": "Вторая", "text": "Короткий текст"})
+
+    records = list(read_csv(path))
+
+    assert [kind for kind, _ in records] == ["methodic", "methodic"]
+    assert records[0][1]["methodic_text"] == text
+    assert len(text) > 128 * 1024
+
+
+def test_write_batch_stores_compressed_text_once():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    text = "Текст методички для сжатия. " * 2000
+    with engine.begin() as connection:
+        ensure_fts_table(connection)
+        statements.clear()
+        write_batch(connection, [
+            ('methodic', {'author': "Автор", 'source_title': "Методичка", 'methodic_text': text, 'qa': []}),
+            ('methodic', {'author': None, 'source_title': "Пустая", 'methodic_text': "", 'qa': []})
+        ])
+
+    with engine.connect() as connection:
+        stored = connection.exec_driver_sql("SELECT id, methodic_text FROM methodic_entries ORDER BY id").all()
+        assert [value for _, value in stored] == [None, ""]
+        assert load_text(connection, stored[0][0]) == text
+    # Текст не вставляется в колонку, чтобы затем обнулиться отдельным UPDATE
+    assert not [statement for statement in statements if statement.startswith("UPDATE methodic_entries")]
@@ -0,0 +1,27 @@
+# app/tests/test_parallel_scoring.py
+"""
+Оценка кандидатов при поиске через AsyncSession не занимает поток event loop приложения.
+"""
+import threading
+
+import parallel_scoring
+from conftest import CHAT_QUESTION
+
+
+def test_scoring_runs_off_event_loop(client, app_server, stub, monkeypatch):
+    threads = []
+
+    def recorded(fn):
+        def wrapper(*args):
+            threads.append((fn.__name__, threading.current_thread()))
+            return fn(*args)
+        wrapper.__name__ = fn.__name__
+        return wrapper
+
+    monkeypatch.setattr(parallel_scoring, "qa_similarities", recorded(parallel_scoring.qa_similarities))
+    monkeypatch.setattr(parallel_scoring, "rank_sentence_groups", recorded(parallel_scoring.rank_sentence_groups))
+
+    assert client.post("/chat", json={"question": CHAT_QUESTION}).status_code == 200
+
+    assert {name for name, _ in threads} == {"qa_similarities", "rank_sentence_groups"}
+    assert app_server.thread not in {thread for _, thread in threads}
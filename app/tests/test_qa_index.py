@@ -0,0 +1,113 @@
+# app/tests/test_qa_index.py
+"""
+Поиск Q&A через триграммный индекс сравнивается с полным перебором SequenceMatcher
+на синтетическом корпусе (шаблонные вопросы из benchmark.py и вопросы с опечатками).
+"""
+import random
+from difflib import SequenceMatcher
+
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import search
+from benchmark import CorpusGenerator
+from config import settings
+from models import Base, QAEntry
+from qa_index import find_qa_candidates, normalize_question, sync_qa_index
+from search import search_qa_entries
+
+QA_COUNT = 1000
+THRESHOLD = 0.6
+LIMIT = 5
+
+
+def with_typos(rng: random.Random, text: str) -> str:
+    chars = list(text)
+    for _ in range(rng.randint(1, 4)):
+        position = rng.randrange(len(chars))
+        operation = rng.random()
+        if operation < 0.33:
+            chars[position] = rng.choice("абвгдежзиклмнопрст")
+        elif operation < 0.66:
+            del chars[position]
+        else:
+            chars.insert(position, rng.choice("абвгдежзиклмнопрст "))
+    return "".join(chars)
+
+
+@pytest.fixture(scope="module")
+def qa_corpus():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    generator = CorpusGenerator(1)
+    questions = [generator.qa(QA_COUNT)['question'] for _ in range(QA_COUNT)]
+    with engine.begin() as connection:
+        connection.execute(insert(QAEntry), [{'question': question, 'answer': "ответ"} for question in questions])
+
+    db = sessionmaker(bind=engine)()
+    sync_qa_index(db)
+
+    rng = random.Random(5)
+    queries = CorpusGenerator(3).queries(questions, 15) + [with_typos(rng, rng.choice(questions)) for _ in range(15)]
+    yield db, {query: full_scan(db, query) for query in queries}
+    db.close()
+    engine.dispose()
+
+
+def full_scan(db, query: str) -> list:
+    """Эталон: ratio со всеми вопросами, лучшие LIMIT не ниже порога (при равенстве — по id)"""
+    query_clean = normalize_question(query)
+    scored = []
+    for qa_id, question in db.query(QAEntry.id, QAEntry.question):
+        similarity = SequenceMatcher(None, query_clean, normalize_question(question)).ratio()
+        if similarity >= THRESHOLD:
+            scored.append((-similarity, qa_id))
+    return [qa_id for _, qa_id in sorted(scored)[:LIMIT]]
+
+
+def test_length_filter_matches_full_scan(qa_corpus, monkeypatch):
+    db, queries = qa_corpus
+    monkeypatch.setattr(settings, "QA_NGRAM_DICE_FACTOR", 0.0)
+    for query, expected in queries.items():
+        assert [qa.id for qa in search_qa_entries(db, query, THRESHOLD, LIMIT)] == expected
+
+
+def test_dice_filter_matches_full_scan(qa_corpus):
+    db, queries = qa_corpus
+    assert settings.QA_NGRAM_DICE_FACTOR > 0
+    for query, expected in queries.items():
+        assert [qa.id for qa in search_qa_entries(db, query, THRESHOLD, LIMIT)] == expected
+
+
+def test_dice_filter_prunes(qa_corpus, monkeypatch):
+    db, queries = qa_corpus
+    dice_candidates = sum(len(find_qa_candidates(db, normalize_question(query), THRESHOLD)) for query in queries)
+    monkeypatch.setattr(settings, "QA_NGRAM_DICE_FACTOR", 0.0)
+    length_candidates = sum(len(find_qa_candidates(db, normalize_question(query), THRESHOLD)) for query in queries)
+    assert dice_candidates * 3 < length_candidates
+
+
+def test_short_question_is_indexed(qa_corpus):
+    db, _ = qa_corpus
+    db.add(QAEntry(question="Да?", answer="ответ"))
+    db.commit()
+    assert [qa.question for qa in search_qa_entries(db, "да", THRESHOLD, LIMIT)] == ["Да?"]
+
+
+UNMATCHED_QUERY = "квантовая хромодинамика глюонов"
+
+
+def test_semantic_fallback_is_optional(qa_corpus, monkeypatch):
+    db, _ = qa_corpus
+    fallback = db.query(QAEntry).first()
+    monkeypatch.setattr(search, "search_qa_semantic", lambda db, question, limit: [fallback])
+    assert search_qa_entries(db, UNMATCHED_QUERY, THRESHOLD, LIMIT) == [fallback]
+    assert search_qa_entries(db, UNMATCHED_QUERY, THRESHOLD, LIMIT, semantic_fallback=False) == []
+
+
+def test_qa_search_endpoint_respects_threshold(client, monkeypatch):
+    # Поиск по смыслу нашел бы вопрос, который не проходит заданный порог
+    monkeypatch.setattr(search, "search_qa_semantic", lambda db, question, limit: db.query(QAEntry).limit(1).all())
+    response = client.get("/qa/search", params={"query": UNMATCHED_QUERY, "threshold": 0.6})
+    assert response.json() == {"results": [], "count": 0}
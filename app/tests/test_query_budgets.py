@@ -0,0 +1,72 @@
+# app/tests/test_query_budgets.py
+"""
+Число SQL-выражений основных эндпоинтов не превышает бюджетов из ENDPOINT_QUERY_BUDGETS
+(заголовок X-DB-Profile, SQL_PROFILING_ENABLED=true в conftest).
+"""
+from sqlalchemy import create_engine, text
+
+from conftest import CHAT_QUESTION
+from query_profiler import (
+    ENDPOINT_QUERY_BUDGETS, assert_query_budget, parse_profile_header, query_budget, PROFILE_HEADER
+)
+
+SEARCH_QUERY = "наставничество"
+QA_QUERY = "Я опытный инженер на предприятии, мне поручили быть наставником для студентов-практикантов"
+
+
+def test_search_within_budget(client):
+    response = client.get("/search", params={"query": SEARCH_QUERY})
+    assert response.status_code == 200
+    assert response.json()
+    assert_query_budget(response, ENDPOINT_QUERY_BUDGETS["GET /search"])
+
+
+def test_qa_search_within_budget(client):
+    response = client.get("/qa/search", params={"query": QA_QUERY})
+    assert response.status_code == 200
+    assert response.json()["count"] > 0
+    assert_query_budget(response, ENDPOINT_QUERY_BUDGETS["GET /qa/search"])
+
+
+def test_methodic_within_budget(client):
+    methodic_id = client.get("/search", params={"query": SEARCH_QUERY}).json()[0]["id"]
+
+    response = client.get(f"/methodics/{methodic_id}")
+    assert response.status_code == 200
+    assert response.json()["id"] == methodic_id
+    assert_query_budget(response, ENDPOINT_QUERY_BUDGETS["GET /methodics/{methodic_id}"])
+
+
+def test_chat_within_budget(client, stub):
+    calls_before = stub.stats()["calls"]
+
+    response = client.post("/chat", json={"question": CHAT_QUESTION})
+    assert response.status_code == 200
+    assert response.json()["found_methodics"] > 0
+    # Ответ пришел из заглушки Gemini, а не из готовых Q&A
+    assert stub.stats()["calls"] == calls_before + 1
+    assert_query_budget(response, ENDPOINT_QUERY_BUDGETS["POST /chat"])
+
+
+def test_profile_header_counts_statements(client):
+    response = client.get("/search", params={"query": SEARCH_QUERY})
+    stats = parse_profile_header(response.headers[PROFILE_HEADER])
+    assert stats["statements"] > 0
+    assert stats["rows"] > 0
+
+
+def test_profiler_counts_core_and_text_rows():
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection, query_budget(statements=2) as stats:
+        connection.execute(text("SELECT 'абв' UNION ALL SELECT 'где'")).all()
+        connection.exec_driver_sql("SELECT x'0102'").fetchone()
+    engine.dispose()
+    assert stats.rows == 3
+    assert stats.bytes == 6 + 6 + 2
+
+
+def test_profile_header_counts_fts_rows(client):
+    # Фасеты читаются только выражениями text() по FTS5
+    response = client.get("/search/facets", params={"query": SEARCH_QUERY})
+    assert response.status_code == 200
+    assert parse_profile_header(response.headers[PROFILE_HEADER])["rows"] > 0
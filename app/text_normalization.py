@@ -0,0 +1,116 @@
+# app/text_normalization.py
+"""
+Общая нормализация текста для всех путей поиска (русский и английский).
+
+- fold — нижний регистр и ё -> е;
+- stem — легкий стемминг: у русских слов отбрасывается падежное окончание существительных
+  и прилагательных, у английских — -s, -es, -ed, -ing; основа не короче MIN_STEM_CHARS;
+- terms — термины текста (основы слов не короче MIN_TERM_CHARS);
+- term_id — номер термина (crc32): предложения методичек хранят номера своих терминов
+  (methodic_sentences.token_ids), и совпадение с вопросом проверяется сравнением чисел;
+- normalize_query — разбор вопроса один раз: ключевые слова, их номера и термины для FTS5.
+  Результат кэшируется, поэтому все этапы одного запроса (FTS, оценка предложений,
+  сборка контекста, проверка ответа) используют один разбор.
+"""
+import re
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r'\w+')
+
+# Слова короче не считаются терминами
+MIN_TERM_CHARS = 3
+# Ключевые слова вопроса для оценки предложений и проверки ответа — более длинные слова
+MIN_KEYWORD_CHARS = 4
+MIN_STEM_CHARS = 3
+
+# Окончания существительных и прилагательных; отбрасывается самое длинное подходящее
+RUSSIAN_ENDINGS = sorted({
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях',
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому',
+    'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых',
+    'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+    'ев', 'ов', 'ье', 'ии', 'ям', 'ам', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья',
+    'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я'
+}, key=len, reverse=True)
+
+LATIN_WORD = re.compile(r'[a-z]+')
+
+# Тип хранения номеров терминов
+TERM_ID_DTYPE = np.dtype('<u4')
+
+
+def fold_russian(value: str) -> str:
+    """unicode61 не сводит ё к е, поэтому делаем это до индексации и в запросах"""
+    return (value or "").replace('ё', 'е').replace('Ё', 'Е')
+
+
+def fold(text: str) -> str:
+    return fold_russian((text or "").lower())
+
+
+def words(text: str) -> list:
+    return WORD_PATTERN.findall(fold(text))
+
+
+def stem_english(word: str) -> str:
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    for ending in ('ing', 'ed'):
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_CHARS:
+            return word[:-len(ending)]
+    if word.endswith('sses'):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')) and len(word) > MIN_STEM_CHARS:
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=200_000)
+def stem(word: str) -> str:
+    """Основа слова, уже приведенного через fold"""
+    if LATIN_WORD.fullmatch(word):
+        return stem_english(word)
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_CHARS:
+            return word[:-len(ending)]
+    return word
+
+
+def terms(text: str) -> list:
+    """Основы слов текста в порядке следования (короткие слова пропускаются)"""
+    return [stem(word) for word in words(text) if len(word) >= MIN_TERM_CHARS]
+
+
+def term_id(term: str) -> int:
+    return zlib.crc32(term.encode("utf-8"))
+
+
+def encode_term_ids(text: str) -> bytes:
+    """Номера терминов текста для хранения в BLOB"""
+    found = terms(text)
+    return np.fromiter((term_id(term) for term in found), dtype=TERM_ID_DTYPE, count=len(found)).tobytes()
+
+
+@dataclass(frozen=True)
+class NormalizedQuery:
+    words: tuple
+    keywords: tuple  # основы слов не короче MIN_KEYWORD_CHARS, без повторов
+    keyword_ids: tuple
+    match_terms: tuple  # основы для префиксного поиска FTS5, без повторов
+
+
+@lru_cache(maxsize=1024)
+def normalize_query(query: str) -> NormalizedQuery:
+    query_words = tuple(words(query))
+    keywords = tuple(dict.fromkeys(stem(word) for word in query_words if len(word) >= MIN_KEYWORD_CHARS))
+    match_terms = tuple(dict.fromkeys(stem(word) for word in query_words if len(word) >= MIN_TERM_CHARS))
+    return NormalizedQuery(
+        words=query_words,
+        keywords=keywords,
+        keyword_ids=tuple(term_id(keyword) for keyword in keywords),
+        match_terms=match_terms
+    )
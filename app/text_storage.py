@@ -0,0 +1,407 @@
+# app/text_storage.py
+"""
+Сжатое хранение текстов методичек.
+
+Текст делится на части по TEXT_CHUNK_CHARS символов, каждая часть сжимается zlib отдельно
+и хранится в methodic_text_chunks вместе со смещениями в символах и байтах UTF-8.
+Колонка methodic_entries.methodic_text у сжатых методичек равна NULL; несжатые строки
+(до миграции или при TEXT_COMPRESSION_ENABLED=false) продолжают храниться в ней как раньше.
+
+Фрагменты (превью, предложения, диапазоны байт) читаются по частям: распаковываются
+только части, пересекающиеся с нужным диапазоном. Поиск работает по заранее построенным
+индексам (FTS5, предложения) и полного текста не касается.
+
+Полный текст читается через load_text/load_texts: после загрузки из базы
+атрибут MethodicEntry.methodic_text у сжатой методички равен None.
+
+Миграция существующей базы:
+    python text_storage.py compress --batch-size 200 --vacuum
+    python text_storage.py decompress
+    python text_storage.py stats
+"""
+import argparse
+import os
+import sys
+import time
+import zlib
+
+from sqlalchemy import event, inspect, select, delete, insert, update, func, cast, and_, or_, LargeBinary
+
+from config import settings
+from models import MethodicEntry, MethodicTextChunk
+
+ENTRIES = MethodicEntry.__table__
+CHUNKS = MethodicTextChunk.__table__
+
+
+# ------------------ СЖАТИЕ ------------------
+def split_chunks(text: str, chunk_chars: int = None) -> list:
+    """Строки methodic_text_chunks (без methodic_id) для текста"""
+    chunk_chars = chunk_chars or settings.TEXT_CHUNK_CHARS
+    rows = []
+    byte_start = 0
+    for chunk_no, char_start in enumerate(range(0, len(text), chunk_chars)):
+        raw = text[char_start:char_start + chunk_chars].encode('utf-8')
+        rows.append({
+            'chunk_no': chunk_no,
+            'char_start': char_start,
+            'char_length': min(chunk_chars, len(text) - char_start),
+            'byte_start': byte_start,
+            'byte_length': len(raw),
+            'data': zlib.compress(raw, settings.TEXT_COMPRESSION_LEVEL)
+        })
+        byte_start += len(raw)
+    return rows
+
+
+def decompress_chunk(data: bytes) -> str:
+    return zlib.decompress(data).decode('utf-8')
+
+
+def compress_texts(connection, documents: list) -> int:
+    """
+    Переносит тексты в сжатые части: documents — пары (methodic_id, text).
+    Колонка methodic_text у перенесенных методичек обнуляется. Пустые тексты остаются как есть.
+    Возвращает число сжатых методичек.
+    """
+    documents = [(methodic_id, text) for methodic_id, text in documents if text]
+    if not documents:
+        return 0
+
+    methodic_ids = [methodic_id for methodic_id, _ in documents]
+    connection.execute(delete(CHUNKS).where(CHUNKS.c.methodic_id.in_(methodic_ids)))
+    store_chunks(connection, documents)
+    connection.execute(update(ENTRIES).where(ENTRIES.c.id.in_(methodic_ids)).values(methodic_text=None))
+    return len(documents)
+
+
+def store_chunks(connection, documents: list) -> int:
+    """
+    Записывает сжатые части текстов новых методичек, вставленных с methodic_text = NULL
+    (массовая загрузка): текст пишется в базу один раз. Пустые тексты пропускаются.
+    """
+    rows = [
+        {'methodic_id': methodic_id, **row}
+        for methodic_id, text in documents
+        if text
+        for row in split_chunks(text)
+    ]
+    if rows:
+        connection.execute(insert(CHUNKS), rows)
+    return len(rows)
+
+
+def decompress_texts(connection, methodic_ids: list) -> int:
+    """Возвращает тексты в колонку methodic_text и удаляет части. Возвращает число методичек."""
+    texts = load_chunked_texts(connection, methodic_ids)
+    for methodic_id, text in texts.items():
+        connection.execute(update(ENTRIES).where(ENTRIES.c.id == methodic_id).values(methodic_text=text))
+    connection.execute(delete(CHUNKS).where(CHUNKS.c.methodic_id.in_(list(texts))))
+    return len(texts)
+
+
+# ------------------ ЧТЕНИЕ ------------------
+def text_length_expr():
+    """Длина текста в символах: несжатая колонка или сумма длин частей"""
+    chunked = (
+        select(func.sum(CHUNKS.c.char_length))
+        .where(CHUNKS.c.methodic_id == MethodicEntry.id)
+        .scalar_subquery()
+    )
+    return func.coalesce(func.length(MethodicEntry.methodic_text), chunked, 0)
+
+
+def text_bytes_expr():
+    """Размер текста в байтах UTF-8 (substr и length над BLOB считают байты)"""
+    chunked = (
+        select(func.sum(CHUNKS.c.byte_length))
+        .where(CHUNKS.c.methodic_id == MethodicEntry.id)
+        .scalar_subquery()
+    )
+    return func.coalesce(func.length(cast(MethodicEntry.methodic_text, LargeBinary)), chunked, 0)
+
+
+def first_chunk_expr():
+    """Сжатая первая часть текста (NULL у несжатых методичек)"""
+    return (
+        select(CHUNKS.c.data)
+        .where(CHUNKS.c.methodic_id == MethodicEntry.id, CHUNKS.c.chunk_no == 0)
+        .scalar_subquery()
+    )
+
+
+def preview_from_row(inline_preview, first_chunk, text_length: int, chars: int):
+    """
+    Превью из строки запроса с text_preview_columns.
+    Возвращает None, если первой части не хватает и нужен extract_spans.
+    """
+    if first_chunk is None:
+        return inline_preview or ""
+    preview = decompress_chunk(first_chunk)[:chars]
+    if len(preview) < min(chars, text_length):
+        return None
+    return preview
+
+
+def text_preview_columns(chars: int) -> tuple:
+    """Колонки для превью в одном запросе: (substr несжатого текста, первая часть, длина)"""
+    return func.substr(MethodicEntry.methodic_text, 1, chars), first_chunk_expr(), text_length_expr()
+
+
+def load_chunked_texts(connection, methodic_ids: list) -> dict:
+    """{methodic_id: text} для методичек, хранящихся в сжатом виде"""
+    if not methodic_ids:
+        return {}
+    rows = connection.execute(
+        select(CHUNKS.c.methodic_id, CHUNKS.c.data)
+        .where(CHUNKS.c.methodic_id.in_(methodic_ids))
+        .order_by(CHUNKS.c.methodic_id, CHUNKS.c.chunk_no)
+    ).all()
+
+    parts = {}
+    for methodic_id, data in rows:
+        parts.setdefault(methodic_id, []).append(decompress_chunk(data))
+    return {methodic_id: "".join(chunks) for methodic_id, chunks in parts.items()}
+
+
+def load_texts(connection, methodic_ids: list) -> dict:
+    """Полные тексты методичек независимо от способа хранения: {methodic_id: text или None}"""
+    if not methodic_ids:
+        return {}
+    texts = dict(connection.execute(
+        select(ENTRIES.c.id, ENTRIES.c.methodic_text).where(ENTRIES.c.id.in_(methodic_ids))
+    ).all())
+    chunked = load_chunked_texts(connection, [methodic_id for methodic_id, text in texts.items() if text is None])
+    texts.update(chunked)
+    return texts
+
+
+def load_text(connection, methodic_id: int):
+    return load_texts(connection, [methodic_id]).get(methodic_id)
+
+
+def extract_spans(connection, spans: list) -> dict:
+    """
+    Вырезает фрагменты текстов по смещениям в символах: spans — кортежи (key, methodic_id, start, end).
+    Распаковываются только части, пересекающиеся с фрагментами; несжатый текст режется substr в SQL.
+    Возвращает {key: fragment}.
+    """
+    if not spans:
+        return {}
+
+    conditions = [
+        and_(
+            CHUNKS.c.methodic_id == methodic_id,
+            CHUNKS.c.char_start < end,
+            CHUNKS.c.char_start + CHUNKS.c.char_length > start
+        )
+        for _, methodic_id, start, end in spans
+    ]
+    rows = connection.execute(
+        select(CHUNKS.c.methodic_id, CHUNKS.c.char_start, CHUNKS.c.data).where(or_(*conditions))
+    ).all()
+    chunks = {}
+    for methodic_id, char_start, data in rows:
+        chunks.setdefault(methodic_id, []).append((char_start, decompress_chunk(data)))
+
+    fragments = {}
+    inline = []
+    for key, methodic_id, start, end in spans:
+        if methodic_id not in chunks:
+            inline.append((key, methodic_id, start, end))
+            continue
+        fragments[key] = "".join(
+            text[max(start - char_start, 0):max(end - char_start, 0)]
+            for char_start, text in sorted(chunks[methodic_id])
+        )
+
+    if inline:
+        fragments.update(_extract_inline_spans(connection, inline))
+    return fragments
+
+
+def _extract_inline_spans(connection, spans: list) -> dict:
+    by_methodic = {}
+    for key, methodic_id, start, end in spans:
+        by_methodic.setdefault(methodic_id, []).append((key, start, end))
+
+    fragments = {}
+    for methodic_id, pieces in by_methodic.items():
+        columns = [
+            func.substr(ENTRIES.c.methodic_text, start + 1, end - start).label(f"s{i}")
+            for i, (_, start, end) in enumerate(pieces)
+        ]
+        row = connection.execute(select(*columns).where(ENTRIES.c.id == methodic_id)).first()
+        if row is None:
+            continue
+        for (key, _, _), fragment in zip(pieces, row):
+            fragments[key] = fragment or ""
+    return fragments
+
+
+def read_bytes(connection, methodic_id: int, start: int, length: int) -> bytes:
+    """Фрагмент текста [start, start + length) в байтах UTF-8"""
+    rows = connection.execute(
+        select(CHUNKS.c.byte_start, CHUNKS.c.data)
+        .where(
+            CHUNKS.c.methodic_id == methodic_id,
+            CHUNKS.c.byte_start < start + length,
+            CHUNKS.c.byte_start + CHUNKS.c.byte_length > start
+        )
+        .order_by(CHUNKS.c.chunk_no)
+    ).all()
+    if rows:
+        first_byte = rows[0][0]
+        raw = b"".join(zlib.decompress(data) for _, data in rows)
+        return raw[start - first_byte:start - first_byte + length]
+
+    chunk = connection.execute(
+        select(func.substr(cast(ENTRIES.c.methodic_text, LargeBinary), start + 1, length))
+        .where(ENTRIES.c.id == methodic_id)
+    ).scalar()
+    return bytes(chunk or b"")
+
+
+# ------------------ СИНХРОНИЗАЦИЯ С methodic_entries ------------------
+def current_text(connection, target):
+    """
+    Текст методички при сохранении через ORM: новое значение, если оно изменено,
+    иначе — из хранилища (у сжатых методичек атрибут после загрузки равен None).
+    """
+    if inspect(target).attrs.methodic_text.history.has_changes():
+        return target.methodic_text
+    return load_text(connection, target.id)
+
+
+@event.listens_for(MethodicEntry, "after_insert")
+def _on_methodic_insert(mapper, connection, target):
+    if settings.TEXT_COMPRESSION_ENABLED:
+        compress_texts(connection, [(target.id, target.methodic_text)])
+
+
+@event.listens_for(MethodicEntry, "after_update")
+def _on_methodic_update(mapper, connection, target):
+    if not inspect(target).attrs.methodic_text.history.has_changes():
+        return
+    connection.execute(delete(CHUNKS).where(CHUNKS.c.methodic_id == target.id))
+    if settings.TEXT_COMPRESSION_ENABLED:
+        compress_texts(connection, [(target.id, target.methodic_text)])
+
+
+@event.listens_for(MethodicEntry, "after_delete")
+def _on_methodic_delete(mapper, connection, target):
+    connection.execute(delete(CHUNKS).where(CHUNKS.c.methodic_id == target.id))
+
+
+def sync_text_storage(db) -> int:
+    """Удаляет части текстов методичек, удаленных в обход ORM. Возвращает число удаленных частей."""
+    result = db.connection().execute(
+        delete(CHUNKS).where(CHUNKS.c.methodic_id.not_in(select(ENTRIES.c.id)))
+    )
+    db.commit()
+    return result.rowcount
+
+
+# ------------------ МИГРАЦИЯ ------------------
+def storage_stats(connection) -> dict:
+    inline = connection.execute(
+        select(func.count(), func.coalesce(func.sum(func.length(cast(ENTRIES.c.methodic_text, LargeBinary))), 0))
+        .where(ENTRIES.c.methodic_text.is_not(None), func.length(ENTRIES.c.methodic_text) > 0)
+    ).one()
+    chunked = connection.execute(
+        select(
+            func.count(func.distinct(CHUNKS.c.methodic_id)),
+            func.count(),
+            func.coalesce(func.sum(CHUNKS.c.byte_length), 0),
+            func.coalesce(func.sum(func.length(CHUNKS.c.data)), 0)
+        )
+    ).one()
+    return {
+        'inline_methodics': inline[0],
+        'inline_bytes': inline[1],
+        'compressed_methodics': chunked[0],
+        'chunks': chunked[1],
+        'raw_bytes': chunked[2],
+        'compressed_bytes': chunked[3]
+    }
+
+
+def print_stats(connection):
+    stats = storage_stats(connection)
+    ratio = stats['raw_bytes'] / stats['compressed_bytes'] if stats['compressed_bytes'] else 0
+    print(f"Несжатых методичек: {stats['inline_methodics']} ({stats['inline_bytes'] / 1e6:.1f} МБ)")
+    print(
+        f"Сжатых методичек: {stats['compressed_methodics']} в {stats['chunks']} частях: "
+        f"{stats['raw_bytes'] / 1e6:.1f} МБ -> {stats['compressed_bytes'] / 1e6:.1f} МБ (x{ratio:.2f})"
+    )
+
+
+def database_file() -> str:
+    url = settings.DATABASE_URL
+    return url.split(":///", 1)[1] if url.startswith("sqlite:") and ":///" in url else None
+
+
+def migrate(direction: str, batch_size: int):
+    """Сжимает несжатые тексты (compress) или распаковывает сжатые (decompress) пачками по транзакции"""
+    from database import engine
+
+    started = time.perf_counter()
+    done = 0
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            if direction == 'compress':
+                rows = connection.execute(
+                    select(ENTRIES.c.id, ENTRIES.c.methodic_text)
+                    .where(ENTRIES.c.id > last_id, ENTRIES.c.methodic_text.is_not(None))
+                    .order_by(ENTRIES.c.id)
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                done += compress_texts(connection, rows)
+                last_id = rows[-1][0]
+            else:
+                methodic_ids = connection.execute(
+                    select(CHUNKS.c.methodic_id).distinct()
+                    .where(CHUNKS.c.methodic_id > last_id)
+                    .order_by(CHUNKS.c.methodic_id)
+                    .limit(batch_size)
+                ).scalars().all()
+                if not methodic_ids:
+                    break
+                done += decompress_texts(connection, methodic_ids)
+                last_id = methodic_ids[-1]
+        print(f"  {done} методичек за {time.perf_counter() - started:.1f} с")
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сжатие текстов методичек")
+    parser.add_argument("command", choices=("compress", "decompress", "stats"))
+    parser.add_argument("--batch-size", type=int, default=200, help="Методичек в одной транзакции")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM после миграции, чтобы уменьшить файл базы")
+    args = parser.parse_args(argv)
+
+    from database import engine, init_db
+    init_db()
+
+    path = database_file()
+    size_before = os.path.getsize(path) if path and os.path.exists(path) else None
+
+    if args.command != "stats":
+        done = migrate(args.command, args.batch_size)
+        print(f"Готово: {done} методичек")
+        if args.vacuum and engine.dialect.name == "sqlite":
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                connection.exec_driver_sql("VACUUM")
+
+    with engine.connect() as connection:
+        print_stats(connection)
+    if size_before is not None:
+        print(f"Файл базы: {size_before / 1e6:.1f} МБ -> {os.path.getsize(path) / 1e6:.1f} МБ")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())